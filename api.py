@@ -1,23 +1,44 @@
-from flask import Flask, jsonify, send_from_directory, request
-import sqlite3
+from flask import Flask, Response, jsonify, make_response, send_from_directory, request, stream_with_context
 from flask_cors import CORS
 import os
 import json
 import sys
+import urllib.parse
 
 # Add project root to Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from utils.integrated_input_classifier import classify_input_request
-from utils.database.anime_queries import create_anime_db
-from utils.llm_anime_selector import create_llm_selector
+from utils.integrated_input_classifier import classify_input_request, request_flight_stats
+from utils.services import services
+from utils.database.create_schema import parse_viewers_numeric
+from utils.database.connection import close_thread_connections, get_connection
+from utils.llm_cache import llm_cache
+from utils.semantic_cache import semantic_cache
+from utils.database.catalog_version import catalog_watcher, read_catalog_version
+from utils.image_thumbnails import build_srcset, ensure_thumbnail, snap_width
+from utils.http_cache import IMAGE_VERSION_LENGTH, IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL
+from utils.metrics import PROMETHEUS_CONTENT_TYPE, registry, request_trace, segmented_span, stage_span
 
 app = Flask(__name__)
 CORS(app)
 
+# 請求結束時關閉本執行緒的資料庫連線：Werkzeug 開發伺服器（app.run）每個請求一個新執行緒，
+# 連線不會被下一個請求重用，不關閉只會等執行緒結束才釋放；執行緒池（uvicorn / a2wsgi）下保持 False 以重用連線
+CLOSE_CONNECTIONS_ON_TEARDOWN = False
+
+@app.before_request
+def poll_catalog_version():
+    """每個請求讀取一次目錄版本（主鍵查詢），版本改變時通知訂閱者（例如背景重建索引）"""
+    catalog_watcher.poll(get_db_connection())
+
+@app.teardown_appcontext
+def close_request_connections(exception=None):
+    if CLOSE_CONNECTIONS_ON_TEARDOWN:
+        close_thread_connections()
+
 @app.route('/api/anime/like/<int:anime_id>', methods=['POST'])
 def update_like_status(anime_id):
+    conn = get_db_connection()
     try:
-        conn = get_db_connection()
         cursor = conn.cursor()
 
     # 從請求中獲取狀態（like 或 dislike）
@@ -46,57 +67,142 @@ def update_like_status(anime_id):
                 cursor.execute('UPDATE anime SET is_disliked = 1, like = 0 WHERE id = ?', (anime_id,))
                 print(f"Anime {anime_id} marked as disliked")
 
+        # 目錄版本由 anime 表的觸發器遞增，列表 API 的快取隨之失效
         conn.commit()
         return jsonify({"success": True, "message": f"Updated {action} status for anime {anime_id}"}), 200
 
     except Exception as e:
+        conn.rollback()
         print(f"Error updating like status: {str(e)}")
         return jsonify({"error": str(e)}), 500
-    finally:
-        conn.close()
+# LLM 回應快取統計（hits 即為省下的付費呼叫次數）
+@app.route('/api/llm-cache/stats', methods=['GET'])
+def get_llm_cache_stats():
+    return jsonify(llm_cache.stats())
+
+# 輸入分類語意快取統計
+@app.route('/api/semantic-cache/stats', methods=['GET'])
+def get_semantic_cache_stats():
+    return jsonify(semantic_cache.stats())
+
+# 請求合併統計（shared 為共用進行中計算、省下的重複請求數）
+@app.route('/api/single-flight/stats', methods=['GET'])
+def get_single_flight_stats():
+    stats = request_flight_stats()
+    stats.update(services.get_llm_selector().flight_stats())
+    return jsonify(stats)
+
 # 添加圖片路由
+# 使用絕對路徑指向 images 目錄
+IMAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'anime_data', 'images')
+IMAGE_BASE_URL = 'http://localhost:5000'
+
+def image_manifest():
+    """
+    封面圖片清單（匯入時建立的 anime_image 表，內容版本變更時重新載入）
+
+    每次呼叫會查詢一次內容版本；整理多筆結果時每個回應只呼叫一次，再傳給 cover_filename / build_cover_urls。
+    """
+    manifest = services.get_anime_db().image_manifest
+    manifest.refresh(get_db_connection())
+    return manifest
+
+def image_version(filename, manifest=None):
+    """封面網址使用的版本字串（清單中的內容雜湊前綴）；不在清單中時為空字串"""
+    digest = (manifest or image_manifest()).sha256(filename)
+    return digest[:IMAGE_VERSION_LENGTH] if digest else ''
+
+def cover_filename(anime_dict, manifest=None):
+    """動漫的封面檔名：image_path 的檔名在清單中就直接使用，否則依動漫 id 查清單（CSV 未提供或檔名不符的封面）"""
+    manifest = manifest or image_manifest()
+    image_path = anime_dict.get('image_path', '')
+    image_filename = os.path.basename(image_path) if image_path else ''
+    if image_filename and manifest.sha256(image_filename):
+        return image_filename
+    anime_id = anime_dict.get('id')
+    return (manifest.cover(anime_id) if isinstance(anime_id, int) else None) or image_filename
+
 @app.route('/images/<path:filename>')
 def serve_image(filename):
-    # 使用絕對路徑指向 images 目錄
-    image_path = os.path.join(os.path.dirname(__file__), 'anime_data', 'images')
+    image_path = IMAGES_DIR
     try:
-        return send_from_directory(image_path, filename)
+        # 強 ETag 為原圖內容雜湊（查清單，不探測檔案）；網址帶有相符的 ?v= 時內容不會再變，可標記為 immutable
+        # 不在清單中的檔案（尚未遷移的資料庫、新放入的圖片）直接由磁碟提供，ETag 由 Flask 依檔案產生
+        version = image_version(filename)
+        if version and request.args.get('v') == version:
+            cache_control = IMMUTABLE_CACHE_CONTROL
+        else:
+            cache_control = REVALIDATE_CACHE_CONTROL
+
+        # ?w=寬度：提供 WebP 縮圖（Pillow 未安裝或轉檔失敗時提供原圖）
+        width = request.args.get('w', type=int)
+        if width:
+            width = snap_width(width)
+            thumbnail = ensure_thumbnail(filename, width, image_path)
+            if thumbnail:
+                response = send_from_directory(os.path.dirname(thumbnail), os.path.basename(thumbnail),
+                                               mimetype='image/webp', etag=f"{version}-w{width}" if version else True)
+                response.headers['Cache-Control'] = cache_control
+                return response
+        # send_from_directory 會依 If-None-Match 自動返回 304
+        response = send_from_directory(image_path, filename, etag=version or True)
+        response.headers['Cache-Control'] = cache_control
+        return response
     except Exception as e:
         print(f"Error serving image {filename}: {str(e)}")
         return "Image not found", 404
 
+def build_cover_urls(image_filename, manifest=None):
+    """封面網址與縮圖 srcset（帶內容雜湊版本，瀏覽器可長期快取）"""
+    version = image_version(image_filename, manifest)
+    image_url = f'{IMAGE_BASE_URL}/images/{urllib.parse.quote(image_filename)}'
+    if version:
+        image_url += f'?v={version}'
+    return image_url, build_srcset(IMAGE_BASE_URL, image_filename, version)
+
+def catalog_etag():
+    """列表 API 的 ETag（目錄版本：匯入與喜歡 / 不喜歡寫入時遞增）"""
+    return f"catalog-{read_catalog_version(get_db_connection())}"
+
+def not_modified(etag):
+    """客戶端快取仍為最新時返回 304（不查詢資料表）"""
+    if etag not in request.if_none_match:
+        return None
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = REVALIDATE_CACHE_CONTROL
+    return response
+
+def with_etag(response, etag):
+    """加上 ETag 與需重新驗證的 Cache-Control"""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = REVALIDATE_CACHE_CONTROL
+    return response
+
+# 使用絕對路徑
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'anime_database.db')
+
 def get_db_connection():
-    # 使用絕對路徑
-    db_path = os.path.join(os.path.dirname(__file__), 'anime_database.db')
-    print(f"Trying to connect to database at: {db_path}")  # 診斷日誌
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def parse_viewers_count(viewers_str):
-    """解析觀眾數量字符串，轉換為數字"""
-    if not viewers_str:
-        return 100000  # 默認值
-    
-    viewers_str = str(viewers_str).strip().upper()
-    
-    try:
-        # 處理 K (千) 後綴
-        if viewers_str.endswith('K'):
-            number = float(viewers_str[:-1])
-            return int(number * 1000)
-        
-        # 處理 M (百萬) 後綴
-        elif viewers_str.endswith('M'):
-            number = float(viewers_str[:-1])
-            return int(number * 1000000)
-        
-        # 處理純數字
-        else:
-            return int(float(viewers_str))
-            
-    except (ValueError, TypeError):
-        return 100000  # 解析失敗時返回默認值
+    """取得目前執行緒的共用連線（sqlite3.Row；由 connection 模組管理，請勿 close）"""
+    return get_connection(DB_PATH)
+
+# 觀眾數量無法取得時的預設值
+DEFAULT_VIEWERS = 100000
+
+def get_viewers(anime_dict):
+    """取得觀眾數量（使用匯入時計算好的 viewers_numeric 欄位）"""
+    if 'viewers_numeric' in anime_dict:
+        viewers = anime_dict['viewers_numeric']
+    else:
+        # 外部 API 等非資料庫來源沒有 viewers_numeric，才需要解析字串
+        viewers = parse_viewers_numeric(anime_dict.get('viewers_count'))
+    return viewers if viewers is not None else DEFAULT_VIEWERS
+
+def build_retrieval_reason(anime_dict):
+    """本地檢索結果的推薦理由（依類型與相似度產生，不呼叫 LLM）"""
+    genres = anime_dict.get('anime_genres') or []
+    genre_text = f"「{'、'.join(genres[:3])}」類型，" if genres else ""
+    return f"{genre_text}簡介內容與你的描述相近（相似度 {anime_dict.get('similarity_score', 0):.2f}）"
 
 def process_external_api_response(api_response, count=5):
     """處理外部 API 的回應，轉換為前端需要的格式"""
@@ -125,10 +231,7 @@ def process_external_api_response(api_response, count=5):
                 anime_data = []
                 
                 # 從本地數據庫查找動漫
-                db_path = os.path.join(os.path.dirname(__file__), 'anime_database.db')
-                conn = sqlite3.connect(db_path)
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
+                cursor = get_db_connection().cursor()
                 
                 for reason_item in reason_data:
                     title = reason_item.get('title', '')
@@ -143,10 +246,10 @@ def process_external_api_response(api_response, count=5):
                         else:
                             print(f"未找到匹配動漫: {title}")
                 
-                conn.close()
                 print(f"從數據庫查找到 {len(anime_data)} 部動漫")
             
             result = []
+            manifest = image_manifest()
             for i, anime in enumerate(anime_data[:count]):
                 # 找到對應的推薦理由 - 根據 title 匹配
                 reason = "基於外部 AI 分析推薦"
@@ -178,18 +281,20 @@ def process_external_api_response(api_response, count=5):
                     platforms = ['未知平台']
                 
                 # 構建圖片URL
-                image_path = anime.get('image_path', '')
-                image_filename = os.path.basename(image_path) if image_path else ''
-                image_url = f'http://localhost:5000/images/{image_filename}' if image_filename else 'http://localhost:5000/images/default.jpg'
+                image_filename = cover_filename(anime, manifest)
+                if image_filename:
+                    image_url, cover_srcset = build_cover_urls(image_filename, manifest)
+                else:
+                    image_url, cover_srcset = 'http://localhost:5000/images/default.jpg', ''
                 
                 # 處理觀眾數量
-                viewers_count = anime.get('viewers_count', '100K')
-                viewers = parse_viewers_count(viewers_count)
+                viewers = get_viewers(anime)
                 
                 anime_result = {
                     'id': anime.get('id', f'external_{i+1}'),
                     'title': anime.get('title', f'外部推薦動漫 {i+1}'),
                     'cover': image_url,
+                    'coverSrcset': cover_srcset,
                     'season': anime.get('season', '2024-Winter'),
                     'rating': float(anime.get('rating', 8.0)),
                     'viewers': viewers,
@@ -219,8 +324,13 @@ def process_external_api_response(api_response, count=5):
 @app.route('/api/anime/<int:count>', methods=['GET'])
 def get_anime_list(count):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        # 目錄未變更時直接返回 304
+        etag = catalog_etag()
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+
+        cursor = get_db_connection().cursor()
         
         # 確認資料表存在
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='anime'")
@@ -228,15 +338,29 @@ def get_anime_list(count):
             print("Error: anime table does not exist")  # 診斷日誌
             return jsonify({"error": "Database table not found"}), 500
         
+        # 可選：?sort=popular 依觀眾數排序、?min_viewers=N 觀眾數門檻（皆走 idx_anime_viewers_numeric）
+        sort = request.args.get('sort', '')
+        min_viewers = request.args.get('min_viewers', type=int)
+        query = 'SELECT * FROM anime'
+        params = []
+        if min_viewers is not None:
+            query += ' WHERE viewers_numeric >= ?'
+            params.append(min_viewers)
+        if sort == 'popular':
+            query += ' ORDER BY viewers_numeric DESC'
+        query += ' LIMIT ?'
+        params.append(count)
+
         # 獲取指定數量的動漫
-        cursor.execute('SELECT * FROM anime LIMIT ?', (count,))
+        cursor.execute(query, params)
         animes = cursor.fetchall()
         
         # 診斷日誌
         print(f"Retrieved {len(animes)} anime records")
         
-        # 轉換為列表格式
+        # 轉換為列表格式（封面清單每個回應只取一次）
         result = []
+        manifest = image_manifest()
         for anime in animes:
             anime_dict = dict(anime)
             
@@ -254,10 +378,8 @@ def get_anime_list(count):
                 platforms = ['Crunchyroll', 'Netflix']  # 默認平台
             
             # 構建圖片URL
-            image_path = anime_dict.get('image_path', '')
-            # 從完整路徑中提取文件名
-            image_filename = os.path.basename(image_path) if image_path else ''
-            image_url = f'http://localhost:5000/images/{image_filename}' if image_filename else '預設圖片URL'
+            image_filename = cover_filename(anime_dict, manifest)
+            image_url, cover_srcset = build_cover_urls(image_filename, manifest) if image_filename else ('預設圖片URL', '')
             print(f"Generated image URL: {image_url}")  # 診斷日誌
 
             # 構建返回數據
@@ -265,9 +387,10 @@ def get_anime_list(count):
                 'id': anime_dict.get('id'),
                 'title': anime_dict.get('title', '未知標題'),
                 'cover': image_url,  # 使用構建的圖片URL
+                'coverSrcset': cover_srcset,  # 縮圖 srcset（卡片依顯示寬度選擇）
                 'season': anime_dict.get('season', '2024-1月'),
                 'rating': float(anime_dict.get('rating', 0)) if anime_dict.get('rating') else 0.0,
-                'viewers': parse_viewers_count(anime_dict.get('viewers_count')),
+                'viewers': get_viewers(anime_dict),
                 'genres': genres,
                 'description': anime_dict.get('synopsis', '暫無描述'),
                 'platforms': platforms,
@@ -278,19 +401,19 @@ def get_anime_list(count):
         # 診斷日誌
         print(f"Formatted {len(result)} anime records for response")
         
-        conn.close()
-        return jsonify(result)
+        return with_etag(jsonify(result), etag)
     except Exception as e:
         print(f"Error in get_anime_list: {str(e)}")  # 診斷日誌
         return jsonify({"error": str(e)}), 500
-    
-    conn.close()
-    return jsonify(result)
 @app.route('/api/anime/favorites', methods=['GET'])
 def get_favorite_anime():
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        etag = catalog_etag()
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+
+        cursor = get_db_connection().cursor()
 
 #獲取所有被標記為喜歡的動漫
         cursor.execute('SELECT * FROM anime WHERE like = 1')
@@ -306,16 +429,66 @@ def get_favorite_anime():
                     anime_dict[field] = json.loads(anime_dict[field])
             result.append(anime_dict)
 
-        return jsonify(result), 200
+        return with_etag(jsonify(result), etag), 200
 
     except Exception as e:
         print(f"Error fetching favorites: {str(e)}")
         return jsonify({"error": str(e)}), 500
-    finally:
-        conn.close()
+
+# 外部 API 無法使用時的錯誤回應
+EXTERNAL_API_UNAVAILABLE = {
+    "error": "外部推薦服務暫時無法使用，請稍後再試或嘗試其他描述方式",
+    "suggestions": [
+        "嘗試描述具體的動漫名稱",
+        "描述喜歡的動漫類型或風格",
+        "檢查網路連接後重新嘗試"
+    ]
+}
+
+def format_anime_result(anime_dict, reason=None, manifest=None):
+    """將資料庫的動漫資料整理為前端需要的格式（整理多筆時請傳入同一個封面清單 manifest）"""
+    # 處理 genres_json（可能是 JSON 字串或逗號分隔的字串）
+    try:
+        genres = json.loads(anime_dict.get('genres_json', '[]'))
+    except:
+        genres = anime_dict.get('genres_json', '').split(',') if anime_dict.get('genres_json') else []
+    
+    # 處理 platforms_json
+    try:
+        platforms = json.loads(anime_dict.get('platforms_json', '[]'))
+    except:
+        platforms = ['Crunchyroll', 'Netflix']  # 默認平台
+    
+    # 構建圖片URL（封面檔名查清單）
+    manifest = manifest or image_manifest()
+    image_filename = cover_filename(anime_dict, manifest)
+    image_url, cover_srcset = build_cover_urls(image_filename, manifest) if image_filename else ('預設圖片URL', '')
+
+    result = {
+        'id': anime_dict.get('id'),
+        'title': anime_dict.get('title', '未知標題'),
+        'cover': image_url,
+        'coverSrcset': cover_srcset,
+        'season': anime_dict.get('season', '2024-1月'),
+        'rating': float(anime_dict.get('rating', 0)) if anime_dict.get('rating') else 0.0,
+        'viewers': get_viewers(anime_dict),
+        'genres': genres,
+        'description': anime_dict.get('synopsis', '暫無描述'),
+        'platforms': platforms,
+    }
+    if reason is not None:
+        result['reason'] = reason
+    return result
 
 @app.route('/api/anime/recommend', methods=['POST'])
 def get_anime_recommendations():
+    """推薦 API：各階段耗時以 Server-Timing 標頭回傳，並記錄到 /metrics"""
+    with request_trace('recommend') as trace:
+        response = make_response(recommend_anime())
+    response.headers['Server-Timing'] = trace.server_timing()
+    return response
+
+def recommend_anime():
     # try:
     print("\n=== New Recommendation Request ===")
     data = request.get_json()
@@ -334,32 +507,33 @@ def get_anime_recommendations():
         # 類型1：動漫名稱推薦
         print(f"Classified as Type 1 (Anime Name)")
         candidate_anime = classification_result[1]  # 已經是查詢出來的前10部動漫
-        llm_selector = create_llm_selector()
-        selected_anime, llm_reasons = llm_selector.select_anime(description, candidate_anime, count)
+        llm_selector = services.get_llm_selector()
+        with stage_span('llm_select'):
+            selected_anime, llm_reasons = llm_selector.select_anime(description, candidate_anime, count)
     elif classification_result[0] == 2 or use_favorites:
         # 類型2：標籤推薦
         print(f"Classified as Type 2 (Tags)")
         candidate_anime = classification_result[1]  # 已經是查詢出來的前10部動漫
-        llm_selector = create_llm_selector()
-        selected_anime, llm_reasons = llm_selector.select_anime(description, candidate_anime, count)
+        llm_selector = services.get_llm_selector()
+        with stage_span('llm_select'):
+            selected_anime, llm_reasons = llm_selector.select_anime(description, candidate_anime, count)
     elif classification_result[0] == 3:
         # 類型3：外部 API 推薦
         print(f"Classified as Type 3 (External API)")
-        external_api_response = classification_result[1]  # 外部 API 的回應
+        external_api_response = classification_result[1]  # 本地檢索結果或外部 API 的回應
         
+        if isinstance(external_api_response, list):
+            # 本地向量索引已找到候選：依相似度直接取前 count 部，不需再呼叫 LLM
+            print(f"Local retrieval returned {len(external_api_response)} candidates")
+            selected_anime = external_api_response[:count]
+            llm_reasons = [build_retrieval_reason(anime) for anime in selected_anime]
         # 檢查外部 API 是否成功返回結果
-        if external_api_response is None:
+        elif external_api_response is None:
             print("外部 API 連接失敗，返回錯誤信息")
-            return jsonify({
-                "error": "外部推薦服務暫時無法使用，請稍後再試或嘗試其他描述方式",
-                "suggestions": [
-                    "嘗試描述具體的動漫名稱",
-                    "描述喜歡的動漫類型或風格",
-                    "檢查網路連接後重新嘗試"
-                ]
-            }), 503
+            return jsonify(EXTERNAL_API_UNAVAILABLE), 503
         else:
-            result = process_external_api_response(external_api_response, count)
+            with stage_span('format'):
+                result = process_external_api_response(external_api_response, count)
             print(f"即將返回 {len(result)} 部推薦動漫給前端")
             return jsonify(result)
     else:
@@ -370,49 +544,18 @@ def get_anime_recommendations():
     print(f"LLM reasons count: {len(llm_reasons)}")
 
     #整理回傳內容
-    result = []
-    for i, anime_dict in enumerate(selected_anime):
-        # 處理 genres_json（可能是 JSON 字串或逗號分隔的字串）
-        try:
-            import json
-            genres = json.loads(anime_dict.get('genres_json', '[]'))
-        except:
-            genres = anime_dict.get('genres_json', '').split(',') if anime_dict.get('genres_json') else []
-        
-        # 處理 platforms_json
-        try:
-            platforms = json.loads(anime_dict.get('platforms_json', '[]'))
-        except:
-            platforms = ['Crunchyroll', 'Netflix']  # 默認平台
-        
-        # 構建圖片URL
-        image_path = anime_dict.get('image_path', '')
-        # 從完整路徑中提取文件名
-        image_filename = os.path.basename(image_path) if image_path else ''
-        image_url = f'http://localhost:5000/images/{image_filename}' if image_filename else '預設圖片URL'
-        print(f"Generated image URL: {image_url}")  # 診斷日誌
-
-        # 使用 LLM 生成的理由，如果沒有則使用默認理由
-        if i < len(llm_reasons) and llm_reasons[i]:
-            reason = llm_reasons[i]
-            print(f"使用 LLM 理由 [{i}]: {reason}")
-        else:
-            reason = "基於你的偏好推薦"
-            print(f"使用預設理由 [{i}]: {reason}")
-
-        # 整理回傳內容
-        result.append({
-            'id': anime_dict.get('id'),
-            'title': anime_dict.get('title', '未知標題'),
-            'cover': image_url,
-            'season': anime_dict.get('season', '2024-1月'),
-            'rating': float(anime_dict.get('rating', 0)) if anime_dict.get('rating') else 0.0,
-            'viewers': parse_viewers_count(anime_dict.get('viewers_count')),
-            'genres': genres,
-            'description': anime_dict.get('synopsis', '暫無描述'),
-            'platforms': platforms,
-            'reason': reason
-        })
+    with stage_span('format'):
+        result = []
+        manifest = image_manifest()
+        for i, anime_dict in enumerate(selected_anime):
+            # 使用 LLM 生成的理由，如果沒有則使用默認理由
+            if i < len(llm_reasons) and llm_reasons[i]:
+                reason = llm_reasons[i]
+                print(f"使用 LLM 理由 [{i}]: {reason}")
+            else:
+                reason = "基於你的偏好推薦"
+                print(f"使用預設理由 [{i}]: {reason}")
+            result.append(format_anime_result(anime_dict, reason, manifest))
         return jsonify(result)
         #sample return
         # result.append({
@@ -433,8 +576,100 @@ def get_anime_recommendations():
     #     print(f"Error getting anime recommendations: {str(e)}")
     #     return jsonify({"error": str(e)}), 500
 
-    
+
+def sse_event(event, data):
+    """組成一筆 Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/api/anime/recommend/stream', methods=['POST'])
+def stream_anime_recommendations():
+    """
+    串流版的推薦 API（Server-Sent Events）
+
+    事件順序：
+    - candidates：分類與資料庫查詢完成後立即送出候選列表（不含推薦理由）
+    - item：LLM 每完成一行「編號:理由」就送出一部動漫（含 rank 與 reason）
+    - done：全部送出完畢
+    - error：無法推薦時送出錯誤訊息（與非串流 API 的錯誤內容相同）
+    """
+    print("\n=== New Streaming Recommendation Request ===")
+    data = request.get_json()
+    count = data.get('count', 5)
+    season = data.get('season', '')
+    description = data.get('description', '')
+    use_favorites = data.get('useFavorites', False)
+
+    def generate():
+        # 串流回應的標頭已先送出，各階段耗時只記錄到 /metrics
+        with request_trace('recommend_stream'):
+            yield from generate_events()
+
+    def generate_events():
+        # 封面清單每個回應只取一次
+        manifest = image_manifest()
+        classification_result = classify_input_request(description, season=season, count=count, use_favorites=use_favorites)
+        request_type, payload = classification_result[0], classification_result[1]
+
+        if request_type == 3 and not use_favorites:
+            if isinstance(payload, list):
+                # 本地向量索引的候選：依相似度直接送出
+                selected = [(anime, build_retrieval_reason(anime)) for anime in payload[:count]]
+            elif payload is None:
+                yield sse_event('error', EXTERNAL_API_UNAVAILABLE)
+                return
+            else:
+                # 外部 API 的結果已包含推薦理由，整批送出
+                with stage_span('format'):
+                    result = process_external_api_response(payload, count)
+                yield sse_event('candidates', {'type': 3, 'candidates': [
+                    {key: value for key, value in anime.items() if key != 'reason'} for anime in result]})
+                for rank, anime in enumerate(result):
+                    yield sse_event('item', {'rank': rank, 'anime': anime})
+                yield sse_event('done', {'count': len(result)})
+                return
+            yield sse_event('candidates', {'type': 3, 'candidates': [format_anime_result(a, manifest=manifest)
+                                                                    for a, _ in selected]})
+        elif request_type in (1, 2) or use_favorites:
+            candidate_anime = payload if isinstance(payload, list) else []
+            yield sse_event('candidates', {'type': request_type,
+                                           'candidates': [format_anime_result(a, manifest=manifest)
+                                                          for a in candidate_anime]})
+            llm_selector = services.get_llm_selector()
+            selected = llm_selector.stream_select_anime(description, candidate_anime, count)
+        else:
+            yield sse_event('error', {"error": "暫不支援此類型的推薦"})
+            return
+
+        # LLM 逐行產生結果，選擇與整理交錯進行：只計時取得下一筆（llm_select）與整理（format），
+        # 不含 yield 等待客戶端讀取的時間
+        sent = 0
+        selected = iter(selected)
+        with segmented_span('llm_select') as select_span, segmented_span('format') as format_span:
+            while True:
+                with select_span.segment():
+                    item = next(selected, None)
+                if item is None:
+                    break
+                anime_dict, reason = item
+                with format_span.segment():
+                    anime = format_anime_result(anime_dict, reason, manifest)
+                yield sse_event('item', {'rank': sent, 'anime': anime})
+                sent += 1
+        yield sse_event('done', {'count': sent})
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/metrics')
+def metrics():
+    """各階段耗時、token 數與快取命中（Prometheus text format）"""
+    return Response(registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
 if __name__ == '__main__':
+    # 啟動時建立共用的 AnimeDatabase / LLM 選擇器並預載索引，之後每個請求重複使用
+    # （只在啟動服務時執行；匯入 api 模組本身不會連線資料庫建立索引）
+    services.warm_up()
+    CLOSE_CONNECTIONS_ON_TEARDOWN = True
     app.run(port=5000, debug=True)
 
     
\ No newline at end of file
@@ -0,0 +1,211 @@
+"""
+ASGI 服務入口（非同步推薦 API）
+
+推薦 API 的大部分時間都在等待 LLM 回應；Flask 版本每個請求會佔用一個執行緒數秒。
+此入口以 Starlette 提供非同步的推薦路由：
+- 結構化分類與 LLM 選擇使用 AsyncOpenAI，等待時不佔用執行緒
+- 多步驟備援分類（含 Lemonade 類型判斷）沿用同步實作，在執行緒中執行
+- 資料庫查詢、外部 API 呼叫與結果整理（封面清單查詢）以 asyncio.to_thread 在執行緒池中執行，不阻塞事件迴圈
+- 其他路由（圖片、喜歡 / 不喜歡、列表、/metrics…）直接掛載原本的 Flask app
+- 推薦路由處理前同樣讀取目錄版本（CatalogPollMiddleware），目錄變更後兩種服務方式都會在背景重建索引
+- 各階段耗時與 Flask 版本記錄到同一個指標登錄（asyncio.to_thread 會複製 context，執行緒中的階段也歸入同一請求）
+
+啟動方式：
+uvicorn asgi_app:app --port 5000
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+from a2wsgi import WSGIMiddleware
+
+from api import (
+    EXTERNAL_API_UNAVAILABLE,
+    app as flask_app,
+    build_retrieval_reason,
+    format_anime_result,
+    image_manifest,
+    poll_catalog_version,
+    process_external_api_response,
+    sse_event,
+)
+from utils.integrated_input_classifier import aclassify_input_request
+from utils.metrics import request_trace, segmented_span, stage_span
+from utils.services import services
+
+
+class CatalogPollMiddleware:
+    """
+    非同步推薦路由在處理前讀取一次目錄版本（同 Flask 的 before_request），版本改變時通知訂閱者背景重建索引
+
+    只掛在本檔的路由上：掛載的 Flask app 已在 before_request 中讀取，不重複查詢。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            await asyncio.to_thread(poll_catalog_version)
+        await self.app(scope, receive, send)
+
+
+async def read_recommend_request(request: Request):
+    """讀取推薦請求參數（與 Flask 版本相同）"""
+    data = await request.json()
+    return (
+        data.get('count', 5),
+        data.get('season', ''),
+        data.get('description', ''),
+        data.get('useFavorites', False),
+    )
+
+
+def format_results(selected_anime, reasons=None, manifest=None):
+    """整理回傳的動漫列表（會查詢封面清單，需在執行緒中執行；清單只取一次）"""
+    manifest = manifest or image_manifest()
+    if reasons is None:
+        return [format_anime_result(anime, manifest=manifest) for anime in selected_anime]
+    return [format_anime_result(anime, reason, manifest) for anime, reason in zip(selected_anime, reasons)]
+
+
+async def recommend(request: Request):
+    """非同步版的 /api/anime/recommend（回應格式與 Flask 版本相同，含 Server-Timing 標頭）"""
+    with request_trace('recommend') as trace:
+        response = await recommend_response(request)
+    response.headers['Server-Timing'] = trace.server_timing()
+    return response
+
+
+async def recommend_response(request: Request):
+    count, season, description, use_favorites = await read_recommend_request(request)
+    print(f"\n=== New Async Recommendation Request === {description!r}")
+
+    request_type, payload = await aclassify_input_request(
+        description, season=season, count=count, use_favorites=use_favorites)
+
+    if request_type in (1, 2) or use_favorites:
+        llm_selector = services.get_llm_selector()
+        with stage_span('llm_select'):
+            selected_anime, llm_reasons = await llm_selector.aselect_anime(description, payload or [], count)
+    elif request_type == 3:
+        if isinstance(payload, list):
+            # 本地向量索引已找到候選：依相似度直接取前 count 部
+            selected_anime = payload[:count]
+            llm_reasons = [build_retrieval_reason(anime) for anime in selected_anime]
+        elif payload is None:
+            return JSONResponse(EXTERNAL_API_UNAVAILABLE, status_code=503)
+        else:
+            with stage_span('format'):
+                result = await asyncio.to_thread(process_external_api_response, payload, count)
+            return JSONResponse(result)
+    else:
+        return JSONResponse({"error": "暫不支援此類型的推薦"}, status_code=400)
+
+    reasons = [llm_reasons[i] if i < len(llm_reasons) and llm_reasons[i] else "基於你的偏好推薦"
+               for i in range(len(selected_anime))]
+    with stage_span('format'):
+        result = await asyncio.to_thread(format_results, selected_anime, reasons)
+    return JSONResponse(result)
+
+
+async def recommend_stream(request: Request):
+    """非同步版的 /api/anime/recommend/stream（事件格式與 Flask 版本相同）"""
+    count, season, description, use_favorites = await read_recommend_request(request)
+    print(f"\n=== New Async Streaming Recommendation Request === {description!r}")
+
+    async def generate():
+        # 串流回應的標頭已先送出，各階段耗時只記錄到 /metrics
+        with request_trace('recommend_stream'):
+            async for event in generate_events():
+                yield event
+
+    async def generate_events():
+        request_type, payload = await aclassify_input_request(
+            description, season=season, count=count, use_favorites=use_favorites)
+
+        if request_type == 3 and not use_favorites:
+            if payload is None:
+                yield sse_event('error', EXTERNAL_API_UNAVAILABLE)
+                return
+            if not isinstance(payload, list):
+                # 外部 API 的結果已包含推薦理由，整批送出
+                with stage_span('format'):
+                    result = await asyncio.to_thread(process_external_api_response, payload, count)
+                yield sse_event('candidates', {'type': 3, 'candidates': [
+                    {key: value for key, value in anime.items() if key != 'reason'} for anime in result]})
+                for rank, anime in enumerate(result):
+                    yield sse_event('item', {'rank': rank, 'anime': anime})
+                yield sse_event('done', {'count': len(result)})
+                return
+            selected = payload[:count]
+            yield sse_event('candidates', {'type': 3, 'candidates': await asyncio.to_thread(format_results, selected)})
+            results = await asyncio.to_thread(
+                format_results, selected, [build_retrieval_reason(anime) for anime in selected])
+            for rank, anime in enumerate(results):
+                yield sse_event('item', {'rank': rank, 'anime': anime})
+            yield sse_event('done', {'count': len(selected)})
+            return
+
+        if request_type not in (1, 2) and not use_favorites:
+            yield sse_event('error', {"error": "暫不支援此類型的推薦"})
+            return
+
+        candidate_anime = payload if isinstance(payload, list) else []
+        # 封面清單每個回應只取一次，逐筆送出時沿用
+        manifest = await asyncio.to_thread(image_manifest)
+        yield sse_event('candidates', {'type': request_type, 'candidates': await asyncio.to_thread(
+            format_results, candidate_anime, None, manifest)})
+        llm_selector = services.get_llm_selector()
+        # LLM 逐行產生結果，選擇與整理交錯進行：只計時取得下一筆（llm_select）與整理（format），
+        # 不含 yield 等待客戶端讀取的時間
+        sent = 0
+        selected = llm_selector.astream_select_anime(description, candidate_anime, count).__aiter__()
+        with segmented_span('llm_select') as select_span, segmented_span('format') as format_span:
+            while True:
+                with select_span.segment():
+                    try:
+                        anime_dict, reason = await selected.__anext__()
+                    except StopAsyncIteration:
+                        break
+                with format_span.segment():
+                    anime = await asyncio.to_thread(format_anime_result, anime_dict, reason, manifest)
+                yield sse_event('item', {'rank': sent, 'anime': anime})
+                sent += 1
+        yield sse_event('done', {'count': sent})
+
+    return StreamingResponse(generate(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """服務啟動時建立共用服務並預載索引（在執行緒中執行，不阻塞事件迴圈）"""
+    await asyncio.to_thread(services.warm_up)
+    yield
+
+
+app = Starlette(
+    lifespan=lifespan,
+    routes=[
+        Route('/api/anime/recommend', recommend, methods=['POST'],
+              middleware=[Middleware(CatalogPollMiddleware)]),
+        Route('/api/anime/recommend/stream', recommend_stream, methods=['POST'],
+              middleware=[Middleware(CatalogPollMiddleware)]),
+        # 其餘路由沿用 Flask app（在執行緒中執行）
+        Mount('/', app=WSGIMiddleware(flask_app)),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, port=5000)
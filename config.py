@@ -10,3 +10,39 @@ LEMONADE_API_KEY = os.getenv('LEMONADE_API_KEY', 'lemonade')
 
 # 預設模型
 DEFAULT_MODEL = os.getenv('DEFAULT_MODEL', 'Qwen-2.5-7B-Instruct-NPU')
+
+# 輸入分類推測模式：同時送出類型判斷 / 名稱提取 / 類別分類，只保留符合類型的結果
+SPECULATIVE_CLASSIFICATION = os.getenv('SPECULATIVE_CLASSIFICATION', 'true').lower() in ('1', 'true', 'yes')
+
+# 服務預期同時處理的推薦請求數（推測模式的 LLM 呼叫名額依此計算）
+SERVER_CONCURRENCY = int(os.getenv('SERVER_CONCURRENCY', '16'))
+# 推測模式同時進行（仍需要）的 LLM 呼叫上限；0 代表 SERVER_CONCURRENCY × 3（每個請求最多 3 個分支）
+CLASSIFICATION_WORKERS = int(os.getenv('CLASSIFICATION_WORKERS', '0'))
+
+# 結構化輸出分類：單次請求同時取得類型 / 動漫名稱 / 類別，解析失敗時才改用多步驟分類
+STRUCTURED_CLASSIFICATION = os.getenv('STRUCTURED_CLASSIFICATION', 'true').lower() in ('1', 'true', 'yes')
+
+# LLM 回應快取（以 模型 + 訊息 + 溫度 為鍵，保存在 SQLite）
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'llm_cache.db'))
+# 存活時間（秒），預設 7 天；0 代表不過期
+LLM_CACHE_TTL = float(os.getenv('LLM_CACHE_TTL', str(7 * 24 * 3600)))
+# 最多保存的回應筆數（超過時淘汰最久未使用者）
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '5000'))
+
+# 輸入分類語意快取（相似描述直接重用分類結果）
+SEMANTIC_CACHE_ENABLED = os.getenv('SEMANTIC_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# cosine 相似度門檻（字元 n-gram 只換一個類別詞時仍有 0.82~0.87，命中後另外檢查名稱 / 類別是否出現在新輸入中）
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.85'))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', '512'))
+# 存活時間（秒），預設 1 天；0 代表不過期
+SEMANTIC_CACHE_TTL = float(os.getenv('SEMANTIC_CACHE_TTL', str(24 * 3600)))
+
+# 類型3（自由描述）請求中與動漫相關的描述先以本地向量索引檢索，沒有結果時才呼叫外部 API
+LOCAL_RETRIEVAL_ENABLED = os.getenv('LOCAL_RETRIEVAL_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+# 請求合併：相同的分類 / LLM 選擇請求同時進行時只執行一次，其餘請求共用結果
+SINGLE_FLIGHT_ENABLED = os.getenv('SINGLE_FLIGHT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+# 推薦請求各階段耗時 / token / 快取命中統計（/metrics 以 Prometheus 格式輸出）
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
@@ -251,7 +251,8 @@ function App() {
       };
       console.log('發送請求數據:', requestData);
       
-      const response = await fetch(`http://localhost:5000/api/anime/recommend`, {
+      // 使用串流 API：候選列表與每部推薦（含理由）完成後就立即送達
+      const response = await fetch(`http://localhost:5000/api/anime/recommend/stream`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -264,24 +265,63 @@ function App() {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
       
-      const data = await response.json();
-      console.log('從API獲取的原始數據:', data);
-      
-      if (!Array.isArray(data)) {
-        throw new Error('API返回的數據格式不正確');
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder('utf-8');
+      const received = [];
+      let buffer = '';
+      let streamError = null;
+
+      // 解析一筆 Server-Sent Event（event: 名稱 / data: JSON）
+      const handleEvent = (rawEvent) => {
+        let eventName = 'message';
+        let dataText = '';
+        rawEvent.split('\n').forEach(line => {
+          if (line.startsWith('event:')) {
+            eventName = line.slice(6).trim();
+          } else if (line.startsWith('data:')) {
+            dataText += line.slice(5).trim();
+          }
+        });
+        if (!dataText) return;
+        const payload = JSON.parse(dataText);
+
+        if (eventName === 'candidates') {
+          console.log('候選動漫:', payload.candidates);
+        } else if (eventName === 'item') {
+          // 過濾掉不喜歡的動漫
+          if (dislikes.includes(payload.anime.id)) return;
+          received.push(payload.anime);
+          setCurrentRecommendations([...received]);
+          // 第一部推薦到達就切換到推薦頁，其餘陸續加入
+          if (received.length === 1) {
+            setCurrentCardIndex(0);
+            setCurrentView('recommendations');
+          }
+        } else if (eventName === 'error') {
+          streamError = payload.error;
+        }
+      };
+
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        events.forEach(handleEvent);
+      }
+      if (buffer.trim()) {
+        handleEvent(buffer);
+      }
+      console.log('串流接收完成的動漫數據:', received);
+
+      if (streamError) {
+        throw new Error(streamError);
       }
       
-      if (data.length === 0) {
+      if (received.length === 0) {
         throw new Error('API返回的數據為空');
       }
-      
-      // 過濾掉不喜歡的動漫
-      const filteredAnime = data.filter(anime => !dislikes.includes(anime.id));
-      console.log('過濾後的動漫數據:', filteredAnime);
-      
-      setCurrentRecommendations(filteredAnime);
-      setCurrentCardIndex(0);
-      setCurrentView('recommendations');
     } catch (error) {
       console.error('獲取動漫數據時出錯:', error);
       alert(`API請求失敗: ${error.message}`);
@@ -561,6 +601,8 @@ function App() {
                     <div className="card-cover">
                       <img
                         src={anime.cover}
+                        srcSet={anime.coverSrcset || undefined}
+                        sizes="(max-width: 768px) 100vw, 360px"
                         alt={anime.title}
                         className="cover-image"
                       />
@@ -714,7 +756,7 @@ function App() {
                 <div key={anime.id} className="favorite-card">
                   <div className="favorite-cover">
                     <img
-                      src={`http://localhost:5000/images/${encodeURIComponent(anime.image_path.split('/').pop())}`}
+                      src={`http://localhost:5000/images/${encodeURIComponent(anime.image_path.split('/').pop())}?w=480`}
                       alt={anime.title}
                       className="favorite-image"
                       onError={(e) => {
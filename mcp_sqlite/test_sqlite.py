@@ -110,7 +110,7 @@ class AnimeSQLiteClient:
         Returns:
             動漫作品列表
         """
-        # 使用 JSON 查詢來查找包含特定類型的作品
+        # 透過正規化的 genre / anime_genre 關聯表查找（只在小型 genre 表上做 LIKE，再走索引）
         sql_query = f"""
         SELECT
             id,
@@ -122,18 +122,13 @@ class AnimeSQLiteClient:
             platforms_json,
             synopsis
         FROM anime
-        WHERE
-            -- 方法1: 直接字串匹配（適用於大部分情況）
-            (genres_json LIKE '%{genre}%'
-            OR genres_json LIKE '%{genre.lower()}%'
-            OR genres_json LIKE '%{genre.upper()}%'
-            OR genres_json LIKE '%{genre.capitalize()}%')
-            -- 方法2: 如果 SQLite 版本支援 JSON 函數，可以使用更精確的匹配
-            OR EXISTS (
-                SELECT 1 FROM json_each(genres_json)
-                WHERE json_each.value LIKE '%{genre}%'
-            )
-        ORDER BY rating DESC, viewers_count DESC
+        WHERE id IN (
+            SELECT ag.anime_id
+            FROM genre g
+            JOIN anime_genre ag ON ag.genre_id = g.id
+            WHERE g.name_lower LIKE '%{genre.lower()}%'
+        )
+        ORDER BY rating DESC, viewers_numeric DESC
         LIMIT {limit};
         """
 
@@ -150,14 +145,14 @@ class AnimeSQLiteClient:
         Returns:
             動漫作品列表
         """
-        # 建構多個類型的 AND 查詢
+        # 建構多個類型的 AND 查詢（每個類型一個關聯表子查詢）
         genre_conditions = []
         for genre in genres:
-            condition = f"""(
-                genres_json LIKE '%{genre}%'
-                OR genres_json LIKE '%{genre.lower()}%'
-                OR genres_json LIKE '%{genre.upper()}%'
-                OR genres_json LIKE '%{genre.capitalize()}%'
+            condition = f"""id IN (
+                SELECT ag.anime_id
+                FROM genre g
+                JOIN anime_genre ag ON ag.genre_id = g.id
+                WHERE g.name_lower LIKE '%{genre.lower()}%'
             )"""
             genre_conditions.append(condition)
 
@@ -175,7 +170,7 @@ class AnimeSQLiteClient:
             synopsis
         FROM anime
         WHERE {where_clause}
-        ORDER BY rating DESC, viewers_count DESC
+        ORDER BY rating DESC, viewers_numeric DESC
         LIMIT {limit};
         """
 
@@ -189,26 +184,13 @@ class AnimeSQLiteClient:
             類型列表
         """
         sql_query = """
-        SELECT DISTINCT genres_json
-        FROM anime
-        WHERE genres_json IS NOT NULL
-        AND genres_json != '';
+        SELECT name
+        FROM genre
+        ORDER BY name;
         """
 
         results = await self.connect_and_query(sql_query)
-        all_genres = set()
-
-        for result in results:
-            if 'genres_json' in result:
-                try:
-                    genres = json.loads(result['genres_json'])
-                    if isinstance(genres, list):
-                        all_genres.update(genres)
-                except (json.JSONDecodeError, TypeError):
-                    # 如果不是 JSON 格式，跳過
-                    continue
-
-        return sorted(list(all_genres))
+        return [result['name'] for result in results if result.get('name')]
 
     async def get_database_stats(self) -> Dict[str, Any]:
         """
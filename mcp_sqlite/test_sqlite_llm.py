@@ -142,9 +142,10 @@ class LLMDrivenSQLiteClient:
 
 ## 重要說明
 1. anime 表中的 genres_json 欄位存儲 JSON 格式的類型數組，例如: ["動作", "冒險", "奇幻"]
-2. 當搜索類型時，使用 LIKE 操作符或 JSON 函數
+2. 當搜索類型時，優先使用正規化關聯表：genre(id, name, name_lower) 與 anime_genre(anime_id, genre_id)，
+   例如 WHERE id IN (SELECT ag.anime_id FROM anime_genre ag JOIN genre g ON g.id = ag.genre_id WHERE g.name = '奇幻')
 3. rating 是數值類型，可以用於排序和比較
-4. viewers_count 是文本類型（如 "520K", "1.2M"）
+4. viewers_count 是文本類型（如 "520K", "1.2M"），排序或比較觀看數請使用整數欄位 viewers_numeric
 5. 只生成 SELECT 查詢語句，不要包含 INSERT/UPDATE/DELETE
 6. 請確保 SQL 語法正確且安全
 
@@ -153,7 +154,7 @@ class LLMDrivenSQLiteClient:
 
 例如：
 用戶: "找出評分最高的5部奇幻動漫"
-你的回應: SELECT title, rating, genres_json FROM anime WHERE genres_json LIKE '%奇幻%' ORDER BY rating DESC LIMIT 5;
+你的回應: SELECT title, rating, genres_json FROM anime WHERE id IN (SELECT ag.anime_id FROM anime_genre ag JOIN genre g ON g.id = ag.genre_id WHERE g.name = '奇幻') ORDER BY rating DESC LIMIT 5;
 """
 
     async def natural_language_query(self, user_query: str) -> List[Dict[str, Any]]:
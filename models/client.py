@@ -4,6 +4,8 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config import LEMONADE_BASE_URL, LEMONADE_API_KEY, DEFAULT_MODEL
 from openai import OpenAI
+from utils.llm_cache import llm_cache
+from utils.metrics import record_usage
 
 class LemonadeClient:
     def __init__(self, model=None, base_url=None, api_key=None):
@@ -13,36 +15,46 @@ class LemonadeClient:
             api_key=api_key or LEMONADE_API_KEY
         )
 
-    def chat(self, messages, model=None):
+    def chat(self, messages, model=None, use_cache=False):
         """
         發送聊天請求
 
         Args:
             messages: 訊息列表 [{"role": "user", "content": "你好！"}]
             model: 可選的模型名稱，預設使用初始化時的模型
+            use_cache: 是否使用 LLM 回應快取（相同模型與訊息直接返回先前的回應）；
+                預設關閉，對話類呼叫重複的提示也應取得新的回應，只有分類等確定性的呼叫才開啟
 
         Returns:
             str: 模型回應內容
         """
-        response = self.client.chat.completions.create(
-            model=model or self.model,
-            messages=messages
-        )
-        return response.choices[0].message.content
+        model = model or self.model
+
+        def create():
+            response = self.client.chat.completions.create(
+                model=model,
+                messages=messages
+            )
+            return record_usage(response).choices[0].message.content
+
+        if not use_cache:
+            return create()
+        return llm_cache.cached_completion(model, messages, None, create)
 
-    def simple_chat(self, message, model=None):
+    def simple_chat(self, message, model=None, use_cache=False):
         """
         簡單聊天，只需傳入使用者訊息
 
         Args:
             message: 使用者訊息字串
             model: 可選的模型名稱
+            use_cache: 是否使用 LLM 回應快取（同 chat）
 
         Returns:
             str: 模型回應內容
         """
         messages = [{"role": "user", "content": message}]
-        return self.chat(messages, model)
+        return self.chat(messages, model, use_cache)
 
     def get_available_models(self):
         """
@@ -0,0 +1,63 @@
+import os
+import sys
+
+# 測試從專案根目錄匯入模組（api、utils、models…）
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# 分類器在匯入時檢查金鑰；測試不會送出任何 OpenAI 請求
+os.environ.setdefault('OPENAI_API_KEY', 'test')
+# 測試不寫入專案目錄下的 llm_cache.db
+os.environ.setdefault('LLM_CACHE_ENABLED', 'false')
+
+import json
+
+import pytest
+
+# 測試用的小型目錄：(標題, 季度, 評分, 類型, 簡介)
+SAMPLE_CATALOG = [
+    ("葬送的芙莉蓮", "2023-Fall", 9.3, ["奇幻", "冒險", "劇情"], "魔王被打倒後 精靈魔法使 芙莉蓮 與新的同伴踏上旅程"),
+    ("葬送的芙莉蓮 第二季", "2025-Fall", 9.1, ["奇幻", "冒險", "劇情"], "芙莉蓮 一行人繼續 旅程 前往北方"),
+    ("鬼滅之刃", "2019-Spring", 8.7, ["動作", "奇幻", "歷史"], "炭治郎 為了讓妹妹變回人類 與鬼戰鬥"),
+    ("鬼滅之刃 柱訓練篇", "2024-Spring", 8.2, ["動作", "奇幻"], "炭治郎 參加 柱 的訓練 準備最終決戰"),
+    ("咒術迴戰", "2020-Fall", 8.6, ["動作", "奇幻", "校園"], "虎杖悠仁 吞下詛咒之王的手指 進入咒術高專"),
+    ("間諜家家酒", "2022-Spring", 8.5, ["喜劇", "動作", "日常"], "間諜 殺手 與 超能力者 組成的 假家庭"),
+    ("孤獨搖滾", "2022-Fall", 8.9, ["喜劇", "音樂", "日常"], "社恐少女 後藤一里 加入 樂團 的故事"),
+    ("輕音少女", "2009-Spring", 8.0, ["音樂", "日常", "校園"], "高中 輕音部 的 樂團 日常"),
+    ("排球少年", "2014-Spring", 8.7, ["運動", "校園", "劇情"], "日向翔陽 在 烏野高中 排球部 追逐 全國大賽"),
+    ("灌籃高手", "1993-Fall", 8.8, ["運動", "校園", "喜劇"], "櫻木花道 加入 籃球隊 挑戰 全國大賽"),
+    ("輝夜姬想讓人告白", "2019-Winter", 8.4, ["戀愛", "喜劇", "校園"], "學生會長 與 副會長 的 戀愛 頭腦戰"),
+    ("戀愛代行", "2024-Winter", 1.5, ["戀愛", "喜劇"], "低評分 的 戀愛 喜劇"),
+    ("命運石之門", "2011-Spring", 9.1, ["科幻", "懸疑", "劇情"], "利用 微波爐 傳送 郵件到過去 的 時間旅行"),
+    ("進擊的巨人", "2013-Spring", 9.0, ["動作", "奇幻", "劇情"], "人類 在 高牆 內 對抗 巨人"),
+    ("夏目友人帳", "2008-Summer", 8.6, ["奇幻", "日常", "治癒"], "看得見 妖怪 的少年 歸還 友人帳 上的名字"),
+    ("我的英雄學院", "2016-Spring", 7.9, ["動作", "校園", "超能力"], "沒有 個性 的少年 成為 英雄 的故事"),
+]
+
+
+def build_catalog_db(db_path, catalog=SAMPLE_CATALOG):
+    """在 db_path 建立資料表並寫入測試目錄，返回資料庫路徑"""
+    import sqlite3
+    from utils.database.create_schema import create_schema, sync_tag_tables
+
+    create_schema(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.executemany(
+            "INSERT INTO anime (title, season, rating, viewers_count, viewers_numeric, genres_json, synopsis) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(title, season, rating, f"{index}K", index * 1000, json.dumps(genres, ensure_ascii=False), synopsis)
+             for index, (title, season, rating, genres, synopsis) in enumerate(catalog, start=1)],
+        )
+        sync_tag_tables(conn.cursor())
+        conn.commit()
+    finally:
+        conn.close()
+    return db_path
+
+
+@pytest.fixture
+def catalog_db(tmp_path):
+    """寫入 SAMPLE_CATALOG 的暫存資料庫路徑"""
+    return build_catalog_db(tmp_path / "anime.db")
@@ -0,0 +1,98 @@
+import asyncio
+import json
+import sqlite3
+
+import time
+
+import pytest
+
+from utils.database.catalog_version import CatalogWatcher
+from utils.database.connection import close_thread_connections
+
+
+def post(app, path, body, sent=None, read_delay=0.0):
+    """直接呼叫 ASGI app 送出 POST，返回狀態碼（read_delay 模擬讀取緩慢的客戶端）"""
+    messages = [{'type': 'http.request', 'body': json.dumps(body).encode(), 'more_body': False}]
+    sent = [] if sent is None else sent
+    finished = asyncio.Event()
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await finished.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+        if message['type'] == 'http.response.body':
+            await asyncio.sleep(read_delay)
+            if not message.get('more_body'):
+                finished.set()
+
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST',
+             'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+             'root_path': '', 'headers': [(b'content-type', b'application/json')],
+             'client': ('127.0.0.1', 1234), 'server': ('testserver', 80)}
+    asyncio.run(app(scope, receive, send))
+    return next(message['status'] for message in sent if message['type'] == 'http.response.start')
+
+
+@pytest.mark.parametrize("path", ['/api/anime/recommend', '/api/anime/recommend/stream'])
+def test_native_routes_poll_catalog_version(monkeypatch, catalog_db, path):
+    asgi_app = pytest.importorskip("asgi_app")
+    import api
+
+    watcher = CatalogWatcher()
+    changes = []
+    watcher.subscribe(lambda versions: changes.append(versions.content_version), content_only=True)
+    monkeypatch.setattr(api, "catalog_watcher", watcher)
+    monkeypatch.setattr(api, "DB_PATH", str(catalog_db))
+
+    async def unsupported(*args, **kwargs):
+        return 0, None
+    monkeypatch.setattr(asgi_app, "aclassify_input_request", unsupported)
+
+    assert post(asgi_app.app, path, {'description': '測試'}) in (200, 400)
+    with sqlite3.connect(catalog_db) as conn:
+        conn.execute("INSERT INTO anime (title, season, rating) VALUES ('新番測試', '2025-Winter', 8.0)")
+    post(asgi_app.app, path, {'description': '測試'})
+    close_thread_connections()
+
+    assert len(changes) == 1
+
+
+def test_stream_stages_exclude_time_waiting_on_the_client(monkeypatch, catalog_db):
+    asgi_app = pytest.importorskip("asgi_app")
+    import api
+    from test_metrics import stage_sum
+
+    candidates = [{'id': i} for i in range(3)]
+
+    class SlowSelector:
+        async def astream_select_anime(self, description, anime_list, count):
+            for anime in anime_list:
+                await asyncio.sleep(0.02)
+                yield anime, "理由"
+
+    async def classify(*args, **kwargs):
+        return 1, candidates
+
+    def slow_format(anime, reason=None, manifest=None):
+        time.sleep(0.01)
+        return {'id': anime['id']}
+
+    monkeypatch.setattr(api, "DB_PATH", str(catalog_db))
+    monkeypatch.setattr(asgi_app, "aclassify_input_request", classify)
+    monkeypatch.setattr(asgi_app, "image_manifest", lambda: None)
+    monkeypatch.setattr(asgi_app, "format_anime_result", slow_format)
+    monkeypatch.setattr(asgi_app.services, "_llm_selector", SlowSelector())
+    select_before, format_before = stage_sum("llm_select"), stage_sum("format")
+
+    sent = []
+    assert post(asgi_app.app, '/api/anime/recommend/stream', {'description': '測試', 'count': 3},
+                sent, read_delay=0.1) == 200
+
+    body = b"".join(message.get('body', b'') for message in sent if message['type'] == 'http.response.body')
+    assert body.count(b"event: item") == 3
+    assert 0.06 <= stage_sum("llm_select") - select_before < 0.2
+    assert 0.03 <= stage_sum("format") - format_before < 0.2
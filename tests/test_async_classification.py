@@ -0,0 +1,79 @@
+import asyncio
+import threading
+
+import utils.integrated_input_classifier as classifier
+from utils.single_flight import AsyncSingleFlight
+
+
+def test_semantic_cache_runs_off_the_event_loop(monkeypatch):
+    threads = {}
+
+    def lookup(user_input):
+        threads["lookup"] = threading.current_thread()
+        return None
+
+    def remember(user_input, classification, use_favorites):
+        threads["remember"] = threading.current_thread()
+
+    async def aclassify_input(user_input, max_retries=3, use_favorites=False):
+        return {"type": 2, "anime_name": None, "genres": ["奇幻"]}
+
+    monkeypatch.setattr(classifier, "_lookup_cached_classification", lookup)
+    monkeypatch.setattr(classifier, "_remember_classification", remember)
+    monkeypatch.setattr(classifier, "aclassify_input", aclassify_input)
+    monkeypatch.setattr(classifier, "execute_classification",
+                        lambda classification, *args: [classification["type"], []])
+
+    result = asyncio.run(classifier._aclassify_input_request("推薦奇幻番", None, 3, 3, False))
+    assert result == [2, []]
+    assert threads["lookup"] is not threading.main_thread()
+    assert threads["remember"] is not threading.main_thread()
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    flight = AsyncSingleFlight("test", enabled=True)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"value": 1}
+
+    async def main():
+        leader = asyncio.create_task(flight.do("key", compute))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do("key", compute))
+        await asyncio.sleep(0)
+        # 發起請求的客戶端斷線
+        leader.cancel()
+        result = await follower
+        assert leader.cancelled()
+        return result
+
+    assert asyncio.run(main()) == {"value": 1}
+    assert calls == [1]
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_last_waiter_cancel_stops_computation():
+    flight = AsyncSingleFlight("test", enabled=True)
+    finished = []
+
+    async def compute():
+        await asyncio.sleep(1)
+        finished.append(1)
+
+    async def main():
+        leader = asyncio.create_task(flight.do("key", compute))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        await asyncio.sleep(0.01)
+        # 之後的相同請求重新計算，不會等待已取消的計算
+        return await flight.do("key", _value)
+
+    async def _value():
+        return "fresh"
+
+    assert asyncio.run(main()) == "fresh"
+    assert finished == []
+    assert flight.stats() == {"enabled": True, "executed": 2, "shared": 0, "in_flight": 0}
@@ -0,0 +1,38 @@
+import threading
+
+import pytest
+
+from utils.database.connection import close_thread_connections, get_connection, get_connection_manager
+
+
+def test_connection_reused_within_thread_and_closed_explicitly(tmp_path):
+    db_path = tmp_path / "anime.db"
+    conn = get_connection(db_path)
+    assert get_connection(db_path) is conn
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(get_connection(db_path)))
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
+
+    close_thread_connections()
+    assert getattr(get_connection_manager(db_path)._local, "conn") is None
+    assert get_connection(db_path) is not conn
+    close_thread_connections()
+
+
+@pytest.mark.parametrize("close_on_teardown", [False, True])
+def test_api_teardown_closes_connection_only_for_per_request_threads(monkeypatch, catalog_db, close_on_teardown):
+    api = pytest.importorskip("api")
+    monkeypatch.setattr(api, "DB_PATH", str(catalog_db))
+    monkeypatch.setattr(api, "CLOSE_CONNECTIONS_ON_TEARDOWN", close_on_teardown)
+    manager = get_connection_manager(catalog_db)
+
+    with api.app.test_request_context():
+        api.app.preprocess_request()
+        assert manager._local.conn is not None
+    # 離開 app context 時執行 teardown_appcontext
+    assert (getattr(manager._local, "conn", None) is None) == close_on_teardown
+    close_thread_connections()
@@ -0,0 +1,95 @@
+import hashlib
+import sqlite3
+
+import pytest
+
+from utils.database.anime_queries import AnimeDatabase
+from utils.database.connection import close_thread_connections
+from utils.database.image_manifest import build_image_manifest
+from utils.http_cache import IMAGE_VERSION_LENGTH, IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL
+
+COVER = "鬼滅之刃.jpg"
+COVER_BYTES = b"cover-bytes"
+VERSION = hashlib.sha256(COVER_BYTES).hexdigest()[:IMAGE_VERSION_LENGTH]
+
+
+@pytest.fixture
+def api(monkeypatch, catalog_db, tmp_path):
+    api = pytest.importorskip("api")
+    images_dir = tmp_path / "images"
+    images_dir.mkdir()
+    (images_dir / COVER).write_bytes(COVER_BYTES)
+    with sqlite3.connect(catalog_db) as conn:
+        conn.execute("UPDATE anime SET image_path = ? WHERE title = '鬼滅之刃'", (f"images/{COVER}",))
+        build_image_manifest(conn, images_dir=str(images_dir))
+    # 建立清單後才放入的檔案（不在清單中）
+    (images_dir / "unlisted.jpg").write_bytes(b"unlisted")
+
+    monkeypatch.setattr(api, "DB_PATH", str(catalog_db))
+    monkeypatch.setattr(api, "IMAGES_DIR", str(images_dir))
+    anime_db = AnimeDatabase(str(catalog_db))
+    anime_db.add_like_column_if_not_exists()
+    monkeypatch.setattr(api.services, "_anime_db", anime_db)
+    yield api
+    close_thread_connections()
+
+
+def test_versioned_cover_url_is_immutable(api):
+    client = api.app.test_client()
+    response = client.get(f"/images/{COVER}?v={VERSION}")
+    assert response.status_code == 200
+    assert response.data == COVER_BYTES
+    assert response.headers["Cache-Control"] == IMMUTABLE_CACHE_CONTROL
+    assert response.headers["ETag"] == f'"{VERSION}"'
+
+    revalidated = client.get(f"/images/{COVER}?v={VERSION}", headers={"If-None-Match": f'"{VERSION}"'})
+    assert revalidated.status_code == 304
+    assert revalidated.data == b""
+
+
+@pytest.mark.parametrize("query", ["", "?v=stale"])
+def test_unversioned_or_stale_url_must_revalidate(api, query):
+    response = api.app.test_client().get(f"/images/{COVER}{query}")
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == REVALIDATE_CACHE_CONTROL
+    assert response.headers["ETag"] == f'"{VERSION}"'
+
+
+def test_cover_outside_manifest_uses_file_etag(api):
+    client = api.app.test_client()
+    response = client.get("/images/unlisted.jpg")
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == REVALIDATE_CACHE_CONTROL
+    etag = response.headers["ETag"]
+    assert client.get("/images/unlisted.jpg", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/images/missing.jpg").status_code == 404
+
+
+def test_cover_urls_carry_content_version(api):
+    image_url, srcset = api.build_cover_urls(COVER)
+    assert image_url.endswith(f"?v={VERSION}")
+    assert srcset.count(f"&v={VERSION}") == srcset.count("w=")
+    image_url, srcset = api.build_cover_urls("unlisted.jpg")
+    assert "v=" not in image_url and "v=" not in srcset
+
+
+def test_list_etag_changes_with_catalog_version(api):
+    client = api.app.test_client()
+    response = client.get("/api/anime/5")
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == REVALIDATE_CACHE_CONTROL
+    etag = response.headers["ETag"]
+    assert etag.startswith('"catalog-')
+    covers = {anime["title"]: anime["cover"] for anime in response.get_json()}
+    assert covers["鬼滅之刃"].endswith(f"?v={VERSION}")
+
+    cached = client.get("/api/anime/5", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["ETag"] == etag
+
+    anime_id = response.get_json()[0]["id"]
+    assert client.post(f"/api/anime/like/{anime_id}", json={"action": "like"}).status_code == 200
+    changed = client.get("/api/anime/5", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert client.get("/api/anime/favorites", headers={"If-None-Match": changed.headers["ETag"]}).status_code == 304
@@ -0,0 +1,38 @@
+import sqlite3
+
+from utils.database.catalog_version import read_catalog_versions, read_image_version
+from utils.database.image_manifest import ImageManifest, build_image_manifest
+
+
+def test_manifest_build_does_not_bump_content_version(catalog_db, tmp_path):
+    images_dir = tmp_path / "images"
+    images_dir.mkdir()
+    (images_dir / "鬼滅之刃.jpg").write_bytes(b"cover")
+    conn = sqlite3.connect(catalog_db)
+    before = read_catalog_versions(conn)
+    before_images = read_image_version(conn)
+
+    build_image_manifest(conn, images_dir=str(images_dir))
+
+    after = read_catalog_versions(conn)
+    assert after.content_version == before.content_version
+    assert after.version == before.version + 1
+    assert read_image_version(conn) == before_images + 1
+
+    manifest = ImageManifest(str(images_dir))
+    manifest.refresh(conn)
+    anime_id = conn.execute("SELECT id FROM anime WHERE title = '鬼滅之刃'").fetchone()[0]
+    assert manifest.cover(anime_id) == "鬼滅之刃.jpg"
+    assert manifest.sha256("鬼滅之刃.jpg")
+
+
+def test_refresh_without_manifest_table_runs_no_ddl(tmp_path, capsys):
+    conn = sqlite3.connect(tmp_path / "empty.db")
+    conn.execute("CREATE TABLE anime (id INTEGER PRIMARY KEY, title TEXT)")
+    manifest = ImageManifest(str(tmp_path))
+    manifest.refresh(conn)
+
+    assert manifest.cover(1) is None
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert tables == {"anime"}
+    assert capsys.readouterr().out == ""
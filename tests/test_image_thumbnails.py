@@ -0,0 +1,56 @@
+import threading
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+import utils.image_thumbnails as thumbnails
+
+
+@pytest.fixture
+def images_dir(tmp_path):
+    directory = tmp_path / "images"
+    directory.mkdir()
+    for name in ("a.jpg", "b.jpg"):
+        Image.new("RGB", (800, 1200), "red").save(directory / name)
+    return directory
+
+
+def test_generates_snapped_webp(images_dir, tmp_path):
+    target = thumbnails.ensure_thumbnail("a.jpg", 320, str(images_dir), str(tmp_path / "thumbs"))
+    with Image.open(target) as image:
+        assert image.format == "WEBP"
+        assert image.size == (320, 480)
+    assert thumbnails.snap_width(200) == 320
+    assert thumbnails.snap_width(5000) == thumbnails.THUMBNAIL_WIDTHS[-1]
+
+
+def test_different_targets_generate_concurrently(images_dir, tmp_path, monkeypatch):
+    """一張縮圖產生中時，其他縮圖不需排隊等待"""
+    thumbs = str(tmp_path / "thumbs")
+    slow_started = threading.Event()
+    release = threading.Event()
+    open_image = thumbnails.Image.open
+
+    def blocking_open(path, *args, **kwargs):
+        if str(path).endswith("a.jpg"):
+            slow_started.set()
+            release.wait(5)
+        return open_image(path, *args, **kwargs)
+
+    monkeypatch.setattr(thumbnails.Image, "open", blocking_open)
+    slow = threading.Thread(target=thumbnails.ensure_thumbnail, args=("a.jpg", 160, str(images_dir), thumbs))
+    slow.start()
+    try:
+        assert slow_started.wait(2)
+        result = []
+        other = threading.Thread(target=lambda: result.append(
+            thumbnails.ensure_thumbnail("b.jpg", 160, str(images_dir), thumbs)))
+        other.start()
+        other.join(2)
+        assert result and result[0].endswith("b.webp")
+    finally:
+        release.set()
+        slow.join()
+    assert thumbnails._generate_locks == {}
+    assert sorted(path.name for path in (tmp_path / "thumbs" / "160").iterdir()) == ["a.webp", "b.webp"]
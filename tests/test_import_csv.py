@@ -0,0 +1,156 @@
+import csv
+import json
+import sqlite3
+
+from utils.database.create_schema import create_schema
+import pytest
+
+from utils.database.import_single_csv import REQUIRED_COLUMNS, auto_import_all, derive_season, import_single, load_rows, parse_csv_row
+
+
+def write_csv(path, rows):
+    with path.open("w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=REQUIRED_COLUMNS + ["anime_tag 3"])
+        writer.writeheader()
+        for title, rating, tags in rows:
+            writer.writerow({
+                "entity_localized_name": title,
+                "scormem-item": rating,
+                "scormem-item 2": "12K",
+                "anime_tag": tags[0],
+                "anime_tag 2": tags[1] if len(tags) > 1 else "",
+                "steam-site-name": "巴哈姆特動畫瘋",
+                "anime_story": f"{title} 的故事",
+                "image_path": f"{title}.jpg",
+            })
+
+
+def import_csv(csv_path, db_path, **kwargs):
+    return import_single(csv_path, db_path, embed=False, similar=False, **kwargs)
+
+
+def anime_rows(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT title, season, rating FROM anime ORDER BY id").fetchall()
+
+
+def catalog_snapshot(db_path):
+    """anime 內容與標籤關聯（比較兩種匯入方式的結果）"""
+    with sqlite3.connect(db_path) as conn:
+        anime = conn.execute(
+            "SELECT id, title, season, rating, viewers_count, viewers_numeric, genres_json, platforms_json, "
+            "image_path, synopsis FROM anime ORDER BY id").fetchall()
+        genres = conn.execute(
+            "SELECT ag.anime_id, g.name, ag.position FROM anime_genre ag JOIN genre g ON g.id = ag.genre_id "
+            "ORDER BY ag.anime_id, ag.position").fetchall()
+    return anime, genres
+
+
+# 三個季度的 CSV：跨檔與同檔內都有重複標題
+SEASON_FILES = {
+    "2024_1_with_image.csv": [("測試動畫A", "4.5", ["奇幻", "冒險"]), ("測試動畫B", "4.0", ["校園"]),
+                              ("測試動畫A", "1.0", ["恐怖"])],
+    "2024_4_with_image.csv": [("測試動畫B", "3.5", ["校園", "戀愛"]), ("測試動畫C", "", ["日常"])],
+    "2024_7_with_image.csv": [("測試動畫D", "4.8", ["運動"]), ("測試動畫C", "2.0", ["日常"]),
+                              ("測試動畫E", "3.9", ["科幻", "懸疑"])],
+}
+
+
+def test_replace_twice_without_season_updates_in_place(tmp_path):
+    db_path = tmp_path / "anime.db"
+    create_schema(db_path)
+    # 檔名推不出季度：season 為 NULL
+    csv_path = tmp_path / "extra.csv"
+    write_csv(csv_path, [("測試動畫A", "4.5", ["奇幻", "冒險"]), ("測試動畫B", "4.0", ["校園"])])
+
+    assert import_csv(csv_path, db_path, replace=True) == (2, 0, 0)
+    assert import_csv(csv_path, db_path, replace=True) == (0, 0, 2)
+    assert anime_rows(db_path) == [("測試動畫A", None, 4.5), ("測試動畫B", None, 4.0)]
+
+    write_csv(csv_path, [("測試動畫A", "3.0", ["奇幻", "冒險"]), ("測試動畫B", "4.0", ["校園"])])
+    assert import_csv(csv_path, db_path, replace=True) == (0, 1, 1)
+    assert anime_rows(db_path) == [("測試動畫A", None, 3.0), ("測試動畫B", None, 4.0)]
+
+
+def test_replace_updates_same_season_and_keeps_tags_in_sync(tmp_path):
+    db_path = tmp_path / "anime.db"
+    create_schema(db_path)
+    csv_path = tmp_path / "2024_1_with_image.csv"
+    write_csv(csv_path, [("測試動畫A", "4.5", ["奇幻", "冒險"])])
+    assert import_csv(csv_path, db_path, replace=True) == (1, 0, 0)
+
+    write_csv(csv_path, [("測試動畫A", "4.5", ["戀愛"]), ("測試動畫A", "1.0", ["恐怖"])])
+    assert import_csv(csv_path, db_path, replace=True) == (0, 1, 1)
+    assert anime_rows(db_path) == [("測試動畫A", "2024-Winter", 4.5)]
+    with sqlite3.connect(db_path) as conn:
+        genres = conn.execute(
+            "SELECT g.name FROM anime_genre ag JOIN genre g ON g.id = ag.genre_id ORDER BY g.name").fetchall()
+    assert genres == [("戀愛",)]
+
+
+def test_default_import_skips_existing_title_in_any_season(tmp_path):
+    db_path = tmp_path / "anime.db"
+    create_schema(db_path)
+    winter = tmp_path / "2024_1_with_image.csv"
+    spring = tmp_path / "2024_4_with_image.csv"
+    write_csv(winter, [("測試動畫A", "4.5", ["奇幻"])])
+    write_csv(spring, [("測試動畫A", "3.0", ["奇幻"]), ("測試動畫B", "4.0", ["校園"])])
+
+    assert import_csv(winter, db_path) == (1, 0, 0)
+    assert import_csv(spring, db_path) == (1, 0, 1)
+    assert anime_rows(db_path) == [("測試動畫A", "2024-Winter", 4.5), ("測試動畫B", "2024-Spring", 4.0)]
+
+
+def test_staging_import_matches_per_row_baseline(tmp_path):
+    db_path = tmp_path / "anime.db"
+    create_schema(db_path)
+    expected = []
+    seen = set()
+    for name, rows in SEASON_FILES.items():
+        csv_path = tmp_path / name
+        write_csv(csv_path, rows)
+        import_csv(csv_path, db_path)
+        # 基準版 upsert_anime：title 已存在（不論季度）就略過，逐列處理
+        for title, rating, _tags in rows:
+            if title not in seen:
+                seen.add(title)
+                expected.append((title, derive_season(csv_path), float(rating) if rating else None))
+
+    assert anime_rows(db_path) == expected
+    anime, genres = catalog_snapshot(db_path)
+    assert genres == [(row[0], genre, position)
+                      for row in anime
+                      for position, genre in enumerate(json.loads(row[6]))]
+
+
+def test_auto_import_parallel_parse_matches_serial(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    for name, rows in SEASON_FILES.items():
+        write_csv(data_dir / name, rows)
+    # 缺少欄位的檔案只略過該檔，不影響其他檔案
+    (data_dir / "2024_10_with_image.csv").write_text("entity_localized_name\n測試動畫F\n", encoding="utf-8")
+
+    serial_db, parallel_db = tmp_path / "serial.db", tmp_path / "parallel.db"
+    auto_import_all(data_dir, serial_db, embed=False, similar=False, workers=1)
+    auto_import_all(data_dir, parallel_db, embed=False, similar=False, workers=3)
+
+    assert catalog_snapshot(parallel_db) == catalog_snapshot(serial_db)
+    assert [title for title, _season, _rating in anime_rows(serial_db)] == [
+        "測試動畫A", "測試動畫B", "測試動畫C", "測試動畫D", "測試動畫E"]
+
+
+def test_load_rows_rolls_back_whole_batch(tmp_path):
+    db_path = tmp_path / "anime.db"
+    create_schema(db_path)
+    good = parse_csv_row({"entity_localized_name": "測試動畫A", "scormem-item": "4.0"})
+    bad = dict(good, title=None)
+    conn = sqlite3.connect(db_path)
+    try:
+        synchronous = conn.execute("PRAGMA synchronous").fetchone()[0]
+        with pytest.raises(sqlite3.IntegrityError):
+            load_rows(conn, [dict(good, season="2024-Winter"), dict(bad, season="2024-Winter")])
+        assert conn.execute("SELECT COUNT(*) FROM anime").fetchone()[0] == 0
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == synchronous
+    finally:
+        conn.close()
@@ -0,0 +1,82 @@
+import pytest
+
+import utils.integrated_input_classifier as classifier
+from utils.database.anime_queries import AnimeDatabase
+from utils.database.vector_index import DEFAULT_MIN_RELATIVE_SCORE, DEFAULT_MIN_SCORE
+
+
+@pytest.fixture
+def anime_db(catalog_db):
+    db = AnimeDatabase(str(catalog_db))
+    db.vector_index.refresh(db.get_connection())
+    return db
+
+
+def test_vector_search_finds_described_anime(anime_db):
+    results = anime_db.query_anime_by_text("想看樂團的日常動畫", limit=5)
+    assert results[0]["title"] in ("孤獨搖滾", "輕音少女")
+    top = results[0]["similarity_score"]
+    assert all(anime["similarity_score"] >= max(DEFAULT_MIN_SCORE, top * DEFAULT_MIN_RELATIVE_SCORE)
+               for anime in results)
+
+
+def test_vector_search_drops_weak_matches(anime_db):
+    ranked = anime_db.vector_index.search("想看樂團的日常動畫", limit=20, min_score=0.0, min_relative_score=0.0)
+    kept = anime_db.vector_index.search("想看樂團的日常動畫", limit=20)
+    assert len(kept) < len(ranked)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("想看輕鬆治癒的日常番", True),
+    ("有沒有關於樂團的動畫", True),
+    ("戀愛喜劇校園", True),
+    ("今天天氣如何", False),
+    ("推薦好吃的拉麵店", False),
+    ("hello how are you", False),
+    ("推薦一部電影", False),
+])
+def test_has_anime_intent(text, expected):
+    assert classifier.has_anime_intent(text) is expected
+
+
+@pytest.fixture
+def type3_calls(monkeypatch):
+    calls = {"local": [], "external": []}
+    candidates = []
+
+    def semantic_search(query, limit=10, season=None):
+        calls["local"].append(query)
+        return list(candidates)
+
+    def call_external_api(user_input, count=3):
+        calls["external"].append(user_input)
+        return {"external": user_input}
+
+    monkeypatch.setattr(classifier, "LOCAL_RETRIEVAL_ENABLED", True)
+    monkeypatch.setattr(classifier, "semantic_search", semantic_search)
+    monkeypatch.setattr(classifier, "call_external_api_for_recommendation", call_external_api)
+    return calls, candidates
+
+
+def classify_type3(text):
+    return classifier.execute_classification({"type": 3, "anime_name": None, "genres": []}, text, None, 3)
+
+
+def test_type3_uses_local_results_for_anime_queries(type3_calls):
+    calls, candidates = type3_calls
+    candidates.append({"title": "孤獨搖滾"})
+    assert classify_type3("有沒有關於樂團的動畫") == [3, [{"title": "孤獨搖滾"}]]
+    assert calls["external"] == []
+
+
+def test_type3_falls_back_when_local_has_no_results(type3_calls):
+    calls, _ = type3_calls
+    assert classify_type3("有沒有關於樂團的動畫") == [3, {"external": "有沒有關於樂團的動畫"}]
+    assert calls["local"] == ["有沒有關於樂團的動畫"]
+
+
+def test_type3_unrelated_query_skips_local_retrieval(type3_calls):
+    calls, candidates = type3_calls
+    candidates.append({"title": "任意作品"})
+    assert classify_type3("今天天氣如何") == [3, {"external": "今天天氣如何"}]
+    assert calls["local"] == []
@@ -0,0 +1,141 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from utils.database.connection import close_thread_connections
+from utils.metrics import (CACHE_LOOKUPS, LLM_TOKENS, PROMETHEUS_CONTENT_TYPE, MetricsRegistry, record_cache,
+                           record_usage, registry, request_trace, stage_span)
+
+
+def test_counter_and_histogram_render_prometheus_text():
+    metrics = MetricsRegistry()
+    hits = metrics.counter("test_hits_total", "命中次數", ("cache",))
+    latency = metrics.histogram("test_seconds", "耗時", ("stage",), buckets=(0.1, 1.0))
+    hits.inc(cache='llm')
+    hits.inc(2, cache='say "hi"\n\\')
+    latency.observe(0.05, stage="db")
+    latency.observe(0.5, stage="db")
+    latency.observe(3, stage="db")
+
+    assert metrics.render() == "\n".join([
+        "# HELP test_hits_total 命中次數",
+        "# TYPE test_hits_total counter",
+        'test_hits_total{cache="llm"} 1',
+        'test_hits_total{cache="say \\"hi\\"\\n\\\\"} 2',
+        "# HELP test_seconds 耗時",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{stage="db",le="0.1"} 1',
+        'test_seconds_bucket{stage="db",le="1"} 2',
+        'test_seconds_bucket{stage="db",le="+Inf"} 3',
+        'test_seconds_sum{stage="db"} 3.55',
+        'test_seconds_count{stage="db"} 3',
+    ]) + "\n"
+
+
+def test_registry_rejects_mismatched_metrics_and_labels():
+    metrics = MetricsRegistry()
+    counter = metrics.counter("test_total", "次數", ("stage",))
+    assert metrics.counter("test_total", "次數", ("stage",)) is counter
+    with pytest.raises(ValueError):
+        metrics.histogram("test_total", "次數", ("stage",))
+    with pytest.raises(ValueError):
+        metrics.counter("test_total", "次數", ("endpoint",))
+    with pytest.raises(ValueError):
+        counter.inc(stage="db", extra="x")
+    assert metrics.render() == "# HELP test_total 次數\n# TYPE test_total counter\n"
+
+
+def test_spans_record_tokens_and_cache_hits_on_the_request_trace():
+    before = registry.render()
+    with request_trace("test_endpoint") as trace:
+        with stage_span("test_stage") as span:
+            assert record_usage(SimpleNamespace(usage=SimpleNamespace(prompt_tokens=12, completion_tokens=3))) is not None
+            record_cache("llm", True)
+            record_cache("llm", False)
+        with stage_span("test_format"):
+            pass
+    # 不在任何 span 內時不記錄
+    record_cache("llm", True)
+
+    assert [s.stage for s in trace.spans] == ["test_stage", "test_format"]
+    assert (span.prompt_tokens, span.completion_tokens, span.cache_hits, span.cache_misses) == (12, 3, 1, 1)
+    assert "tokens 12/3" in trace.summary() and "cache 1/2" in trace.summary()
+    assert [part.split(";dur=")[0] for part in trace.server_timing().split(", ")] == ["test_stage", "test_format"]
+
+    rendered = registry.render()
+    assert 'anime_llm_tokens_total{stage="test_stage",kind="prompt"} 12' in rendered
+    assert 'anime_cache_lookups_total{stage="test_stage",cache="llm",result="miss"} 1' in rendered
+    assert 'anime_recommend_stage_seconds_count{stage="test_stage"} 1' in rendered
+    assert 'anime_recommend_request_seconds_count{endpoint="test_endpoint"} 1' in rendered
+    assert "test_stage" not in before
+    for metric in (LLM_TOKENS, CACHE_LOOKUPS):
+        assert f"# TYPE {metric.name} counter" in rendered
+
+
+def test_spans_in_worker_threads_join_the_request_trace():
+    async def handle():
+        with request_trace("test_async") as trace:
+            def work():
+                with stage_span("test_thread"):
+                    record_cache("semantic", True)
+            await asyncio.to_thread(work)
+        return trace
+
+    trace = asyncio.run(handle())
+    assert [(s.stage, s.cache_hits) for s in trace.spans] == [("test_thread", 1)]
+
+
+def test_metrics_endpoint_serves_registry(monkeypatch, catalog_db):
+    api = pytest.importorskip("api")
+    monkeypatch.setattr(api, "DB_PATH", str(catalog_db))
+    response = api.app.test_client().get("/metrics")
+    close_thread_connections()
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == PROMETHEUS_CONTENT_TYPE
+    assert "# TYPE anime_recommend_stage_seconds histogram" in response.get_data(as_text=True)
+
+
+def stage_sum(stage):
+    prefix = f'anime_recommend_stage_seconds_sum{{stage="{stage}"}} '
+    line = next((line for line in registry.render().splitlines() if line.startswith(prefix)), None)
+    return float(line[len(prefix):]) if line else 0.0
+
+
+def test_stream_stages_exclude_time_waiting_on_the_client(monkeypatch, catalog_db):
+    api = pytest.importorskip("api")
+    candidates = [{'id': i} for i in range(3)]
+
+    class SlowSelector:
+        def stream_select_anime(self, description, anime_list, count):
+            for anime in anime_list:
+                time.sleep(0.02)
+                yield anime, "理由"
+
+    def slow_format(anime, reason=None, manifest=None):
+        time.sleep(0.01)
+        return {'id': anime['id']}
+
+    monkeypatch.setattr(api, "DB_PATH", str(catalog_db))
+    monkeypatch.setattr(api, "classify_input_request", lambda *args, **kwargs: (1, candidates))
+    monkeypatch.setattr(api, "image_manifest", lambda: None)
+    monkeypatch.setattr(api, "format_anime_result", slow_format)
+    monkeypatch.setattr(api.services, "_llm_selector", SlowSelector())
+    select_before, format_before = stage_sum("llm_select"), stage_sum("format")
+
+    response = api.app.test_client().post("/api/anime/recommend/stream", json={'description': '測試', 'count': 3},
+                                          buffered=False)
+    events = []
+    for chunk in response.response:
+        events.append(chunk)
+        # 客戶端讀取緩慢
+        time.sleep(0.1)
+    response.close()
+    close_thread_connections()
+
+    assert sum(b"event: item" in event for event in events) == 3
+    selected = stage_sum("llm_select") - select_before
+    formatted = stage_sum("format") - format_before
+    assert 0.06 <= selected < 0.2
+    assert 0.03 <= formatted < 0.2
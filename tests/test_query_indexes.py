@@ -0,0 +1,143 @@
+import json
+from difflib import SequenceMatcher
+
+import pytest
+
+from conftest import SAMPLE_CATALOG, build_catalog_db
+from utils.database.anime_queries import AnimeDatabase
+from utils.database.benchmark_title_normalization import legacy_extract_base_title, legacy_normalize_title
+from utils.database.connection import close_thread_connections
+from utils.database.title_index import DEFAULT_CANDIDATE_LIMIT
+from utils.database.title_normalizer import SEASON_MAPPINGS, extract_base_title, normalize_title
+
+# 超過 n-gram 候選上限的目錄，讓標題查詢實際經過 shortlist 篩選
+SUFFIXES = ("", " 第二季", " 2nd Season", " Season 3", " 續篇", " -最終章-")
+SEASONS = ("2023-Winter", "2023-Spring", "2024-Summer", "2024-Fall")
+GENRES = ("動作", "奇幻", "校園", "戀愛", "喜劇", "日常", "運動", "科幻")
+LARGE_CATALOG = SAMPLE_CATALOG + [
+    (f"{prefix}{noun}{suffix}", SEASONS[i % len(SEASONS)], round(5 + (i * 37 % 45) / 10, 1),
+     [GENRES[i % len(GENRES)], GENRES[(i * 3 + 1) % len(GENRES)]], "")
+    for i, (prefix, noun, suffix) in enumerate(
+        (prefix, noun, suffix)
+        for prefix in ("魔法", "勇者", "偶像", "異世界")
+        for noun in ("學園", "物語", "日記", "冒險譚")
+        for suffix in SUFFIXES
+    )
+]
+
+TITLE_QUERIES = [
+    ("葬送的芙莉蓮 第2季", None),
+    ("葬送的芙莉蓮", "2023-Fall"),
+    ("鬼滅之刃", None),
+    ("孤獨搖滾!", None),
+    ("進擊的巨人 Season 2", None),
+    ("間諜家家酒 2nd Season", None),
+    ("魔法學園 第三季", None),
+    ("勇者物語", "2024-Summer"),
+    ("異世界冒險譚 續篇", None),
+    ("偶像日記 S2", "2023-Spring"),
+    ("完全不存在的標題", None),
+]
+
+
+def baseline_similarity(query, db_title):
+    """基準版 calculate_similarity（逐筆重新標準化）"""
+    norm_query, norm_db = legacy_normalize_title(query), legacy_normalize_title(db_title)
+    base_query, base_db = legacy_extract_base_title(query), legacy_extract_base_title(db_title)
+    if norm_query.lower() == norm_db.lower():
+        return 1.0
+    bonus = 0
+    if base_query.lower() == base_db.lower() and base_query:
+        bonus += 0.3
+    if (base_query.lower() in base_db.lower() or base_db.lower() in base_query.lower()) and len(base_query) > 2:
+        bonus += 0.2
+    similarity = max(
+        SequenceMatcher(None, query.lower(), db_title.lower()).ratio(),
+        SequenceMatcher(None, norm_query.lower(), norm_db.lower()).ratio(),
+        SequenceMatcher(None, base_query.lower(), base_db.lower()).ratio(),
+    )
+    return min(1.0, similarity + bonus)
+
+
+def baseline_title_scan(catalog, query, threshold, limit, season):
+    """基準版 query_anime_by_title（逐筆掃描整個資料表）"""
+    results = []
+    for title, anime_season, *_ in catalog:
+        if season and anime_season != season:
+            continue
+        similarity = baseline_similarity(query, title)
+        if similarity >= threshold:
+            results.append((title, similarity))
+    results.sort(key=lambda item: item[1], reverse=True)
+    return results[:limit]
+
+
+def baseline_tag_scan(catalog, tags, limit, tag_bonus, min_rating, season):
+    """基準版 query_anime_by_tags（逐筆解析 genres_json）；同分依評分、id 排序"""
+    results = []
+    for anime_id, (title, anime_season, rating, genres, _synopsis) in enumerate(catalog, start=1):
+        if rating < min_rating or (season and anime_season != season):
+            continue
+        genres_lower = [genre.lower() for genre in genres]
+        matched = [tag for tag in tags if tag.lower() in genres_lower]
+        if matched:
+            results.append((anime_id, matched, rating + len(matched) * tag_bonus, rating))
+    results.sort(key=lambda item: (-item[2], -item[3], item[0]))
+    return [(anime_id, matched, total) for anime_id, matched, total, _ in results[:limit]]
+
+
+@pytest.fixture
+def large_db(tmp_path):
+    db = AnimeDatabase(str(build_catalog_db(tmp_path / "anime.db", LARGE_CATALOG)))
+    yield db
+    close_thread_connections()
+
+
+def test_large_catalog_exceeds_candidate_limit():
+    assert len(LARGE_CATALOG) > DEFAULT_CANDIDATE_LIMIT
+
+
+@pytest.mark.parametrize("query, season", TITLE_QUERIES)
+@pytest.mark.parametrize("threshold, limit", [(0.6, 1), (0.5, 5)])
+def test_title_index_matches_linear_scan(large_db, query, season, threshold, limit):
+    expected = baseline_title_scan(LARGE_CATALOG, query, threshold, limit, season)
+    results = large_db.query_anime_by_title(query, similarity_threshold=threshold, limit=limit, season=season)
+    assert [(r['matched_title'], r['similarity_score']) for r in results] == expected
+    for result in results:
+        assert result['base_title'] == legacy_extract_base_title(result['matched_title'])
+
+
+def test_title_index_rebuilds_after_catalog_change(large_db):
+    assert large_db.query_anime_by_title("新番測試") == []
+    with large_db.get_connection() as conn:
+        conn.execute("INSERT INTO anime (title, season, rating) VALUES ('新番測試', '2025-Winter', 8.0)")
+    assert [r['title'] for r in large_db.query_anime_by_title("新番測試")] == ["新番測試"]
+
+
+@pytest.mark.parametrize("title", [f"測試動畫 {variant}" for variant in SEASON_MAPPINGS] + [
+    "", "  多餘   空白  第二季 ", "Re:從零開始 2nd Season", "某科學的超電磁砲S", "劇場版 -無限列車篇-",
+    "物語系列 第二季度", "第二季第三季", "Season 10",
+] + [title for title, *_ in LARGE_CATALOG])
+def test_season_normalization_matches_legacy(title):
+    assert normalize_title(title) == legacy_normalize_title(title)
+    assert extract_base_title(title) == legacy_extract_base_title(title)
+
+
+@pytest.mark.parametrize("tags, limit, tag_bonus, min_rating, season", [
+    (["奇幻"], 10, 0.5, 2.0, None),
+    (["動作", "奇幻"], 5, 0.5, 2.0, None),
+    (["戀愛", "喜劇"], 10, 0.5, 1.0, None),
+    (["校園", "運動"], 3, 0.8, 7.5, None),
+    (["奇幻", "奇幻"], 4, 0.5, 2.0, None),
+    (["動作"], 10, 0.5, 2.0, "2023-Winter"),
+    (["奇幻", "校園"], 10, 0.5, 2.0, "2024-Fall"),
+    (["不存在的類型"], 10, 0.5, 2.0, None),
+    (["日常"], 0, 0.5, 2.0, None),
+])
+def test_genre_bitmap_matches_linear_scan(large_db, tags, limit, tag_bonus, min_rating, season):
+    expected = baseline_tag_scan(LARGE_CATALOG, tags, limit, tag_bonus, min_rating, season)
+    results = large_db.query_anime_by_tags(tags, limit=limit, tag_bonus=tag_bonus,
+                                           min_rating=min_rating, season=season)
+    assert [(r['id'], r['matched_tags'], r['total_score']) for r in results] == expected
+    for result in results:
+        assert result['anime_genres'] == json.loads(result['genres_json'])
@@ -0,0 +1,67 @@
+import pytest
+
+from config import SEMANTIC_CACHE_THRESHOLD
+from utils.integrated_input_classifier import _validate_cached_classification, mentioned_genres
+from utils.semantic_cache import SemanticCache
+
+
+def classification(request_type, anime_name="", genres=()):
+    return {"type": request_type, "anime_name": anime_name, "genres": list(genres)}
+
+
+@pytest.fixture
+def cache():
+    return SemanticCache(threshold=SEMANTIC_CACHE_THRESHOLD, max_entries=16, ttl_seconds=0, enabled=True)
+
+
+def lookup(cache, text):
+    return cache.lookup(text, validate=lambda cached: _validate_cached_classification(cached, text))
+
+
+@pytest.mark.parametrize("cached_text, genre, new_text", [
+    ("請問有沒有可以推薦給我的好看的奇幻類型的動畫作品", "奇幻", "請問有沒有可以推薦給我的好看的戀愛類型的動畫作品"),
+    ("recommend me some good fantasy anime please", "奇幻", "recommend me some good romance anime please"),
+    ("我最近想看一些輕鬆的搞笑動畫", "喜劇", "我最近想看一些輕鬆的戀愛動畫"),
+])
+def test_genre_swap_is_not_a_hit(cache, cached_text, genre, new_text):
+    cache.add(cached_text, classification(2, genres=[genre]))
+    assert lookup(cache, new_text) is None
+
+
+def test_extra_genre_is_not_a_hit(cache):
+    cache.add("有沒有推薦的奇幻類型番劇", classification(2, genres=["奇幻"]))
+    assert lookup(cache, "有沒有推薦的奇幻戀愛類型番劇") is None
+
+
+@pytest.mark.parametrize("cached_text, new_text", [
+    ("請問有沒有可以推薦給我的好看的奇幻類型的動畫作品", "有沒有可以推薦給我好看的奇幻類型的動畫作品呢"),
+    ("recommend me some good fantasy anime please", "please recommend me some good fantasy anime"),
+])
+def test_paraphrase_with_same_genre_hits(cache, cached_text, new_text):
+    cache.add(cached_text, classification(2, genres=["奇幻"]))
+    assert lookup(cache, new_text) == classification(2, genres=["奇幻"])
+
+
+def test_identical_input_hits_even_when_genre_is_inferred(cache):
+    # 「輕鬆」由 LLM 推成日常，輸入中沒有類別詞；完全相同的輸入仍可重用
+    cache.add("我最近想看一些輕鬆的動畫", classification(2, genres=["日常"]))
+    assert lookup(cache, "我最近想看一些輕鬆的動畫！") == classification(2, genres=["日常"])
+    assert lookup(cache, "我最近想看一些輕鬆的動畫吧") is None
+
+
+def test_anime_name_must_appear(cache):
+    cache.add("請問有沒有和火影忍者劇情相似的熱門動漫作品", classification(1, anime_name="火影忍者"))
+    assert lookup(cache, "請問有沒有和火影忍者劇情相似的熱門動漫作品呢")["anime_name"] == "火影忍者"
+    assert lookup(cache, "請問有沒有和海賊王劇情相似的熱門動漫作品") is None
+
+
+def test_cached_value_is_a_copy(cache):
+    cache.add("推薦奇幻番", classification(2, genres=["奇幻"]))
+    lookup(cache, "推薦奇幻番")["genres"].append("動作")
+    assert lookup(cache, "推薦奇幻番") == classification(2, genres=["奇幻"])
+
+
+def test_mentioned_genres_uses_synonyms():
+    assert mentioned_genres("Fantasy adventure please") == {"奇幻", "冒險"}
+    assert mentioned_genres("想看戀愛搞笑的") == {"浪漫", "喜劇"}
+    assert mentioned_genres("推薦動畫") == set()
@@ -0,0 +1,50 @@
+import sqlite3
+import threading
+
+from utils.database.catalog_version import CatalogVersions
+from utils.services import ServiceContainer
+
+
+class RecordingDatabase:
+    def __init__(self, conn):
+        self.conn = conn
+        self.refreshed = threading.Semaphore(0)
+        self.calls = 0
+
+    def get_connection(self):
+        return self.conn
+
+    def refresh_indexes(self):
+        self.calls += 1
+        self.refreshed.release()
+
+
+class RacingLock:
+    """第一次 release 前送出另一個變更通知（模擬在離開迴圈與釋放鎖之間到達的變更）"""
+
+    def __init__(self, on_first_release):
+        self._lock = threading.Lock()
+        self._on_first_release = on_first_release
+
+    def acquire(self, blocking=True):
+        return self._lock.acquire(blocking)
+
+    def release(self):
+        callback, self._on_first_release = self._on_first_release, None
+        if callback:
+            callback()
+        self._lock.release()
+
+
+def test_change_arriving_before_lock_release_is_not_lost(catalog_db):
+    container = ServiceContainer(str(catalog_db))
+    database = RecordingDatabase(sqlite3.connect(catalog_db, check_same_thread=False))
+    container._anime_db = database
+    versions = CatalogVersions(version=1, content_version=1)
+    container._refresh_lock = RacingLock(lambda: container._on_catalog_change(versions))
+
+    container._on_catalog_change(versions)
+
+    assert database.refreshed.acquire(timeout=5)
+    assert database.refreshed.acquire(timeout=5), "第二次變更沒有觸發重建"
+    assert database.calls == 2
@@ -0,0 +1,47 @@
+import sqlite3
+
+from utils.database.anime_queries import AnimeDatabase
+from utils.database.similar_index import SimilarAnimeIndex
+
+
+def similar_tables(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return {row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'anime_similar%'")}
+    finally:
+        conn.close()
+
+
+def test_request_does_not_build_similar_table(catalog_db):
+    db = AnimeDatabase(str(catalog_db))
+    results = db.recommend_similar_anime("鬼滅之刃", limit=5)
+    # 尚未建表：以標籤查詢補足，且不在請求中建表
+    assert results
+    assert all(anime["title"] != "鬼滅之刃" for anime in results)
+    assert similar_tables(catalog_db) == set()
+
+
+def test_reads_precomputed_neighbours(catalog_db):
+    db = AnimeDatabase(str(catalog_db))
+    SimilarAnimeIndex().rebuild(db.get_connection(), db.vector_index)
+    results = db.recommend_similar_anime("鬼滅之刃", limit=3)
+    assert len(results) == 3
+    assert all("similarity_score" in anime for anime in results)
+    assert [anime["similarity_score"] for anime in results] == sorted(
+        (anime["similarity_score"] for anime in results), reverse=True)
+
+
+def test_stale_table_falls_back_without_rebuild(catalog_db):
+    db = AnimeDatabase(str(catalog_db))
+    conn = db.get_connection()
+    SimilarAnimeIndex().rebuild(conn, db.vector_index)
+    with conn:
+        conn.execute("UPDATE anime SET synopsis = '新的簡介' WHERE title = '進擊的巨人'")
+    built_at = conn.execute("SELECT built_at FROM anime_similar_state").fetchone()[0]
+
+    results = db.recommend_similar_anime("鬼滅之刃", limit=3)
+    assert len(results) == 3
+    assert all("similarity_score" not in anime for anime in results)
+    assert conn.execute("SELECT built_at FROM anime_similar_state").fetchone()[0] == built_at
+    assert not db.similar_index.is_current(conn)
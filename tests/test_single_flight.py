@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.single_flight import AsyncSingleFlight, SingleFlight
+
+WAITERS = 4
+
+
+def run_concurrently(flight, key_for, compute):
+    """同時送出 WAITERS 個請求；所有請求都開始計算或進入等待後才讓計算完成"""
+    computing = []
+    release = threading.Event()
+
+    def blocking_compute():
+        computing.append(1)
+        release.wait(5)
+        return compute()
+
+    with ThreadPoolExecutor(WAITERS) as pool:
+        futures = [pool.submit(flight.do, key_for(0), blocking_compute)]
+        while not computing:
+            time.sleep(0.001)
+        futures += [pool.submit(flight.do, key_for(i), blocking_compute) for i in range(1, WAITERS)]
+        deadline = time.monotonic() + 5
+        while len(computing) + flight.stats()["shared"] < WAITERS and time.monotonic() < deadline:
+            time.sleep(0.001)
+        release.set()
+        return [future.exception() or future.result() for future in futures]
+
+
+def test_identical_requests_share_one_computation():
+    flight = SingleFlight("test", enabled=True)
+    calls = []
+    results = run_concurrently(flight, lambda i: "key", lambda: calls.append(1) or {"picks": [1, 2]})
+
+    assert calls == [1]
+    assert results == [{"picks": [1, 2]}] * WAITERS
+    # 每個呼叫者取得獨立的拷貝
+    results[0]["picks"].append(3)
+    assert results[1] == {"picks": [1, 2]}
+    assert flight.stats() == {"enabled": True, "executed": 1, "shared": WAITERS - 1, "in_flight": 0}
+
+
+def test_different_keys_are_not_coalesced():
+    flight = SingleFlight("test", enabled=True)
+    results = run_concurrently(flight, lambda i: f"key-{i}", lambda: "value")
+    assert results == ["value"] * WAITERS
+    assert flight.stats()["executed"] == WAITERS
+
+
+def test_failure_reaches_every_waiter_and_is_not_cached():
+    flight = SingleFlight("test", enabled=True)
+
+    def fail():
+        raise RuntimeError("LLM 逾時")
+
+    results = run_concurrently(flight, lambda i: "key", fail)
+    assert all(isinstance(error, RuntimeError) for error in results)
+    assert flight.do("key", lambda: "retry") == "retry"
+    assert flight.stats()["executed"] == 2
+
+
+def test_completed_results_are_not_cached():
+    flight = SingleFlight("test", enabled=True)
+    assert flight.do("key", lambda: 1) == 1
+    assert flight.do("key", lambda: 2) == 2
+    assert flight.stats() == {"enabled": True, "executed": 2, "shared": 0, "in_flight": 0}
+
+
+def test_disabled_flight_runs_every_call():
+    flight = SingleFlight("test", enabled=False)
+    calls = []
+    run_concurrently(flight, lambda i: "key", lambda: calls.append(1))
+    assert len(calls) == WAITERS
+    assert flight.stats()["executed"] == 0
+
+
+def test_async_followers_share_result_copies_and_failures():
+    flight = AsyncSingleFlight("test", enabled=True)
+
+    async def scenario():
+        release = asyncio.Event()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await release.wait()
+            return {"picks": [1]}
+
+        async def fail():
+            await release.wait()
+            raise RuntimeError("LLM 逾時")
+
+        tasks = [asyncio.create_task(flight.do("ok", compute)) for _ in range(WAITERS)]
+        tasks += [asyncio.create_task(flight.do("fail", fail)) for _ in range(WAITERS)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        return calls, results
+
+    calls, results = asyncio.run(scenario())
+    ok, failed = results[:WAITERS], results[WAITERS:]
+    assert calls == [1]
+    assert ok == [{"picks": [1]}] * WAITERS and len({id(result) for result in ok}) == WAITERS
+    assert all(isinstance(error, RuntimeError) for error in failed)
+    assert flight.stats() == {"enabled": True, "executed": 2, "shared": 2 * (WAITERS - 1), "in_flight": 0}
@@ -0,0 +1,92 @@
+import threading
+import time
+
+import pytest
+
+import utils.integrated_input_classifier as classifier
+from utils.speculative import SpeculativeExecutor, branch_abandoned
+
+
+@pytest.fixture
+def slow_name_branch(monkeypatch):
+    """類型判斷立即返回 2；名稱提取會一直執行到 release 被設定（模擬很慢的 LLM 呼叫）"""
+    release = threading.Event()
+    started = threading.Event()
+    stopped_early = []
+
+    def extract_anime_name(user_input, max_retries=3):
+        started.set()
+        release.wait(5)
+        # 重試前檢查：分支已被放棄時不再送出請求
+        stopped_early.append(branch_abandoned())
+        return "不會被採用"
+
+    monkeypatch.setattr(classifier, "classify_request_type", lambda user_input, max_retries=3: 2)
+    monkeypatch.setattr(classifier, "extract_anime_name", extract_anime_name)
+    monkeypatch.setattr(classifier, "classify_genres", lambda user_input: ["奇幻"])
+    # 只夠一個請求同時使用的名額
+    executor = SpeculativeExecutor(max_workers=classifier.SPECULATIVE_BRANCHES, name="test")
+    monkeypatch.setattr(classifier, "_classification_executor", executor)
+    yield executor, release, started, stopped_early
+    release.set()
+
+
+def run_with_timeout(fn, timeout=2.0):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(fn()), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert result, "請求被其他請求未採用的分支阻塞"
+    return result[0]
+
+
+def test_losing_branch_does_not_block_next_request(slow_name_branch):
+    executor, release, started, stopped_early = slow_name_branch
+    first = classifier._classify_speculative("推薦奇幻番", 3, False)
+    assert first == {"type": 2, "anime_name": None, "genres": ["奇幻"]}
+    assert started.wait(2)
+
+    # 第一個請求的名稱提取仍在執行，但已放棄並釋出名額
+    assert executor.stats()["active"] == 0
+    second = run_with_timeout(lambda: classifier._classify_speculative("推薦奇幻番", 3, False))
+    assert second == first
+
+    release.set()
+    deadline = time.time() + 2
+    while len(stopped_early) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert stopped_early == [True, True]
+
+
+def test_abandoned_branch_waiting_for_slot_never_runs():
+    executor = SpeculativeExecutor(max_workers=1, name="test")
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def first():
+        calls.append("first")
+        started.set()
+        release.wait(5)
+        return "first"
+
+    running = executor.submit(first)
+    assert started.wait(2)
+    waiting = executor.submit(calls.append, "second")
+    waiting.abandon()
+    release.set()
+
+    assert running.result(2) == "first"
+    assert waiting.future.cancelled()
+    time.sleep(0.05)
+    assert calls == ["first"]
+    assert executor.stats()["active"] == 0
+    assert executor.stats()["abandoned"] == 1
+
+
+def test_branch_exception_is_raised_from_result():
+    executor = SpeculativeExecutor(max_workers=1, name="test")
+    branch = executor.submit(lambda: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        branch.result(2)
+    assert executor.stats()["active"] == 0
@@ -0,0 +1,57 @@
+import pytest
+
+from utils.llm_anime_selector import LLMAnimeSelector, StreamingSelection
+
+ANIME_LIST = [{'id': i, 'title': f"動畫{i}", 'total_score': score}
+              for i, score in enumerate([7.0, 9.5, 8.0, 6.0, 9.0], start=1)]
+RESPONSE = "2：節奏明快的冒險\n5: 角色塑造細膩\r\n1:輕鬆的日常"
+
+
+@pytest.fixture(scope="module")
+def selector():
+    return LLMAnimeSelector()
+
+
+def stream(selector, chunks, count=3):
+    selection = StreamingSelection(selector, ANIME_LIST, count)
+    items = []
+    for chunk in chunks:
+        items.extend(selection.feed(chunk))
+    items.extend(selection.finish())
+    return selection, [(anime['id'], reason) for anime, reason in items]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, len(RESPONSE)])
+def test_any_chunking_matches_full_response_parse(selector, chunk_size):
+    chunks = [RESPONSE[i:i + chunk_size] for i in range(0, len(RESPONSE), chunk_size)]
+    _, items = stream(selector, chunks)
+
+    indices, reasons = selector.parse_llm_response_with_reasons(RESPONSE.replace('：', ':'), len(ANIME_LIST))
+    assert items == [(ANIME_LIST[index]['id'], reason) for index, reason in zip(indices, reasons)]
+    assert items == [(2, "節奏明快的冒險"), (5, "角色塑造細膩"), (1, "輕鬆的日常")]
+
+
+def test_items_are_emitted_as_soon_as_a_line_completes(selector):
+    selection = StreamingSelection(selector, ANIME_LIST, 3)
+    assert selection.feed("2: 節奏") == []
+    assert [anime['id'] for anime, _ in selection.feed("明快\n5: 細")] == [2]
+    assert [anime['id'] for anime, _ in selection.finish()] == [5]
+    assert selection.finish() == []
+
+
+def test_skips_invalid_duplicate_and_extra_lines(selector):
+    response = "以下是推薦：\n0: 超出範圍\n9: 超出範圍\n二: 不是數字\n3:\n3: 重複\n4: 第二部\n1: 超過數量\n"
+    selection, items = stream(selector, [response], count=2)
+    # 理由為空時使用預設理由；超過 count 後不再產出
+    assert items == [(3, "為您精心挑選的優質作品"), (4, "第二部")]
+    assert selection.top_up() == []
+
+
+def test_fallback_only_when_nothing_was_selected(selector):
+    selection = StreamingSelection(selector, ANIME_LIST, 2)
+    assert [anime['id'] for anime, _ in selection.fallback()] == [2, 5]
+
+    selection, _ = stream(selector, ["3: 已選一部\n"], count=2)
+    assert selection.fallback() == []
+    # 數量不足時依總分補上未選過的動漫
+    assert [anime['id'] for anime, _ in selection.top_up()] == [2]
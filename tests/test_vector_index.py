@@ -0,0 +1,87 @@
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from utils.database.vector_index import AnimeVectorIndex, build_document, vector_store_path
+from utils.text_vectorizer import HashingNgramVectorizer
+
+
+def assert_rows_aligned(db_path):
+    """anime_embedding 的每一列都指向該動漫目前內容的向量"""
+    index = AnimeVectorIndex(vector_store_path(db_path))
+    conn = sqlite3.connect(db_path)
+    matrix = np.fromfile(index.store_path, dtype=np.float32).reshape(-1, index.vectorizer.dimensions)
+    rows = conn.execute("""
+        SELECT e.row, a.title, a.genres_json, a.synopsis
+        FROM anime_embedding e JOIN anime a ON a.id = e.anime_id
+    """).fetchall()
+    assert rows
+    for row, title, genres_json, synopsis in rows:
+        expected = index.vectorizer.transform_one(build_document(title, genres_json, synopsis), l2_normalize=False)
+        np.testing.assert_array_equal(matrix[row], expected)
+    conn.close()
+
+
+def test_concurrent_writers_keep_rows_aligned(catalog_db, monkeypatch):
+    conn = sqlite3.connect(catalog_db)
+    AnimeVectorIndex(vector_store_path(catalog_db)).sync(conn)
+    ids = [row[0] for row in conn.execute("SELECT id FROM anime ORDER BY id")]
+    conn.close()
+    halves = (ids[0::2], ids[1::2])
+
+    # 放慢向量計算，讓兩個寫入者的「讀取檔案大小 → 附加」區間重疊
+    transform = HashingNgramVectorizer.transform
+
+    def slow_transform(self, texts, l2_normalize=True):
+        time.sleep(0.05)
+        return transform(self, texts, l2_normalize)
+    monkeypatch.setattr(HashingNgramVectorizer, "transform", slow_transform)
+    # 寫入鎖正確時只會附加；列號錯位才會觸發整份重建
+    rebuilds = []
+    monkeypatch.setattr(AnimeVectorIndex, "rebuild", lambda self, conn, catalog=None: rebuilds.append(conn))
+
+    # 兩個各自持有連線與索引實例的寫入者（如匯入程序與服務程序）同時附加向量
+    # 每輪只改 4 部（兩個寫入者各 2 部），失效列不超過一半，不會觸發回收空間的重建
+    changed = ids[:4]
+    for round_number in range(4):
+        with sqlite3.connect(catalog_db) as update:
+            update.executemany("UPDATE anime SET synopsis = synopsis || ? WHERE id = ?",
+                               [(f" 第{round_number}輪", anime_id) for anime_id in changed])
+        barrier = threading.Barrier(2)
+        errors = []
+
+        def writer(anime_ids):
+            try:
+                writer_conn = sqlite3.connect(catalog_db, timeout=10)
+                index = AnimeVectorIndex(vector_store_path(catalog_db))
+                barrier.wait()
+                index.sync(writer_conn, anime_ids)
+                writer_conn.close()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=writer, args=(half,)) for half in halves]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+        assert rebuilds == []
+        assert_rows_aligned(catalog_db)
+
+
+def test_partial_trailing_row_triggers_rebuild(catalog_db):
+    conn = sqlite3.connect(catalog_db)
+    index = AnimeVectorIndex(vector_store_path(catalog_db))
+    index.sync(conn)
+    with open(index.store_path, 'ab') as f:
+        f.write(b'\0' * 10)
+
+    with conn:
+        conn.execute("UPDATE anime SET synopsis = '新的簡介' WHERE id = 1")
+    index.sync(conn, [1])
+    assert_rows_aligned(catalog_db)
+    assert os.path.getsize(index.store_path) % (4 * index.vectorizer.dimensions) == 0
@@ -14,6 +14,14 @@ import json
 from typing import List, Dict, Optional, Tuple
 from difflib import SequenceMatcher
 
+from utils.database.connection import get_connection
+from utils.database.genre_index import GenreIndex
+from utils.database.image_manifest import ImageManifest
+from utils.database.similar_index import SimilarAnimeIndex
+from utils.database.title_index import TitleIndex, TitleEntry
+from utils.database.title_normalizer import normalize_title, extract_base_title
+from utils.database.vector_index import AnimeVectorIndex, vector_store_path
+
 class AnimeDatabase:
     def __init__(self, db_path: str):
         self.db_path = db_path
@@ -21,93 +29,41 @@ class AnimeDatabase:
         self.TAG_BONUS_SCORE = 0.5
         # 最低評分門檻
         self.MIN_RATING_THRESHOLD = 2.0
+        # 標題索引（第一次標題查詢時建立，資料表變更時才重建）
+        self.title_index = TitleIndex(self.normalize_title, self.extract_base_title)
+        # 標籤位元索引（第一次標籤查詢時建立，資料表變更時才重建）
+        self.genre_index = GenreIndex()
+        # 標題 / 類型 / 簡介向量索引（自由描述查詢使用，向量檔案與資料庫放在同一目錄）
+        self.vector_index = AnimeVectorIndex(vector_store_path(db_path))
+        # 預先計算的相似動漫表（anime_similar，資料表變更時才重建）
+        self.similar_index = SimilarAnimeIndex()
+        # 封面圖片清單（anime_image，目錄版本變更時重新載入）
+        self.image_manifest = ImageManifest()
     
     def get_connection(self):
-        """建立資料庫連接"""
-        return sqlite3.connect(self.db_path)
+        """取得目前執行緒的共用資料庫連接（由 connection 模組管理，請勿 close）"""
+        return get_connection(self.db_path)
+    
+    def refresh_indexes(self) -> None:
+        """預先建立（或在資料表變更後重建）標題、標籤、向量索引、相似動漫表與封面清單，供服務啟動時暖機"""
+        conn = self.get_connection()
+        self.title_index.refresh(conn)
+        self.genre_index.refresh(conn)
+        self.vector_index.refresh(conn)
+        self.similar_index.refresh(conn, self.vector_index)
+        self.image_manifest.refresh(conn)
     
     def normalize_title(self, title: str) -> str:
         """
         標準化標題，處理常見的變體
         
-        基於實際資料庫分析結果，處理各種季數表示方法：
-        - 中文季數：第一季、第二季等
-        - 英文季數：1st Season、2nd Season等
-        - 其他格式：第二幕、第二季度、續篇等
+        實作見 title_normalizer.normalize_title（編譯後的單一正則 + LRU 快取）
         """
-        if not title:
-            return ""
-        
-        # 移除多餘空格
-        title = re.sub(r'\s+', ' ', title.strip())
-        
-        # 處理季數的各種表示方法 - 根據實際資料庫內容擴展
-        season_mappings = {
-            # 中文數字季數
-            '第一季': '第1季',
-            '第二季': '第2季', 
-            '第三季': '第3季',
-            '第四季': '第4季',
-            '第五季': '第5季',
-            '第六季': '第6季',
-            '第七季': '第7季',
-            '第八季': '第8季',
-            '第九季': '第9季',
-            '第十季': '第10季',
-            
-            # 英文季數轉換
-            '1st Season': '第1季',
-            '2nd Season': '第2季',
-            '3rd Season': '第3季',
-            '4th Season': '第4季',
-            '5th Season': '第5季',
-            
-            # 其他格式
-            '第二幕': '第2季',
-            '第三幕': '第3季',
-            '第二季度': '第2季',
-            '第三季度': '第3季',
-            '第二部份': '第2季',
-            '第三部份': '第3季',
-            '續篇': '第2季',
-            
-            # 簡化格式
-            'Season 1': '第1季',
-            'Season 2': '第2季',
-            'Season 3': '第3季',
-            'S1': '第1季',
-            'S2': '第2季',
-            'S3': '第3季',
-        }
-        
-        normalized_title = title
-        for old_format, new_format in season_mappings.items():
-            normalized_title = normalized_title.replace(old_format, new_format)
-        
-        return normalized_title
+        return normalize_title(title)
     
     def extract_base_title(self, title: str) -> str:
         """提取動漫的基礎標題（去除季數等後綴）"""
-        normalized = self.normalize_title(title)
-        
-        # 移除季數相關的後綴
-        patterns_to_remove = [
-            r'\s*第\d+季\s*$',
-            r'\s*\d+(st|nd|rd|th)\s+Season\s*$',
-            r'\s*Season\s+\d+\s*$',
-            r'\s*第[一二三四五六七八九十]+季\s*$',
-            r'\s*第\d+季度\s*$',
-            r'\s*第\d+部份?\s*$',
-            r'\s*續篇\s*$',
-            r'\s*S\d+\s*$',
-            r'\s*-.*-\s*$',  # 處理副標題
-        ]
-        
-        base_title = normalized
-        for pattern in patterns_to_remove:
-            base_title = re.sub(pattern, '', base_title, flags=re.IGNORECASE)
-        
-        return base_title.strip()
+        return extract_base_title(title)
     
     def calculate_similarity(self, query: str, db_title: str) -> float:
         """
@@ -119,37 +75,50 @@ class AnimeDatabase:
         3. 基礎標題相似度（去除季數）
         4. 特殊匹配規則加分
         """
-        # 基本字串相似度
-        basic_similarity = SequenceMatcher(None, query.lower(), db_title.lower()).ratio()
-        
-        # 標準化後的相似度
-        norm_query = self.normalize_title(query)
-        norm_db_title = self.normalize_title(db_title)
-        normalized_similarity = SequenceMatcher(None, norm_query.lower(), norm_db_title.lower()).ratio()
-        
-        # 基礎標題相似度（去除季數）
-        base_query = self.extract_base_title(query)
-        base_db_title = self.extract_base_title(db_title)
-        base_similarity = SequenceMatcher(None, base_query.lower(), base_db_title.lower()).ratio()
+        return self._score_title_entry(
+            self.title_index.make_query_entry(query),
+            self.title_index.make_query_entry(db_title),
+        )
+    
+    def _score_title_entry(self, query: TitleEntry, entry: TitleEntry,
+                           threshold: float = 0.0) -> float:
+        """
+        以預先計算的標題變體計算相似度（規則同 calculate_similarity）
+
+        若相似度上限（以字串長度估算）仍低於 threshold，直接返回 0.0，
+        省去 SequenceMatcher 的計算。
+        """
+        # 如果標準化後完全匹配
+        if query.normalized_lower == entry.normalized_lower:
+            return 1.0
         
         # 特殊匹配規則
         bonus_score = 0
         
         # 如果基礎標題完全匹配，給予高分
-        if base_query.lower() == base_db_title.lower() and base_query:
+        if query.base_lower == entry.base_lower and query.base_title:
             bonus_score += 0.3
         
         # 如果其中一個包含另一個，給予加分
-        if (base_query.lower() in base_db_title.lower() or 
-            base_db_title.lower() in base_query.lower()) and len(base_query) > 2:
+        if (query.base_lower in entry.base_lower or 
+            entry.base_lower in query.base_lower) and len(query.base_title) > 2:
             bonus_score += 0.2
         
-        # 如果標準化後完全匹配
-        if norm_query.lower() == norm_db_title.lower():
-            return 1.0
+        pairs = (
+            (query.title_lower, entry.title_lower),            # 基本字串相似度
+            (query.normalized_lower, entry.normalized_lower),  # 標準化後的相似度
+            (query.base_lower, entry.base_lower),              # 基礎標題相似度（去除季數）
+        )
+        matchers = [SequenceMatcher(None, a, b) for a, b in pairs]
+        
+        # real_quick_ratio 為 ratio 的上限，足以排除不可能達標的項目
+        if threshold > 0:
+            upper_bound = max(m.real_quick_ratio() for m in matchers) + bonus_score
+            if upper_bound < threshold:
+                return 0.0
         
         # 綜合相似度計算
-        final_similarity = max(basic_similarity, normalized_similarity, base_similarity) + bonus_score
+        final_similarity = max(m.ratio() for m in matchers) + bonus_score
         
         return min(1.0, final_similarity)
     
@@ -181,43 +150,52 @@ class AnimeDatabase:
             # 指定季度查詢
             results = db.query_anime_by_title("動漫名稱", season="2024-Fall")
         """
+        # 處理季度代碼 (允許格式: 2024-1, 2024_1, 2024Q1, 2024-Winter, 2024-Winter 類型)
+        db_season = None
+        if season:
+            db_season = self._convert_season_code(season)
+
         with self.get_connection() as conn:
-            cursor = conn.cursor()
+            # 資料表有變更時才重建標題索引
+            self.title_index.refresh(conn)
+            query_entry = self.title_index.make_query_entry(query_title)
+            
+            # 先以 n-gram 倒排索引挑出候選，再以預先計算的標題變體計算相似度並篩選
+            scored = []
+            for entry in self.title_index.shortlist(query_entry, db_season):
+                similarity = self._score_title_entry(query_entry, entry, similarity_threshold)
+                if similarity >= similarity_threshold:
+                    scored.append((similarity, entry))
             
-            # 處理季度代碼 (允許格式: 2024-1, 2024_1, 2024Q1, 2024-Winter, 2024-Winter 類型)
-            db_season = None
-            if season:
-                db_season = self._convert_season_code(season)
-
-            # 根據是否指定季度來構建查詢
-            if db_season:
-                cursor.execute("SELECT * FROM anime WHERE season = ?", (db_season,))
-            else:
-                cursor.execute("SELECT * FROM anime")
-            all_anime = cursor.fetchall()
+            # 按相似度排序（降序）
+            scored.sort(key=lambda x: x[0], reverse=True)
+            scored = scored[:limit]
+            if not scored:
+                return []
             
-            # 獲取欄位名稱
+            # 只為最終結果讀取完整資料列
+            cursor = conn.cursor()
+            ids = [entry.anime_id for _, entry in scored]
+            placeholders = ",".join("?" * len(ids))
+            cursor.execute(f"SELECT * FROM anime WHERE id IN ({placeholders})", ids)
             column_names = [description[0] for description in cursor.description]
+            rows_by_id = {}
+            for row in cursor.fetchall():
+                anime_dict = dict(zip(column_names, row))
+                rows_by_id[anime_dict['id']] = anime_dict
             
-            # 計算相似度並篩選
             results = []
-            for anime_row in all_anime:
-                anime_dict = dict(zip(column_names, anime_row))
-                db_title = anime_dict.get('title', '')
-                
-                similarity = self.calculate_similarity(query_title, db_title)
-                
-                if similarity >= similarity_threshold:
-                    anime_dict['similarity_score'] = similarity
-                    anime_dict['query_title'] = query_title
-                    anime_dict['matched_title'] = db_title
-                    anime_dict['base_title'] = self.extract_base_title(db_title)
-                    results.append(anime_dict)
-            
-            # 按相似度排序（降序）
-            results.sort(key=lambda x: x['similarity_score'], reverse=True)
+            for similarity, entry in scored:
+                anime_dict = rows_by_id.get(entry.anime_id)
+                if anime_dict is None:
+                    continue
+                anime_dict['similarity_score'] = similarity
+                anime_dict['query_title'] = query_title
+                anime_dict['matched_title'] = entry.title
+                anime_dict['base_title'] = entry.base_title
+                results.append(anime_dict)
             
-            return results[:limit]
+            return results
     
     def query_anime_by_tags(self, 
                            tags: List[str], 
@@ -249,86 +227,111 @@ class AnimeDatabase:
             # 指定季度查詢
             results = db.query_anime_by_tags(["奇幻"], season="2024-Fall")
         """
-        print("season")
         if tag_bonus is None:
             tag_bonus = self.TAG_BONUS_SCORE
         if min_rating is None:
             min_rating = self.MIN_RATING_THRESHOLD
-        print("season")
+        
+        # 處理季度代碼
+        db_season = None
+        if season:
+            db_season = self._convert_season_code(season)
+
         with self.get_connection() as conn:
-            cursor = conn.cursor()
+            # 資料表有變更時才重建標籤索引
+            self.genre_index.refresh(conn)
             
-            # 處理季度代碼
-            db_season = None
-            if season:
-                db_season = self._convert_season_code(season)
-
-            # 根據是否指定季度來構建查詢
-            if db_season:
-                cursor.execute("SELECT * FROM anime WHERE rating >= ? AND season = ?", (min_rating, db_season))
-            else:
-                cursor.execute("SELECT * FROM anime WHERE rating >= ?", (min_rating,))
-            all_qualified_anime = cursor.fetchall()
+            # 以標籤矩陣向量化計算匹配數與總分（評分、季度篩選以遮罩套用）
+            top = self.genre_index.top_matches(tags, limit, tag_bonus, min_rating, db_season)
+            if not top:
+                return []
+            
+            # 只為最終結果讀取完整資料列
+            cursor = conn.cursor()
+            ids = [anime_id for anime_id, _, _, _ in top]
+            placeholders = ",".join("?" * len(ids))
+            cursor.execute(f"SELECT * FROM anime WHERE id IN ({placeholders})", ids)
             column_names = [description[0] for description in cursor.description]
+            rows_by_id = {}
+            for row in cursor.fetchall():
+                anime_dict = dict(zip(column_names, row))
+                rows_by_id[anime_dict['id']] = anime_dict
             
-            # 計算每部動漫的總分
             results = []
-            for anime_row in all_qualified_anime:
-                anime_dict = dict(zip(column_names, anime_row))
-                
-                # 解析標籤JSON
-                genres_json = anime_dict.get('genres_json', '[]')
-                try:
-                    anime_genres = json.loads(genres_json) if genres_json else []
-                    # 轉換為小寫以便比較
-                    anime_genres_lower = [genre.lower() for genre in anime_genres]
-                except (json.JSONDecodeError, TypeError):
-                    anime_genres_lower = []
-                
-                # 計算匹配的標籤數量
-                matched_tags = 0
-                matched_tag_list = []
-                
-                for tag in tags:
-                    if tag.lower() in anime_genres_lower:
-                        matched_tags += 1
-                        matched_tag_list.append(tag)
+            for anime_id, matched_tags, total_score, anime_genres in top:
+                anime_dict = rows_by_id.get(anime_id)
+                if anime_dict is None:
+                    continue
+                anime_genres_lower = [genre.lower() for genre in anime_genres]
+                base_rating = anime_dict.get('rating', 0)
                 
-                # 只保留至少匹配一個標籤的動漫
-                if matched_tags > 0:
-                    # 計算總分：基礎評分 + 標籤加分
-                    base_rating = anime_dict.get('rating', 0)
-                    tag_bonus_score = matched_tags * tag_bonus
-                    total_score = base_rating + tag_bonus_score
-                    
-                    anime_dict['matched_tags'] = matched_tag_list
-                    anime_dict['matched_tag_count'] = matched_tags
-                    anime_dict['tag_bonus_score'] = tag_bonus_score
-                    anime_dict['total_score'] = total_score
-                    anime_dict['base_rating'] = base_rating
-                    anime_dict['anime_genres'] = anime_genres  # 原始標籤列表
-                    results.append(anime_dict)
-            
-            # 按總分排序（降序）
-            results.sort(key=lambda x: x['total_score'], reverse=True)
-            
-            return results[:limit]
+                anime_dict['matched_tags'] = [tag for tag in tags if tag.lower() in anime_genres_lower]
+                anime_dict['matched_tag_count'] = matched_tags
+                anime_dict['tag_bonus_score'] = matched_tags * tag_bonus
+                anime_dict['total_score'] = total_score
+                anime_dict['base_rating'] = base_rating
+                anime_dict['anime_genres'] = anime_genres  # 原始標籤列表
+                results.append(anime_dict)
+            
+            return results
     
-    def get_all_genres(self) -> List[str]:
-        """獲取資料庫中所有的標籤類別"""
+    def query_anime_by_text(self, query: str, limit: int = 10, season: str = None) -> List[Dict]:
+        """
+        以自由描述查詢動漫（標題、類型與簡介的 TF-IDF 向量相似度）
+
+        Args:
+            query: 用戶描述（如：「想看輕鬆治癒的日常番」）
+            limit: 返回結果數量限制
+            season: 季度篩選 (可選)。接受格式同 query_anime_by_title 的 season 參數。
+
+        Returns:
+            動漫列表（含 similarity_score 與 anime_genres），按相似度排序
+        """
+        db_season = None
+        if season:
+            db_season = self._convert_season_code(season)
+
         with self.get_connection() as conn:
+            # 資料表有變更時才重新檢查向量檔案
+            self.vector_index.refresh(conn)
+            top = self.vector_index.search(query, limit=limit, season=db_season)
+            if not top:
+                return []
+
             cursor = conn.cursor()
-            cursor.execute("SELECT DISTINCT genres_json FROM anime WHERE genres_json IS NOT NULL")
-            
-            all_genres = set()
+            ids = [anime_id for anime_id, _ in top]
+            placeholders = ",".join("?" * len(ids))
+            cursor.execute(f"SELECT * FROM anime WHERE id IN ({placeholders})", ids)
+            column_names = [description[0] for description in cursor.description]
+            rows_by_id = {}
             for row in cursor.fetchall():
+                anime_dict = dict(zip(column_names, row))
+                rows_by_id[anime_dict['id']] = anime_dict
+
+            results = []
+            for anime_id, score in top:
+                anime_dict = rows_by_id.get(anime_id)
+                if anime_dict is None:
+                    continue
                 try:
-                    genres = json.loads(row[0])
-                    all_genres.update(genres)
+                    anime_dict['anime_genres'] = json.loads(anime_dict.get('genres_json') or '[]')
                 except (json.JSONDecodeError, TypeError):
-                    continue
-            
-            return sorted(list(all_genres))
+                    anime_dict['anime_genres'] = []
+                anime_dict['similarity_score'] = score
+                results.append(anime_dict)
+
+            return results
+
+    def get_all_genres(self) -> List[str]:
+        """獲取資料庫中所有的標籤類別"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT g.name FROM genre g
+                WHERE EXISTS (SELECT 1 FROM anime_genre ag WHERE ag.genre_id = g.id)
+                ORDER BY g.name
+            """)
+            return [row[0] for row in cursor.fetchall()]
     
     def get_anime_statistics(self) -> Dict:
         """獲取資料庫統計資訊"""
@@ -404,12 +407,12 @@ class AnimeDatabase:
             season: 可選季度過濾
             
         Returns:
-            推薦的動漫列表 (按標籤匹配度排序)
+            推薦的動漫列表 (按相似度排序，含 similarity_score 與標籤匹配資訊)
             
         流程:
             1. 透過 query_anime_by_title 找到指定動漫
-            2. 提取該動漫的 genres_json 作為標籤
-            3. 使用這些標籤透過 query_anime_by_tags 找相似動漫
+            2. 由預先計算的 anime_similar 表讀取相似作品（季度篩選以 JOIN 套用；表尚未更新時略過）
+            3. 不足 limit 部時，以該動漫的標籤透過 query_anime_by_tags 補足
             4. 排除原本搜尋的動漫本身
         """
         # 步驟1: 先找到指定的動漫
@@ -418,33 +421,75 @@ class AnimeDatabase:
             return []
         
         target_anime = search_results[0]
+        target_title = target_anime.get('title', '').lower()
+        target_id = target_anime.get('id')
         
-        # 步驟2: 提取該動漫的標籤
+        # 提取該動漫的標籤
         try:
             genres_json = target_anime.get('genres_json', '[]')
             anime_tags = json.loads(genres_json) if genres_json else []
         except (json.JSONDecodeError, TypeError):
             anime_tags = []
+        anime_tags_lower = {tag.lower() for tag in anime_tags}
+        
+        # 處理季度代碼
+        db_season = None
+        if season:
+            db_season = self._convert_season_code(season)
+        
+        # 步驟2: 一次索引查詢取得預先計算的相似作品
+        # anime_similar 由匯入與背景重建索引負責更新；尚未依目前內容重建時，直接以標籤查詢補足
+        rows = []
+        conn = self.get_connection()
+        if self.similar_index.is_current(conn):
+            sql = """
+                SELECT a.*, s.score AS similarity_score
+                FROM anime_similar s
+                JOIN anime a ON a.id = s.neighbor_id
+                WHERE s.anime_id = ? AND a.rating >= ?
+            """
+            params = [target_id, self.MIN_RATING_THRESHOLD]
+            if db_season:
+                sql += " AND a.season = ?"
+                params.append(db_season)
+            sql += " ORDER BY s.score DESC, a.id LIMIT ?"
+            params.append(limit)
+            cursor = conn.execute(sql, params)
+            column_names = [description[0] for description in cursor.description]
+            rows = [dict(zip(column_names, row)) for row in cursor.fetchall()]
         
-        if not anime_tags:
-            return []
-        # 步驟3: 使用標籤查詢相似動漫
+        filtered_results = []
+        for anime_dict in rows:
+            try:
+                anime_genres = json.loads(anime_dict.get('genres_json') or '[]')
+            except (json.JSONDecodeError, TypeError):
+                anime_genres = []
+            matched_tags = [tag for tag in anime_genres if tag.lower() in anime_tags_lower]
+            base_rating = anime_dict.get('rating', 0)
+            anime_dict['matched_tags'] = matched_tags
+            anime_dict['matched_tag_count'] = len(matched_tags)
+            anime_dict['tag_bonus_score'] = len(matched_tags) * self.TAG_BONUS_SCORE
+            anime_dict['total_score'] = base_rating + anime_dict['tag_bonus_score']
+            anime_dict['base_rating'] = base_rating
+            anime_dict['anime_genres'] = anime_genres
+            filtered_results.append(anime_dict)
+        
+        if len(filtered_results) >= limit or not anime_tags:
+            return filtered_results
+        
+        # 步驟3: 季度篩選後相似作品不足，使用標籤查詢補足
+        seen_ids = {anime['id'] for anime in filtered_results}
         similar_results = self.query_anime_by_tags(
             tags=anime_tags, 
-            limit=limit + 5,  # 多取一些，排除原動漫後可能不足
+            limit=limit + len(seen_ids) + 5,  # 多取一些，排除原動漫與已選作品後可能不足
             season=season
         )
-        #print(similar_results)
         
         # 步驟4: 排除原本的動漫 (比較 title 或 id)
-        target_title = target_anime.get('title', '').lower()
-        target_id = target_anime.get('id')
-        
-        filtered_results = []
         for anime in similar_results:
             # 排除相同的動漫
             if (anime.get('title', '').lower() != target_title and 
-                anime.get('id') != target_id):
+                anime.get('id') != target_id and anime.get('id') not in seen_ids):
                 filtered_results.append(anime)
                 
             # 達到所需數量就停止
@@ -457,8 +502,8 @@ class AnimeDatabase:
         """
         檢查並添加 like 欄位到 anime 表格
         """
+        conn = self.get_connection()
         try:
-            conn = self.get_connection()
             cursor = conn.cursor()
             
             # 檢查是否已經有 like 欄位
@@ -474,10 +519,8 @@ class AnimeDatabase:
                 print("ℹ️ 'like' column already exists in anime table")
                 
         except sqlite3.Error as e:
+            conn.rollback()
             print(f"❌ Error adding like column: {e}")
-        finally:
-            if conn:
-                conn.close()
     
     def update_anime_like_status(self, anime_id: int, liked: bool) -> bool:
         """
@@ -490,8 +533,8 @@ class AnimeDatabase:
         Returns:
             bool: 操作是否成功
         """
+        conn = self.get_connection()
         try:
-            conn = self.get_connection()
             cursor = conn.cursor()
             
             # 檢查動漫是否存在
@@ -503,6 +546,7 @@ class AnimeDatabase:
             # 更新喜愛狀態
             cursor.execute("UPDATE anime SET `like` = ? WHERE id = ?", 
                           (1 if liked else 0, anime_id))
+            # 目錄版本由觸發器遞增，列表 API 的快取隨之失效
             conn.commit()
             
             status = "liked" if liked else "unliked"
@@ -510,11 +554,9 @@ class AnimeDatabase:
             return True
             
         except sqlite3.Error as e:
+            conn.rollback()
             print(f"❌ Error updating like status: {e}")
             return False
-        finally:
-            if conn:
-                conn.close()
     
     def get_liked_anime(self, limit: int = 20) -> List[Dict]:
         """
@@ -526,15 +568,15 @@ class AnimeDatabase:
         Returns:
             List[Dict]: 喜愛的動漫列表
         """
+        conn = self.get_connection()
         try:
-            conn = self.get_connection()
             cursor = conn.cursor()
             
             query = """
-            SELECT id, title, genres, rating, viewers, season, year, status, image_url
+            SELECT id, title, genres_json, rating, viewers_count, viewers_numeric, season, image_path
             FROM anime 
             WHERE `like` = 1 
-            ORDER BY rating DESC, viewers DESC
+            ORDER BY rating DESC, viewers_numeric DESC
             LIMIT ?
             """
             
@@ -545,11 +587,10 @@ class AnimeDatabase:
             for row in cursor.fetchall():
                 anime_dict = dict(zip(columns, row))
                 # 解析genres JSON
-                if anime_dict.get('genres'):
-                    try:
-                        anime_dict['genres'] = json.loads(anime_dict['genres'])
-                    except json.JSONDecodeError:
-                        anime_dict['genres'] = []
+                try:
+                    anime_dict['genres'] = json.loads(anime_dict['genres_json']) if anime_dict.get('genres_json') else []
+                except json.JSONDecodeError:
+                    anime_dict['genres'] = []
                 results.append(anime_dict)
             
             print(f"✅ Found {len(results)} liked anime")
@@ -558,9 +599,6 @@ class AnimeDatabase:
         except sqlite3.Error as e:
             print(f"❌ Error getting liked anime: {e}")
             return []
-        finally:
-            if conn:
-                conn.close()
     
     def get_anime_like_status(self, anime_id: int) -> Optional[bool]:
         """
@@ -572,8 +610,8 @@ class AnimeDatabase:
         Returns:
             Optional[bool]: True表示喜歡，False表示不喜歡，None表示動漫不存在
         """
+        conn = self.get_connection()
         try:
-            conn = self.get_connection()
             cursor = conn.cursor()
             
             cursor.execute("SELECT `like` FROM anime WHERE id = ?", (anime_id,))
@@ -587,9 +625,6 @@ class AnimeDatabase:
         except sqlite3.Error as e:
             print(f"❌ Error getting like status: {e}")
             return None
-        finally:
-            if conn:
-                conn.close()
 
 # 便利函數
 def create_anime_db(db_path: str = "anime_database.db") -> AnimeDatabase:
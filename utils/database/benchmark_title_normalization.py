@@ -0,0 +1,132 @@
+"""標題標準化微基準測試
+
+比較舊版（逐一 str.replace + 每次 re.sub）與 title_normalizer（單一編譯正則 + LRU 快取）
+在實際 anime_database.db 標題上的每次呼叫耗時，並確認兩者輸出完全一致。
+
+使用方式：
+python utils/database/benchmark_title_normalization.py
+python utils/database/benchmark_title_normalization.py --db anime_database.db --repeat 20
+
+輸出項目：
+- legacy      : 舊版實作（每次呼叫都重新計算）
+- compiled    : 新版實作但清空快取（每次呼叫都重新計算，只看正則合併的效益）
+- memoized    : 新版實作，快取已暖（實際查詢時的情況）
+"""
+from __future__ import annotations
+import re
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List
+
+try:  # 嘗試套件式相對匯入
+    from .create_schema import DB_PATH  # type: ignore
+    from .title_normalizer import SEASON_MAPPINGS, normalize_title, extract_base_title  # type: ignore
+except Exception:  # 直接執行時會失敗：attempted relative import
+    ROOT = Path(__file__).resolve().parents[2]  # 專案根目錄
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+    from utils.database.create_schema import DB_PATH  # type: ignore
+    from utils.database.title_normalizer import SEASON_MAPPINGS, normalize_title, extract_base_title  # type: ignore
+
+LEGACY_SUFFIX_PATTERNS = [
+    r'\s*第\d+季\s*$',
+    r'\s*\d+(st|nd|rd|th)\s+Season\s*$',
+    r'\s*Season\s+\d+\s*$',
+    r'\s*第[一二三四五六七八九十]+季\s*$',
+    r'\s*第\d+季度\s*$',
+    r'\s*第\d+部份?\s*$',
+    r'\s*續篇\s*$',
+    r'\s*S\d+\s*$',
+    r'\s*-.*-\s*$',
+]
+
+
+def legacy_normalize_title(title: str) -> str:
+    """舊版 AnimeDatabase.normalize_title（逐一 str.replace）"""
+    if not title:
+        return ""
+    title = re.sub(r'\s+', ' ', title.strip())
+    normalized_title = title
+    for old_format, new_format in SEASON_MAPPINGS.items():
+        normalized_title = normalized_title.replace(old_format, new_format)
+    return normalized_title
+
+
+def legacy_extract_base_title(title: str) -> str:
+    """舊版 AnimeDatabase.extract_base_title（每次 re.sub）"""
+    base_title = legacy_normalize_title(title)
+    for pattern in LEGACY_SUFFIX_PATTERNS:
+        base_title = re.sub(pattern, '', base_title, flags=re.IGNORECASE)
+    return base_title.strip()
+
+
+def load_titles(db_path: Path) -> List[str]:
+    conn = sqlite3.connect(db_path.as_posix())
+    try:
+        return [row[0] for row in conn.execute("SELECT title FROM anime") if row[0]]
+    finally:
+        conn.close()
+
+
+def time_per_call(func: Callable[[str], str], titles: List[str], repeat: int,
+                  before_each: Callable[[], None] = None) -> float:
+    """返回每次呼叫的平均耗時（微秒）"""
+    calls = 0
+    elapsed = 0.0
+    for _ in range(repeat):
+        if before_each:
+            before_each()
+        start = time.perf_counter()
+        for title in titles:
+            func(title)
+        elapsed += time.perf_counter() - start
+        calls += len(titles)
+    return elapsed / calls * 1e6
+
+
+def clear_caches() -> None:
+    normalize_title.cache_clear()
+    extract_base_title.cache_clear()
+
+
+def run(db_path: Path = DB_PATH, repeat: int = 20) -> None:
+    titles = load_titles(db_path)
+    if not titles:
+        print(f"⚠️ 資料庫沒有任何標題: {db_path}")
+        return
+
+    # 先確認輸出一致
+    mismatches = [t for t in titles
+                  if legacy_normalize_title(t) != normalize_title(t)
+                  or legacy_extract_base_title(t) != extract_base_title(t)]
+    if mismatches:
+        print(f"❌ 有 {len(mismatches)} 個標題輸出不一致，例如: {mismatches[:3]}")
+    else:
+        print(f"✅ {len(titles)} 個標題輸出一致")
+
+    print(f"📊 每次呼叫平均耗時（微秒，{len(titles)} 個標題 × {repeat} 輪）")
+    for name, legacy, current in (
+        ("normalize_title", legacy_normalize_title, normalize_title),
+        ("extract_base_title", legacy_extract_base_title, extract_base_title),
+    ):
+        legacy_us = time_per_call(legacy, titles, repeat)
+        compiled_us = time_per_call(current, titles, repeat, before_each=clear_caches)
+        clear_caches()
+        for title in titles:
+            current(title)
+        memoized_us = time_per_call(current, titles, repeat)
+        print(f"  {name}:")
+        print(f"    legacy   {legacy_us:8.2f} µs")
+        print(f"    compiled {compiled_us:8.2f} µs  ({legacy_us / compiled_us:.1f}x)")
+        print(f"    memoized {memoized_us:8.2f} µs  ({legacy_us / memoized_us:.1f}x)")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="標題標準化微基準測試")
+    parser.add_argument("--db", type=Path, default=DB_PATH, help="SQLite DB 路徑")
+    parser.add_argument("--repeat", type=int, default=20, help="重複輪數")
+    args = parser.parse_args()
+    run(args.db, args.repeat)
@@ -0,0 +1,171 @@
+"""
+目錄版本計數器
+anime 表的任何寫入都由 SQLite 觸發器遞增版本，記憶體索引與 HTTP 快取以版本判斷是否失效
+
+功能:
+1. 單列計數器 - catalog_version(id = 1, version, content_version, image_version)，讀取只需一次主鍵查詢
+2. 觸發器 - anime 的 INSERT / UPDATE / DELETE 自動遞增（匯入、喜歡 / 不喜歡、遷移都不需要另外呼叫），
+   與寫入同一交易，rollback 時一併取消
+   - version：任何變更（列表 API 的 ETag；列表包含喜歡狀態）
+   - content_version：只在新增 / 刪除或內容欄位變更時遞增（標題、標籤、向量索引與相似動漫表的重建依據）
+   - image_version：封面清單（anime_image）重建時遞增，只讓封面清單重新載入，不觸發索引重建
+3. 程序內訂閱 - CatalogWatcher.poll() 發現版本改變時通知訂閱者（其他程序的寫入，例如 CSV 匯入，也會被偵測到）
+4. 手動遞增 - bump_catalog_version() 供沒有觸發器的衍生資料表使列表快取失效（封面清單另外遞增 image_version）
+
+使用方式:
+    unsubscribe = catalog_watcher.subscribe(lambda versions: print(versions), content_only=True)
+    catalog_watcher.poll(conn)   # 每個請求開始時呼叫
+"""
+
+import sqlite3
+import threading
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+CATALOG_VERSION_SQL = """
+CREATE TABLE IF NOT EXISTS catalog_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL DEFAULT 0,
+    content_version INTEGER NOT NULL DEFAULT 0,
+    image_version INTEGER NOT NULL DEFAULT 0
+)
+"""
+# 內容欄位：變更時衍生的索引需要重建（like / is_disliked 只在查詢時篩選，不影響索引）
+CONTENT_COLUMNS = (
+    "title", "season", "rating", "viewers_count", "viewers_numeric",
+    "genres_json", "platforms_json", "image_path", "synopsis",
+)
+BUMP_ALL = "UPDATE catalog_version SET version = version + 1, content_version = content_version + 1 WHERE id = 1;"
+CATALOG_TRIGGERS_SQL = (
+    f"CREATE TRIGGER IF NOT EXISTS trg_anime_insert_version AFTER INSERT ON anime BEGIN {BUMP_ALL} END",
+    f"CREATE TRIGGER IF NOT EXISTS trg_anime_delete_version AFTER DELETE ON anime BEGIN {BUMP_ALL} END",
+    "CREATE TRIGGER IF NOT EXISTS trg_anime_update_version AFTER UPDATE ON anime BEGIN "
+    "UPDATE catalog_version SET version = version + 1 WHERE id = 1; END",
+    f"CREATE TRIGGER IF NOT EXISTS trg_anime_content_version AFTER UPDATE OF {', '.join(CONTENT_COLUMNS)} ON anime "
+    f"WHEN {' OR '.join(f'OLD.{c} IS NOT NEW.{c}' for c in CONTENT_COLUMNS)} BEGIN "
+    "UPDATE catalog_version SET content_version = content_version + 1 WHERE id = 1; END",
+)
+
+
+class CatalogVersions(NamedTuple):
+    version: int
+    content_version: int
+
+
+def ensure_table(conn: sqlite3.Connection) -> None:
+    """建立計數器與 anime 表的觸發器（可重複執行；anime 表重建後需再次呼叫）"""
+    conn.execute(CATALOG_VERSION_SQL)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(catalog_version)")}
+    if "content_version" not in columns:
+        conn.execute("ALTER TABLE catalog_version ADD COLUMN content_version INTEGER NOT NULL DEFAULT 0")
+    if "image_version" not in columns:
+        conn.execute("ALTER TABLE catalog_version ADD COLUMN image_version INTEGER NOT NULL DEFAULT 0")
+    # 觸發器只更新既有的列，需先建立
+    conn.execute("INSERT OR IGNORE INTO catalog_version (id, version, content_version) VALUES (1, 0, 0)")
+    for statement in CATALOG_TRIGGERS_SQL:
+        conn.execute(statement)
+
+
+def read_catalog_versions(conn: sqlite3.Connection) -> CatalogVersions:
+    """讀取 (version, content_version)"""
+    try:
+        row = conn.execute("SELECT version, content_version FROM catalog_version WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        # 舊資料庫尚未建立 catalog_version 表（或缺少 content_version 欄位）
+        row = None
+    if row is None:
+        with conn:
+            ensure_table(conn)
+        row = conn.execute("SELECT version, content_version FROM catalog_version WHERE id = 1").fetchone()
+    return CatalogVersions(row[0], row[1])
+
+
+def read_catalog_version(conn: sqlite3.Connection) -> int:
+    """讀取目前的目錄版本（任何變更都會遞增）"""
+    return read_catalog_versions(conn).version
+
+
+def read_content_version(conn: sqlite3.Connection) -> int:
+    """讀取內容版本（記憶體索引判斷是否需要重建）"""
+    return read_catalog_versions(conn).content_version
+
+
+def read_image_version(conn: sqlite3.Connection) -> int:
+    """讀取封面清單版本（只讀取；尚未建立欄位時為 0，不在請求中執行遷移）"""
+    try:
+        row = conn.execute("SELECT image_version FROM catalog_version WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] if row else 0
+
+
+def bump_catalog_version(conn: sqlite3.Connection, images: bool = False) -> int:
+    """
+    目錄版本加 1（在呼叫端的交易內執行，不會自行 commit）
+
+    anime 表的寫入已由觸發器處理，只有其他會影響列表回應的資料表需要呼叫。
+    不會遞增 content_version：衍生資料表的變更不需要重建標題 / 標籤 / 向量索引與相似動漫表。
+
+    Args:
+        images: 同時遞增 image_version（封面清單重建後，讓服務程序重新載入）
+
+    Returns:
+        int: 遞增後的版本
+    """
+    ensure_table(conn)
+    if images:
+        conn.execute("UPDATE catalog_version SET version = version + 1, image_version = image_version + 1 WHERE id = 1")
+    else:
+        conn.execute("UPDATE catalog_version SET version = version + 1 WHERE id = 1")
+    return conn.execute("SELECT version FROM catalog_version WHERE id = 1").fetchone()[0]
+
+
+class CatalogWatcher:
+    """目錄版本的程序內訂閱：poll() 發現版本與上次不同時通知訂閱者"""
+
+    def __init__(self):
+        self._last: Optional[CatalogVersions] = None
+        self._subscribers: List[Tuple[Callable[[CatalogVersions], None], bool]] = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback: Callable[[CatalogVersions], None],
+                  content_only: bool = False) -> Callable[[], None]:
+        """
+        訂閱版本變更
+
+        Args:
+            callback: 以新的 CatalogVersions 呼叫（在執行 poll() 的執行緒中）
+            content_only: 只在 content_version 改變時通知（喜歡 / 不喜歡不通知）
+
+        Returns:
+            取消訂閱的函數
+        """
+        entry = (callback, content_only)
+        with self._lock:
+            self._subscribers.append(entry)
+
+        def unsubscribe() -> None:
+            with self._lock:
+                if entry in self._subscribers:
+                    self._subscribers.remove(entry)
+        return unsubscribe
+
+    def poll(self, conn: sqlite3.Connection) -> CatalogVersions:
+        """讀取目前版本；與上次 poll 不同時通知訂閱者（第一次 poll 只記錄）"""
+        current = read_catalog_versions(conn)
+        with self._lock:
+            previous, self._last = self._last, current
+            if previous is None or previous == current:
+                return current
+            content_changed = previous.content_version != current.content_version
+            callbacks = [callback for callback, content_only in self._subscribers
+                         if content_changed or not content_only]
+        for callback in callbacks:
+            try:
+                callback(current)
+            except Exception as e:
+                print(f"目錄版本訂閱者執行失敗: {str(e)}")
+        return current
+
+
+# 程序內共用的目錄版本訂閱
+catalog_watcher = CatalogWatcher()
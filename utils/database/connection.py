@@ -0,0 +1,98 @@
+"""
+SQLite 連線管理
+每個執行緒重複使用同一條連線，供 api.py、AnimeDatabase 與輸入分類器共用
+
+功能:
+1. 執行緒快取連線 - 同一執行緒內的所有查詢共用一條連線，不再每次 sqlite3.connect
+2. 讀取導向的 PRAGMA - WAL、mmap、較大的 page cache
+3. 預編譯語句重用 - 連線常駐，sqlite3 內建的 statement cache 才能發揮作用
+
+注意：
+- 取得的連線不可直接 close()，執行緒結束時會隨 threading.local 一併釋放；
+  需要提前釋放時使用 ConnectionManager.close() / close_thread_connections()
+- 連線只在執行緒重複使用時才省下開啟成本（uvicorn + asyncio.to_thread、a2wsgi 的執行緒池）。
+  Werkzeug 開發伺服器（app.run）每個請求一個新執行緒，連線只能在同一請求內共用，
+  api.py 在該模式下於 teardown_appcontext 呼叫 close_thread_connections() 明確關閉
+- `with conn:` 只負責 commit / rollback，不會關閉連線
+"""
+
+import os
+import sqlite3
+import threading
+from typing import Dict
+
+# 每條連線快取的預編譯語句數量
+CACHED_STATEMENTS = 256
+# 記憶體映射讀取上限（bytes）
+MMAP_SIZE = 256 * 1024 * 1024
+# page cache 大小（負值代表 KiB）
+CACHE_SIZE_KIB = 16 * 1024
+# 遇到寫入鎖時的等待時間（毫秒）
+BUSY_TIMEOUT_MS = 5000
+
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA mmap_size={MMAP_SIZE}",
+    f"PRAGMA cache_size=-{CACHE_SIZE_KIB}",
+    "PRAGMA temp_store=MEMORY",
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}",
+)
+
+
+class ConnectionManager:
+    """單一資料庫檔案的執行緒連線快取"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+
+    def _open(self) -> sqlite3.Connection:
+        # check_same_thread 保持預設 True：每條連線只屬於建立它的執行緒
+        conn = sqlite3.connect(self.db_path, cached_statements=CACHED_STATEMENTS)
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def get(self) -> sqlite3.Connection:
+        """取得目前執行緒的連線（不存在時建立）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+        return conn
+
+    def close(self) -> None:
+        """關閉目前執行緒的連線（下次 get() 會重新建立）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            self._local.conn = None
+            conn.close()
+
+
+_managers: Dict[str, ConnectionManager] = {}
+_managers_lock = threading.Lock()
+
+
+def get_connection_manager(db_path) -> ConnectionManager:
+    """依資料庫路徑取得（或建立）共用的連線管理器"""
+    key = os.path.abspath(os.fspath(db_path))
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = _managers[key] = ConnectionManager(key)
+        return manager
+
+
+def get_connection(db_path) -> sqlite3.Connection:
+    """取得指定資料庫在目前執行緒的共用連線（請勿 close）"""
+    return get_connection_manager(db_path).get()
+
+
+def close_thread_connections() -> None:
+    """關閉目前執行緒在所有資料庫上的連線（每個請求一個執行緒的伺服器於請求結束時呼叫）"""
+    with _managers_lock:
+        managers = list(_managers.values())
+    for manager in managers:
+        manager.close()
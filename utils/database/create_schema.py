@@ -1,5 +1,17 @@
 import sqlite3
+import sys
 from pathlib import Path
+from typing import Optional
+
+try:  # 套件式匯入；直接執行本檔案時改由專案根目錄匯入
+    from .catalog_version import ensure_table as ensure_catalog_version  # type: ignore
+    from .image_manifest import build_image_manifest, report_missing_images, unlisted_anime_ids  # type: ignore
+except ImportError:
+    ROOT = Path(__file__).resolve().parents[2]
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+    from utils.database.catalog_version import ensure_table as ensure_catalog_version  # type: ignore
+    from utils.database.image_manifest import build_image_manifest, report_missing_images, unlisted_anime_ids  # type: ignore
 
 DB_PATH = Path("anime_database.db")
 
@@ -9,7 +21,8 @@ CREATE TABLE IF NOT EXISTS anime (
     title TEXT NOT NULL,
     season TEXT,  -- e.g. 2024-Winter / 2024-Spring / 2024-Summer / 2024-Fall
     rating REAL,  -- numeric rating (e.g. 7.95). Empty string -> NULL when ingesting
-    viewers_count TEXT,  -- raw string like '487K', '1.0M' (keep original). Consider adding viewers_numeric later.
+    viewers_count TEXT,  -- raw string like '487K', '1.0M' (keep original)
+    viewers_numeric INTEGER,  -- parsed viewers_count (487K -> 487000) for sorting / thresholds
     genres_json TEXT, -- JSON array of unique tags
     platforms_json TEXT, -- JSON array of unique platforms
     image_path TEXT,
@@ -25,16 +38,124 @@ CREATE TABLE IF NOT EXISTS user_favorites (
     PRIMARY KEY (user_id, anime_id),
     FOREIGN KEY (anime_id) REFERENCES anime(id)
 );
+
+-- 正規化的標籤 / 平台表（由 genres_json / platforms_json 同步，JSON 欄位仍保留原樣）
+CREATE TABLE IF NOT EXISTS genre (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    name_lower TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS anime_genre (
+    anime_id INTEGER NOT NULL,
+    genre_id INTEGER NOT NULL,
+    position INTEGER NOT NULL DEFAULT 0,  -- 在 genres_json 中的順序
+    PRIMARY KEY (anime_id, genre_id),
+    FOREIGN KEY (anime_id) REFERENCES anime(id),
+    FOREIGN KEY (genre_id) REFERENCES genre(id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS platform (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    name_lower TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS anime_platform (
+    anime_id INTEGER NOT NULL,
+    platform_id INTEGER NOT NULL,
+    position INTEGER NOT NULL DEFAULT 0,  -- 在 platforms_json 中的順序
+    PRIMARY KEY (anime_id, platform_id),
+    FOREIGN KEY (anime_id) REFERENCES anime(id),
+    FOREIGN KEY (platform_id) REFERENCES platform(id)
+) WITHOUT ROWID;
 """
 
 INDEX_SQL = """
 CREATE INDEX IF NOT EXISTS idx_anime_rating ON anime(rating DESC);
 CREATE INDEX IF NOT EXISTS idx_anime_season ON anime(season);
-CREATE INDEX IF NOT EXISTS idx_anime_viewers ON anime(viewers_count);
+CREATE INDEX IF NOT EXISTS idx_anime_viewers_numeric ON anime(viewers_numeric DESC);
 CREATE INDEX IF NOT EXISTS idx_anime_is_disliked ON anime(is_disliked);
 CREATE INDEX IF NOT EXISTS idx_user_fav_user_time ON user_favorites(user_id, favorited_at DESC);
+CREATE INDEX IF NOT EXISTS idx_genre_name_lower ON genre(name_lower);
+CREATE INDEX IF NOT EXISTS idx_anime_genre_genre ON anime_genre(genre_id, anime_id);
+CREATE INDEX IF NOT EXISTS idx_platform_name_lower ON platform(name_lower);
+CREATE INDEX IF NOT EXISTS idx_anime_platform_platform ON anime_platform(platform_id, anime_id);
 """
 
+# 同季同名唯一索引：CSV 匯入以 ON CONFLICT(title, season) 批次 upsert，
+# 以 title 查重時也可使用此索引的前綴（不再全表掃描）
+UNIQUE_TITLE_INDEX_SQL = "CREATE UNIQUE INDEX IF NOT EXISTS idx_anime_title_season ON anime(title, season)"
+
+# 舊版索引（已被取代，遷移時移除）
+OBSOLETE_INDEXES = (
+    "idx_anime_viewers",  # 對 viewers_count 文字排序（字典序，487K > 1.0M），改用 idx_anime_viewers_numeric
+)
+
+
+def parse_viewers_numeric(viewers_str: Optional[str]) -> Optional[int]:
+    """將觀看數字串轉為整數：'487K' -> 487000、'1.0M' -> 1000000；無法解析時返回 None"""
+    if viewers_str is None:
+        return None
+    viewers_str = str(viewers_str).strip().upper()
+    if not viewers_str:
+        return None
+    try:
+        # 處理 K (千) 後綴
+        if viewers_str.endswith('K'):
+            return int(float(viewers_str[:-1]) * 1000)
+        # 處理 M (百萬) 後綴
+        if viewers_str.endswith('M'):
+            return int(float(viewers_str[:-1]) * 1000000)
+        # 處理純數字
+        return int(float(viewers_str))
+    except (ValueError, TypeError):
+        return None
+
+
+# (名稱表, 關聯表, 關聯欄位, anime 的 JSON 欄位)
+TAG_TABLES = (
+    ("genre", "anime_genre", "genre_id", "genres_json"),
+    ("platform", "anime_platform", "platform_id", "platforms_json"),
+)
+
+
+def sync_tag_tables(cur: sqlite3.Cursor, anime_id: Optional[int] = None) -> None:
+    """依 genres_json / platforms_json 同步正規化的標籤 / 平台關聯表
+
+    Args:
+        cur: 資料庫游標（由呼叫端負責 commit）
+        anime_id: 指定單一動漫時會先清除其舊關聯再重建；
+                  None 則補齊所有尚未建立關聯的動漫（遷移用）
+    """
+    for name_table, link_table, link_col, json_col in TAG_TABLES:
+        if anime_id is not None:
+            cur.execute(f"DELETE FROM {link_table} WHERE anime_id = ?", (anime_id,))
+            where, params = "anime.id = ?", (anime_id,)
+        else:
+            where, params = f"anime.id NOT IN (SELECT anime_id FROM {link_table})", ()
+        json_filter = f"json_valid(anime.{json_col}) AND json_each.type = 'text'"
+        cur.execute(
+            f"""
+            INSERT OR IGNORE INTO {name_table} (name, name_lower)
+            SELECT DISTINCT json_each.value, lower(json_each.value)
+            FROM anime, json_each(anime.{json_col})
+            WHERE {where} AND {json_filter}
+            """,
+            params,
+        )
+        cur.execute(
+            f"""
+            INSERT OR IGNORE INTO {link_table} (anime_id, {link_col}, position)
+            SELECT anime.id, {name_table}.id, json_each.key
+            FROM anime, json_each(anime.{json_col})
+            JOIN {name_table} ON {name_table}.name = json_each.value
+            WHERE {where} AND {json_filter}
+            """,
+            params,
+        )
+
+
 def create_schema(db_path: Path = DB_PATH) -> None:
     conn = sqlite3.connect(db_path.as_posix())
     try:
@@ -58,6 +179,8 @@ def create_schema(db_path: Path = DB_PATH) -> None:
             alter_actions.append("ALTER TABLE anime ADD COLUMN is_disliked INTEGER DEFAULT 0")
         if "synopsis" not in existing_cols:
             alter_actions.append("ALTER TABLE anime ADD COLUMN synopsis TEXT")
+        if "viewers_numeric" not in existing_cols:
+            alter_actions.append("ALTER TABLE anime ADD COLUMN viewers_numeric INTEGER")
 
         # Handle legacy columns: remove episodes, change viewers_count INTEGER->TEXT if required.
         legacy_has_episodes = "episodes" in existing_cols
@@ -81,6 +204,7 @@ def create_schema(db_path: Path = DB_PATH) -> None:
                     season TEXT,
                     rating REAL,
                     viewers_count TEXT,
+                    viewers_numeric INTEGER,
                     genres_json TEXT,
                     platforms_json TEXT,
                     image_path TEXT,
@@ -106,11 +230,38 @@ def create_schema(db_path: Path = DB_PATH) -> None:
         if alter_actions:
             print(f"🔄 已新增欄位: {', '.join(a.split()[3] for a in alter_actions)}")
 
+        # 遷移：由 viewers_count 回填 viewers_numeric
+        conn.create_function("parse_viewers_numeric", 1, parse_viewers_numeric, deterministic=True)
+        cur.execute("""
+            UPDATE anime SET viewers_numeric = parse_viewers_numeric(viewers_count)
+            WHERE viewers_numeric IS NULL AND viewers_count IS NOT NULL
+        """)
+
+        for index_name in OBSOLETE_INDEXES:
+            cur.execute(f"DROP INDEX IF EXISTS {index_name}")
+
         # 再建立索引（確保欄位都存在）
         for statement in filter(None, (s.strip() for s in INDEX_SQL.split(";"))):
             if statement:
                 cur.execute(statement)
+
+        try:
+            cur.execute(UNIQUE_TITLE_INDEX_SQL)
+        except sqlite3.IntegrityError:
+            # 已有同季同名的重複資料：改建一般索引，--replace 匯入需先移除重複資料
+            print("⚠️ anime 表有同季同名的重複資料，未建立唯一索引 idx_anime_title_season")
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_anime_title ON anime(title)")
+
+        # 遷移：由 JSON 欄位補齊標籤 / 平台關聯表
+        sync_tag_tables(cur)
+        # 目錄版本計數器與觸發器（anime 表重建後觸發器會一併刪除，需在最後建立）
+        ensure_catalog_version(conn)
         conn.commit()
+        # 遷移：為尚未登記的動漫建立封面清單（服務只讀取清單，不在請求中建立）
+        unlisted = unlisted_anime_ids(conn)
+        if unlisted:
+            report_missing_images(build_image_manifest(conn, anime_ids=unlisted))
+            print(f"🖼️ 已為 {len(unlisted)} 部動漫建立封面清單")
         print("✅ 資料表已建立/確認 (anime)")
         print(f"📂 資料庫檔案: {db_path}")
     finally:
@@ -0,0 +1,135 @@
+"""
+動漫標籤位元索引
+將 anime_genre 關聯表載入成「動漫 × 標籤」布林矩陣，供標籤查詢向量化計分
+
+功能:
+1. 載入時一次讀取 - 不再於每次查詢時 json.loads 與轉小寫
+2. 向量化計分 - 匹配標籤數、總分、評分與季度篩選皆以 NumPy 遮罩一次完成
+3. Top-N 選取 - 以 argpartition 取代整份列表排序
+"""
+
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.database.catalog_version import read_content_version
+
+
+class GenreIndex:
+    """
+    anime 表的標籤位元索引
+
+    每列對應一部動漫（依 id 排序），每欄對應一個標籤（以小寫比對）。
+    與 TitleIndex 相同，只有內容版本改變時才重建；重建與查詢以同一把鎖保護。
+    """
+
+    def __init__(self):
+        self._version: Optional[int] = None
+        self.ids = np.empty(0, dtype=np.int64)
+        self.ratings = np.empty(0, dtype=np.float64)
+        self.seasons = np.empty(0, dtype=object)
+        # 原始標籤列表（保留大小寫，作為結果的 anime_genres）
+        self.genres: List[List[str]] = []
+        # 小寫標籤 -> 欄位索引
+        self.genre_columns: Dict[str, int] = {}
+        self.matrix = np.zeros((0, 0), dtype=bool)
+        self._lock = threading.RLock()
+
+    def refresh(self, conn: sqlite3.Connection) -> bool:
+        """
+        若資料表已變更則重建索引
+
+        Returns:
+            bool: 是否有重建
+        """
+        version = read_content_version(conn)
+        with self._lock:
+            if version == self._version:
+                return False
+
+            rows = conn.execute("SELECT id, season, rating FROM anime ORDER BY id").fetchall()
+            row_positions = {r[0]: pos for pos, r in enumerate(rows)}
+            genres: List[List[str]] = [[] for _ in rows]
+            genre_columns: Dict[str, int] = {}
+            cells: List[Tuple[int, int]] = []
+            # 由正規化關聯表讀取（依 genres_json 原順序），不需逐列解析 JSON
+            links = conn.execute(
+                """
+                SELECT ag.anime_id, g.name
+                FROM anime_genre ag
+                JOIN genre g ON g.id = ag.genre_id
+                ORDER BY ag.anime_id, ag.position
+                """
+            ).fetchall()
+            for anime_id, name in links:
+                row_pos = row_positions.get(anime_id)
+                if row_pos is None:
+                    continue
+                genres[row_pos].append(name)
+                column = genre_columns.setdefault(name.lower(), len(genre_columns))
+                cells.append((row_pos, column))
+
+            matrix = np.zeros((len(rows), len(genre_columns)), dtype=bool)
+            if cells:
+                row_idx, col_idx = zip(*cells)
+                matrix[list(row_idx), list(col_idx)] = True
+
+            self.ids = np.array([r[0] for r in rows], dtype=np.int64)
+            self.seasons = np.array([r[1] for r in rows], dtype=object)
+            self.ratings = np.array([np.nan if r[2] is None else r[2] for r in rows], dtype=np.float64)
+            self.genres = genres
+            self.genre_columns = genre_columns
+            self.matrix = matrix
+            self._version = version
+            return True
+
+    def match_counts(self, tags: List[str]) -> np.ndarray:
+        """計算每部動漫匹配的標籤數量（重複的標籤重複計分）"""
+        counts = np.zeros(len(self.ids), dtype=np.int64)
+        for tag in tags:
+            column = self.genre_columns.get(tag.lower())
+            if column is not None:
+                counts += self.matrix[:, column]
+        return counts
+
+    def top_matches(self, tags: List[str], limit: int, tag_bonus: float,
+                    min_rating: float, season: Optional[str] = None) -> List[Tuple[int, int, float, List[str]]]:
+        """
+        依「評分 + 匹配標籤數 × 加分」選出前 limit 名
+
+        只保留至少匹配一個標籤、評分達門檻（且季度相符）的動漫；
+        同分時評分較高者優先，再依 id 排序（與依 idx_anime_rating 掃描的順序一致）。
+
+        Returns:
+            List[(anime id, 匹配標籤數, 總分, 原始標籤列表)]
+        """
+        with self._lock:
+            return self._top_matches(tags, limit, tag_bonus, min_rating, season)
+
+    def _top_matches(self, tags: List[str], limit: int, tag_bonus: float,
+                     min_rating: float, season: Optional[str]) -> List[Tuple[int, int, float, List[str]]]:
+        counts = self.match_counts(tags)
+        with np.errstate(invalid='ignore'):
+            mask = (counts > 0) & (self.ratings >= min_rating)
+        if season is not None:
+            mask &= self.seasons == season
+
+        positions = np.flatnonzero(mask)
+        if positions.size == 0 or limit <= 0:
+            return []
+        totals = self.ratings[positions] + counts[positions] * tag_bonus
+
+        if positions.size > limit:
+            # 取第 limit 名的分數作為門檻，保留所有同分者再排序
+            neg_totals = -totals
+            kth = neg_totals[np.argpartition(neg_totals, limit - 1)[limit - 1]]
+            keep = neg_totals <= kth
+            positions, totals = positions[keep], totals[keep]
+
+        order = np.lexsort((positions, -self.ratings[positions], -totals))[:limit]
+        return [
+            (int(self.ids[positions[i]]), int(counts[positions[i]]), float(totals[i]), self.genres[positions[i]])
+            for i in order
+        ]
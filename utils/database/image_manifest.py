@@ -0,0 +1,254 @@
+"""
+封面圖片清單（image manifest）
+匯入時為每部動漫解析封面檔案並記錄大小、SHA-256、尺寸與 mtime，圖片路由與封面網址直接查表，不需在請求時探測檔案系統
+
+功能:
+1. 檔名解析 - 優先使用 CSV 的 image_path；找不到時依標題推得檔名（爬蟲會把 \\ / : * ? " < > | 換成 _，例：Re:Monster → Re_Monster.jpg）
+2. 平行計算 - 以執行緒池計算檔案雜湊與尺寸；大小與 mtime 未變的檔案沿用舊紀錄
+3. 缺圖回報 - 找不到封面的動漫 path 為 NULL，匯入時列出
+4. 程序內快取 - ImageManifest 將清單載入記憶體，封面清單版本（catalog_version.image_version）變更時重新載入；
+   重建清單只遞增 version 與 image_version，不會觸發標題 / 向量索引與相似動漫表重建；
+   請求中只讀取清單，不會建立資料表或清單（由匯入與 create_schema 遷移建立）
+
+Pillow 為可選套件：未安裝時 width / height 為 NULL。
+
+使用方式:
+    missing = build_image_manifest(conn, anime_ids=new_ids)   # 匯入後
+    build_image_manifest(conn, anime_ids=unlisted_anime_ids(conn))   # 遷移：補齊尚未登記的動漫
+    manifest = ImageManifest()
+    manifest.refresh(conn)
+    manifest.cover(anime_id)          # 封面檔名（相對於 anime_data/images）
+    manifest.sha256(filename)         # 內容雜湊；不在清單中時為 None
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow 未安裝時不記錄尺寸
+    Image = None
+
+from utils.database.catalog_version import bump_catalog_version, read_image_version
+from utils.image_thumbnails import IMAGES_DIR
+
+IMAGE_MANIFEST_SQL = """
+CREATE TABLE IF NOT EXISTS anime_image (
+    anime_id INTEGER PRIMARY KEY,
+    path TEXT,
+    size INTEGER,
+    sha256 TEXT,
+    width INTEGER,
+    height INTEGER,
+    mtime_ns INTEGER,
+    checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+UPSERT_IMAGE_SQL = """
+INSERT INTO anime_image (anime_id, path, size, sha256, width, height, mtime_ns, checked_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+ON CONFLICT(anime_id) DO UPDATE SET
+    path = excluded.path,
+    size = excluded.size,
+    sha256 = excluded.sha256,
+    width = excluded.width,
+    height = excluded.height,
+    mtime_ns = excluded.mtime_ns,
+    checked_at = excluded.checked_at
+"""
+# 依標題推檔名時嘗試的副檔名
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+# 檔名不允許的字元（爬蟲存檔時換成 _）
+UNSAFE_FILENAME_CHARS = re.compile(r'[\\/:*?"<>|]')
+# 計算雜湊的執行緒數（hashlib 計算大區塊時會釋放 GIL）
+IMAGE_MANIFEST_WORKERS = 8
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# (size, sha256, width, height, mtime_ns)
+FileInfo = Tuple[int, str, Optional[int], Optional[int], int]
+
+
+def ensure_table(conn: sqlite3.Connection) -> None:
+    conn.execute(IMAGE_MANIFEST_SQL)
+
+
+def safe_filename(title: str) -> str:
+    """標題轉為爬蟲存檔時使用的檔名（不含副檔名）"""
+    return UNSAFE_FILENAME_CHARS.sub('_', title.strip())
+
+
+def resolve_image_file(image_path: Optional[str], title: Optional[str], names: Set[str]) -> Optional[str]:
+    """
+    找出動漫的封面檔名
+
+    Args:
+        image_path: CSV 中的 image_path（可能為空或檔名已不同）
+        names: 圖片目錄下的所有檔名
+
+    Returns:
+        圖片目錄中的檔名；找不到時返回 None
+    """
+    candidates = []
+    if image_path:
+        candidates.append(os.path.basename(image_path.replace('\\', '/')))
+    if title:
+        stem = safe_filename(title)
+        candidates.extend(stem + extension for extension in IMAGE_EXTENSIONS)
+    for candidate in candidates:
+        for form in (candidate, unicodedata.normalize('NFC', candidate)):
+            if form in names:
+                return form
+    return None
+
+
+def inspect_file(path: str) -> FileInfo:
+    """計算檔案大小、SHA-256、尺寸與 mtime"""
+    stat = os.stat(path)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    width = height = None
+    if Image is not None:
+        try:
+            # 只讀取檔頭，不解碼整張圖片
+            with Image.open(path) as image:
+                width, height = image.size
+        except Exception as e:
+            print(f"無法讀取圖片尺寸 {os.path.basename(path)}: {str(e)}")
+    return stat.st_size, digest.hexdigest(), width, height, stat.st_mtime_ns
+
+
+def unlisted_anime_ids(conn: sqlite3.Connection) -> List[int]:
+    """尚未登記在 anime_image 表的動漫 id"""
+    ensure_table(conn)
+    return [row[0] for row in conn.execute("""
+        SELECT a.id FROM anime a
+        LEFT JOIN anime_image i ON i.anime_id = a.id
+        WHERE i.anime_id IS NULL
+    """)]
+
+
+def build_image_manifest(conn: sqlite3.Connection, images_dir: str = IMAGES_DIR,
+                         anime_ids: Optional[Iterable[int]] = None,
+                         workers: int = IMAGE_MANIFEST_WORKERS) -> List[Tuple[int, str]]:
+    """
+    建立 / 更新 anime_image 表（大小與 mtime 未變的檔案不重新計算雜湊）
+
+    Args:
+        anime_ids: 只更新這些動漫；None 代表全部（並移除已不存在的動漫）
+
+    Returns:
+        找不到封面的 (anime_id, title) 列表
+    """
+    ensure_table(conn)
+    if anime_ids is None:
+        rows = conn.execute("SELECT id, title, image_path FROM anime").fetchall()
+    else:
+        ids = list(anime_ids)
+        rows = []
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows.extend(conn.execute(
+                f"SELECT id, title, image_path FROM anime WHERE id IN ({placeholders})", chunk
+            ).fetchall())
+
+    names = set(os.listdir(images_dir)) if os.path.isdir(images_dir) else set()
+    resolved = {row[0]: resolve_image_file(row[2], row[1], names) for row in rows}
+
+    # 沿用大小與 mtime 相同的既有紀錄
+    known: Dict[str, FileInfo] = {}
+    for path, size, sha256, width, height, mtime_ns in conn.execute(
+            "SELECT path, size, sha256, width, height, mtime_ns FROM anime_image WHERE path IS NOT NULL"):
+        known[path] = (size, sha256, width, height, mtime_ns)
+
+    def file_info(filename: str) -> Optional[FileInfo]:
+        path = os.path.join(images_dir, filename)
+        try:
+            stat = os.stat(path)
+            cached = known.get(filename)
+            if cached is not None and cached[0] == stat.st_size and cached[4] == stat.st_mtime_ns:
+                return cached
+            return inspect_file(path)
+        except OSError as e:
+            print(f"無法讀取圖片 {filename}: {str(e)}")
+            return None
+
+    filenames = sorted({filename for filename in resolved.values() if filename})
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        infos = dict(zip(filenames, pool.map(file_info, filenames)))
+
+    records = []
+    missing = []
+    for row in rows:
+        anime_id, title = row[0], row[1]
+        filename = resolved[anime_id]
+        info = infos.get(filename) if filename else None
+        if info is None:
+            missing.append((anime_id, title))
+            records.append((anime_id, None, None, None, None, None, None))
+        else:
+            records.append((anime_id, filename) + info)
+
+    with conn:
+        conn.executemany(UPSERT_IMAGE_SQL, records)
+        if anime_ids is None:
+            conn.execute("DELETE FROM anime_image WHERE anime_id NOT IN (SELECT id FROM anime)")
+        # 讓已載入清單的服務程序重新載入（清單依 image_version 判斷；列表 ETag 依目錄版本）
+        bump_catalog_version(conn, images=True)
+    return missing
+
+
+def report_missing_images(missing: List[Tuple[int, str]]) -> None:
+    if not missing:
+        return
+    print(f"⚠️ {len(missing)} 部動漫找不到封面圖片：")
+    for anime_id, title in missing:
+        print(f"  - [{anime_id}] {title}")
+
+
+class ImageManifest:
+    """anime_image 表的程序內快取（封面清單版本變更時重新載入；只讀取，不在請求中建立清單）"""
+
+    def __init__(self, images_dir: str = IMAGES_DIR):
+        self.images_dir = images_dir
+        # 載入清單時的封面清單版本
+        self._version: Optional[int] = None
+        self._covers: Dict[int, str] = {}
+        self._hashes: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def refresh(self, conn: sqlite3.Connection) -> None:
+        """封面清單版本變更時重新載入（尚未建立清單時為空，由匯入 / create_schema 建立）"""
+        if read_image_version(conn) == self._version:
+            return
+        with self._lock:
+            version = read_image_version(conn)
+            if version == self._version:
+                return
+            covers = {}
+            hashes = {}
+            try:
+                rows = conn.execute("SELECT anime_id, path, sha256 FROM anime_image WHERE path IS NOT NULL").fetchall()
+            except sqlite3.OperationalError:
+                # 尚未建立 anime_image 表
+                rows = []
+            for anime_id, path, sha256 in rows:
+                covers[anime_id] = path
+                hashes[path] = sha256
+            self._covers, self._hashes, self._version = covers, hashes, version
+
+    def cover(self, anime_id) -> Optional[str]:
+        """動漫的封面檔名；找不到封面時為 None"""
+        return self._covers.get(anime_id)
+
+    def sha256(self, filename: str) -> Optional[str]:
+        """封面檔案的 SHA-256；不在清單中時為 None"""
+        return self._hashes.get(filename)
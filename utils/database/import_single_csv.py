@@ -12,10 +12,16 @@
 - season ← 由檔名推得：YYYY_1→Winter, YYYY_4→Spring, YYYY_7→Summer, YYYY_10→Fall  => 例如 2024_1_with_image.csv -> 2024-Winter
 - rating ← scormem-item （空字串→NULL）
 - viewers_count ← scormem-item 2 （原樣字串 e.g. "487K"）
+- viewers_numeric ← viewers_count 轉整數（487K → 487000、1.0M → 1000000；無法解析→NULL）
 - genres_json ← anime_tag / anime_tag 2 / anime_tag 3 合併去重 JSON 陣列
 - platforms_json ← steam-site-name 1/2/3 合併去重 JSON 陣列
+- genre / anime_genre、platform / anime_platform ← 由上述 JSON 陣列同步（正規化關聯表）
 - synopsis ← anime_story（空字串→NULL）
 - image_path ← image_path
+- anime_embedding / *_embeddings.f32 ← 只為本次新增的動漫計算向量並附加（向量索引增量更新）
+- anime_similar ← 有新增資料時重新計算每部動漫的前 K 名相似作品
+- anime_image ← 新增 / 更新的動漫解析封面檔案並記錄大小、SHA-256、尺寸（找不到封面時列出）
+- catalog_version ← 由 anime 表的觸發器在新增 / 更新時遞增（列表 API 的 ETag、記憶體索引的重建依據）
 - is_disliked ← 預設 0（資料表 default）
 - created_at ← DB default
 
@@ -24,25 +30,35 @@ python utils/database/import_single_csv.py anime_data/data/2024_1_with_image.csv
 
 選項：
 --replace 同季同名若已存在則覆蓋（以 title + season 當唯一條件）
-
-未來可擴充：新增 viewers_numeric（把 487K / 1.2M 轉成整數）
+--no-embed 不更新向量索引（之後第一次查詢時會自動補齊）
+--no-similar 不重建相似動漫表（服務啟動或偵測到內容變更時於背景重建；在此之前相似推薦改用標籤查詢）
+--workers N 無 CSV 參數（自動全部匯入）時的平行解析程序數，寫入仍由單一連線依檔名順序執行
 """
 from __future__ import annotations
 import csv
 import json
+import os
 import sqlite3
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 # --- 動態匯入（支援直接 python 執行無套件語境） ---
 try:  # 嘗試套件式相對匯入
-    from .create_schema import DB_PATH, create_schema  # type: ignore
+    from .create_schema import DB_PATH, TAG_TABLES, create_schema, parse_viewers_numeric, sync_tag_tables  # type: ignore
+    from .vector_index import AnimeVectorIndex, vector_store_path  # type: ignore
+    from .similar_index import SimilarAnimeIndex  # type: ignore
+    from .image_manifest import build_image_manifest, report_missing_images  # type: ignore
 except Exception:  # 直接執行時會失敗：attempted relative import
     ROOT = Path(__file__).resolve().parents[2]  # 專案根目錄
     if str(ROOT) not in sys.path:
         sys.path.insert(0, str(ROOT))
-    from utils.database.create_schema import DB_PATH, create_schema  # type: ignore
+    from utils.database.create_schema import DB_PATH, TAG_TABLES, create_schema, parse_viewers_numeric, sync_tag_tables  # type: ignore
+    from utils.database.vector_index import AnimeVectorIndex, vector_store_path  # type: ignore
+    from utils.database.similar_index import SimilarAnimeIndex  # type: ignore
+    from utils.database.image_manifest import build_image_manifest, report_missing_images  # type: ignore
 
 SEASON_CODE_MAP = {"1": "Winter", "4": "Spring", "7": "Summer", "10": "Fall"}
 REQUIRED_COLUMNS = [
@@ -91,6 +107,7 @@ def parse_csv_row(row: Dict[str, str]) -> Dict:
     rating_raw = (row.get("scormem-item") or "").strip()
     rating = float(rating_raw) if rating_raw else None
     viewers_count = (row.get("scormem-item 2") or "").strip() or None
+    viewers_numeric = parse_viewers_numeric(viewers_count)
 
     tags = build_unique_list([
         (row.get("anime_tag") or "").strip(),
@@ -109,6 +126,7 @@ def parse_csv_row(row: Dict[str, str]) -> Dict:
         "title": title,
         "rating": rating,
         "viewers_count": viewers_count,
+        "viewers_numeric": viewers_numeric,
         "genres_json": json.dumps(tags, ensure_ascii=False),
         "platforms_json": json.dumps(platforms, ensure_ascii=False),
         "synopsis": synopsis,
@@ -116,60 +134,225 @@ def parse_csv_row(row: Dict[str, str]) -> Dict:
     }
 
 
-def upsert_anime(cur: sqlite3.Cursor, season: str, record: Dict, replace: bool):
-    """依照 title 判斷是否已存在（忽略 season）。存在就 skip，不做更新。"""
-    cur.execute("SELECT id FROM anime WHERE title = ?", (record["title"],))
-    existing = cur.fetchone()
-    if existing:
-        return "skip"
-    cur.execute(
-        """
-        INSERT INTO anime (title, season, rating, viewers_count, genres_json, platforms_json, image_path, synopsis)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-        (
-            record["title"],
-            season,
-            record["rating"],
-            record["viewers_count"],
-            record["genres_json"],
-            record["platforms_json"],
-            record["image_path"],
-            record["synopsis"],
-        ),
-    )
-    return "insert"
-
-
-def import_single(csv_file: Path, db_path: Path = DB_PATH, replace: bool = False) -> Tuple[int, int, int]:  # replace 參數保留但不再使用
-    create_schema(db_path)
+# 匯入暫存表（每條連線各自一份 TEMP 表，連線關閉即消失）
+STAGING_TABLE_SQL = """
+CREATE TEMP TABLE IF NOT EXISTS anime_import (
+    title TEXT NOT NULL,
+    season TEXT,
+    rating REAL,
+    viewers_count TEXT,
+    viewers_numeric INTEGER,
+    genres_json TEXT,
+    platforms_json TEXT,
+    image_path TEXT,
+    synopsis TEXT
+)
+"""
+STAGING_INSERT_SQL = """
+INSERT INTO anime_import (title, season, rating, viewers_count, viewers_numeric, genres_json, platforms_json, image_path, synopsis)
+VALUES (:title, :season, :rating, :viewers_count, :viewers_numeric, :genres_json, :platforms_json, :image_path, :synopsis)
+"""
+ANIME_COLUMNS = "title, season, rating, viewers_count, viewers_numeric, genres_json, platforms_json, image_path, synopsis"
+# 同一檔案內重複的 title 只取第一列（與逐筆匯入時「第一筆新增、其餘略過」一致）
+FIRST_ROW_PER_TITLE = "s.rowid IN (SELECT MIN(rowid) FROM anime_import GROUP BY title)"
+# 內容是否不同（{old} 為既有資料列、{new} 為匯入資料列）
+CHANGED_CONDITION = " OR ".join(
+    f"{{old}}.{column} IS NOT {{new}}.{column}"
+    for column in ("rating", "viewers_count", "viewers_numeric", "genres_json", "platforms_json", "image_path", "synopsis")
+)
+# 預設：title 已存在（不論季度）就略過
+INSERT_NEW_SQL = f"""
+INSERT INTO anime ({ANIME_COLUMNS})
+SELECT {ANIME_COLUMNS} FROM anime_import s
+WHERE {FIRST_ROW_PER_TITLE}
+  AND NOT EXISTS (SELECT 1 FROM anime a WHERE a.title = s.title)
+ORDER BY s.rowid
+ON CONFLICT DO NOTHING
+"""
+# --replace：同季同名視為同一部動漫（season 以 IS 比對：檔名推不出季度時 season 為 NULL，
+# 而唯一索引中 NULL 彼此不相等，ON CONFLICT(title, season) 會把這些列重複新增）
+SAME_ANIME = "a.title = s.title AND a.season IS s.season"
+# --replace 時會被更新的既有動漫（同季同名且內容不同），需在更新前查出
+CHANGED_IDS_SQL = f"""
+SELECT a.id FROM anime_import s
+JOIN anime a ON {SAME_ANIME}
+WHERE {FIRST_ROW_PER_TITLE} AND ({CHANGED_CONDITION.format(old="a", new="s")})
+"""
+# --replace：以匯入資料覆蓋內容不同的既有動漫（id 由 CHANGED_IDS_SQL 查出），like / is_disliked 保留
+REPLACE_CHANGED_SQL = f"""
+UPDATE anime SET (rating, viewers_count, viewers_numeric, genres_json, platforms_json, image_path, synopsis) = (
+    SELECT s.rating, s.viewers_count, s.viewers_numeric, s.genres_json, s.platforms_json, s.image_path, s.synopsis
+    FROM anime_import s
+    WHERE s.title = anime.title AND s.season IS anime.season AND {FIRST_ROW_PER_TITLE}
+)
+WHERE id IN (SELECT value FROM json_each(?))
+"""
+# --replace：沒有同季同名資料的列才新增
+INSERT_MISSING_SQL = f"""
+INSERT INTO anime ({ANIME_COLUMNS})
+SELECT {ANIME_COLUMNS} FROM anime_import s
+WHERE {FIRST_ROW_PER_TITLE}
+  AND NOT EXISTS (SELECT 1 FROM anime a WHERE {SAME_ANIME})
+ORDER BY s.rowid
+ON CONFLICT DO NOTHING
+"""
+
+
+def stream_records(reader: csv.DictReader, season: Optional[str]) -> Iterator[Dict]:
+    """逐列解析 CSV（不將整個檔案載入記憶體），略過沒有標題的列"""
+    for row in reader:
+        if (row.get("entity_localized_name") or "").strip():
+            record = parse_csv_row(row)
+            record["season"] = season
+            yield record
+
+
+def check_columns(reader: csv.DictReader) -> None:
+    missing = [c for c in REQUIRED_COLUMNS if c not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"CSV 缺少欄位: {missing}")
+
+
+def parse_csv_file(csv_file: Path) -> Tuple[Optional[str], List[Dict], float]:
+    """
+    解析整個 CSV 檔案（多檔匯入時在子程序中執行，只做解析不碰資料庫）
+
+    Returns:
+        (season, 資料列, 解析耗時 ms)
+    """
+    start_time = time.perf_counter()
     season = derive_season(csv_file) or None
     with csv_file.open(encoding="utf-8-sig", newline="") as f:
         reader = csv.DictReader(f)
-        missing = [c for c in REQUIRED_COLUMNS if c not in reader.fieldnames]
-        if missing:
-            raise ValueError(f"CSV 缺少欄位: {missing}")
-        rows = [parse_csv_row(r) for r in reader if (r.get("entity_localized_name") or "").strip()]
+        check_columns(reader)
+        records = list(stream_records(reader, season))
+    return season, records, (time.perf_counter() - start_time) * 1000
+
+
+def has_unique_title_index(conn: sqlite3.Connection) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_anime_title_season'"
+    ).fetchone() is not None
+
+
+def load_rows(conn: sqlite3.Connection, records: Iterable[Dict], replace: bool = False) -> Tuple[int, int, int, List[int]]:
+    """
+    在單一交易內批次匯入：executemany 寫入暫存表，再以 INSERT ... SELECT（--replace 時先 UPDATE 內容不同的同季同名資料）寫入 anime
+
+    載入期間使用 PRAGMA synchronous=OFF（交易結束後恢復原設定）；任何錯誤都會整批 rollback。
+
+    Returns:
+        (新增筆數, 更新筆數, 略過筆數, 新增或內容有更新的動漫 id)
+    """
+    if replace and not has_unique_title_index(conn):
+        raise ValueError("--replace 需要唯一索引 idx_anime_title_season，請先移除同季同名的重複資料再執行 create_schema")
+
+    previous_synchronous = conn.execute("PRAGMA synchronous").fetchone()[0]
+    conn.execute("PRAGMA synchronous=OFF")
+    try:
+        with conn:
+            conn.execute(STAGING_TABLE_SQL)
+            conn.execute("DELETE FROM anime_import")
+            conn.executemany(STAGING_INSERT_SQL, records)
+            staged = conn.execute("SELECT COUNT(*) FROM anime_import").fetchone()[0]
+
+            updated_ids = [row[0] for row in conn.execute(CHANGED_IDS_SQL)] if replace else []
+            if updated_ids:
+                conn.execute(REPLACE_CHANGED_SQL, (json.dumps(updated_ids),))
+            max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM anime").fetchone()[0]
+            conn.execute(INSERT_MISSING_SQL if replace else INSERT_NEW_SQL)
+            inserted_ids = [row[0] for row in conn.execute("SELECT id FROM anime WHERE id > ? ORDER BY id", (max_id,))]
+
+            if updated_ids:
+                # 內容有更新的動漫：清除舊的標籤 / 平台關聯，下面與新增的動漫一起重建
+                for _name_table, link_table, _link_col, _json_col in TAG_TABLES:
+                    conn.executemany(f"DELETE FROM {link_table} WHERE anime_id = ?", [(i,) for i in updated_ids])
+            if inserted_ids or updated_ids:
+                # 一次補齊所有尚未建立關聯的動漫（新增 + 更新）；目錄版本由 anime 表的觸發器遞增
+                sync_tag_tables(conn.cursor())
+            conn.execute("DELETE FROM anime_import")
+    finally:
+        conn.execute(f"PRAGMA synchronous={previous_synchronous}")
+    inserted, updated = len(inserted_ids), len(updated_ids)
+    return inserted, updated, staged - inserted - updated, inserted_ids + updated_ids
+
+
+def import_single(csv_file: Path, db_path: Path = DB_PATH, replace: bool = False,
+                  embed: bool = True, similar: bool = True, ensure_schema: bool = True) -> Tuple[int, int, int]:
+    """
+    匯入單一 CSV 檔案
+
+    Args:
+        replace: 同季同名已存在時覆蓋（預設依 title 略過，不區分季節）
+        ensure_schema: 是否先執行 create_schema（批次匯入時由呼叫端執行一次即可）
+
+    Returns:
+        (新增筆數, 更新筆數, 略過筆數)
+    """
+    start_time = time.perf_counter()
+    if ensure_schema:
+        create_schema(db_path)
+    season = derive_season(csv_file) or None
 
     conn = sqlite3.connect(db_path.as_posix())
     try:
-        cur = conn.cursor()
-        inserted = updated = skipped = 0
-        for rec in rows:
-            action = upsert_anime(cur, season, rec, replace=replace)
-            if action == "insert":
-                inserted += 1
-            else:
-                skipped += 1
-        conn.commit()
-        print(f"✅ 完成: 新增 {inserted} 筆｜略過 {skipped} 筆（依 title 判斷重複跳過）｜Season={season}")
+        with csv_file.open(encoding="utf-8-sig", newline="") as f:
+            reader = csv.DictReader(f)
+            check_columns(reader)
+            inserted, updated, skipped, changed_ids = load_rows(conn, stream_records(reader, season), replace)
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        rule = "同季同名覆蓋" if replace else "依 title 判斷重複跳過"
+        print(f"✅ 完成: 新增 {inserted} 筆｜更新 {updated} 筆｜略過 {skipped} 筆（{rule}）｜Season={season}｜{elapsed_ms:.1f} ms")
+        if changed_ids:
+            # 封面清單：解析檔名並計算雜湊，找不到封面的動漫在此列出
+            report_missing_images(build_image_manifest(conn, anime_ids=changed_ids))
+        if embed and changed_ids:
+            # 只為本次新增 / 更新的動漫計算向量，耗時與本季資料量成正比
+            AnimeVectorIndex(vector_store_path(db_path)).sync(conn, changed_ids)
+        if similar and changed_ids:
+            build_similar_table(conn, db_path, embed)
         return inserted, updated, skipped
     finally:
         conn.close()
 
 
-def auto_import_all(data_dir: Path = Path("anime_data/data"), db_path: Path = DB_PATH) -> None:
-    """自動匯入目錄下所有 *_with_image.csv 檔案（排序後），重複 title 直接略過。"""
+def build_similar_table(conn: sqlite3.Connection, db_path: Path, embed: bool = True) -> None:
+    """重建相似動漫表（embed=True 時加入簡介向量相似度）"""
+    vector_index = AnimeVectorIndex(vector_store_path(db_path)) if embed else None
+    SimilarAnimeIndex().rebuild(conn, vector_index)
+
+
+def parsed_files(csv_files: List[Path], workers: int) -> Iterator[Tuple[Path, Tuple[Optional[str], List[Dict], float]]]:
+    """
+    以程序池平行解析多個 CSV，依 csv_files 的順序逐一交出結果（解析完成順序不影響寫入順序）
+
+    解析失敗的檔案交出例外物件而非結果，由寫入端回報並繼續下一個檔案。
+    """
+    if workers <= 1 or len(csv_files) <= 1:
+        for csv_file in csv_files:
+            try:
+                yield csv_file, parse_csv_file(csv_file)
+            except Exception as e:
+                yield csv_file, e
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(parse_csv_file, csv_file) for csv_file in csv_files]
+        for csv_file, future in zip(csv_files, futures):
+            try:
+                yield csv_file, future.result()
+            except Exception as e:
+                yield csv_file, e
+
+
+def auto_import_all(data_dir: Path = Path("anime_data/data"), db_path: Path = DB_PATH, embed: bool = True,
+                    similar: bool = True, workers: Optional[int] = None) -> None:
+    """
+    自動匯入目錄下所有 *_with_image.csv 檔案（排序後），重複 title 直接略過。
+
+    解析在程序池中平行執行（workers 預設為 CPU 數，1 = 不開子程序），寫入只由目前程序的單一連線負責，
+    並依檔名排序逐檔寫入（每檔一個交易），因此「先匯入的季度保留該 title」的結果與逐檔匯入相同。
+    向量索引與相似動漫表在全部檔案寫入後只更新一次。
+    """
     if not data_dir.exists():
         print(f"❌ 資料夾不存在: {data_dir}")
         return
@@ -177,18 +360,44 @@ def auto_import_all(data_dir: Path = Path("anime_data/data"), db_path: Path = DB
     if not csv_files:
         print("⚠️ 沒有找到任何 *_with_image.csv 檔案")
         return
-    print("🚀 開始自動匯入所有檔案（重複 title 略過）...")
+    workers = min(workers or os.cpu_count() or 1, len(csv_files))
+    print(f"🚀 開始自動匯入所有檔案（重複 title 略過，解析程序 {workers} 個）...")
+    start_time = time.perf_counter()
+    # Schema 只需確認一次
+    create_schema(db_path)
     total_insert = total_skip = 0
-    for f in csv_files:
-        print(f"--- 匯入 {f.name} ---")
-        try:
-            ins, _upd, skp = import_single(f, db_path=db_path, replace=False)
-            total_insert += ins
-            total_skip += skp
-        except Exception as e:
-            print(f"❌ 檔案 {f.name} 匯入失敗: {e}")
+    changed_ids: List[int] = []
+    conn = sqlite3.connect(db_path.as_posix())
+    try:
+        for csv_file, parsed in parsed_files(csv_files, workers):
+            if isinstance(parsed, Exception):
+                print(f"❌ 檔案 {csv_file.name} 匯入失敗: {parsed}")
+                continue
+            season, records, parse_ms = parsed
+            write_start = time.perf_counter()
+            try:
+                inserted, _updated, skipped, ids = load_rows(conn, records)
+            except Exception as e:
+                print(f"❌ 檔案 {csv_file.name} 匯入失敗: {e}")
+                continue
+            write_ms = (time.perf_counter() - write_start) * 1000
+            print(f"✅ {csv_file.name}: {len(records)} 列｜新增 {inserted} 筆｜略過 {skipped} 筆｜"
+                  f"Season={season}｜解析 {parse_ms:.1f} ms｜寫入 {write_ms:.1f} ms")
+            total_insert += inserted
+            total_skip += skipped
+            changed_ids.extend(ids)
+
+        if changed_ids:
+            report_missing_images(build_image_manifest(conn, anime_ids=changed_ids))
+        if embed and changed_ids:
+            AnimeVectorIndex(vector_store_path(db_path)).sync(conn, changed_ids)
+        if similar and changed_ids:
+            build_similar_table(conn, db_path, embed)
+    finally:
+        conn.close()
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
     print("📊 匯入總結：")
-    print(f"  新增: {total_insert}｜略過(重複): {total_skip}")
+    print(f"  新增: {total_insert}｜略過(重複): {total_skip}｜總耗時 {elapsed_ms:.1f} ms")
 
 
 if __name__ == "__main__":
@@ -200,9 +409,14 @@ if __name__ == "__main__":
         parser = argparse.ArgumentParser(description="單一動畫 CSV 匯入工具 / 無參數 = 自動全部匯入")
         parser.add_argument("csv", type=Path, nargs="?", help="CSV 檔案路徑 e.g. anime_data/data/2024_1_with_image.csv")
         parser.add_argument("--db", type=Path, default=DB_PATH, help="SQLite DB 路徑")
-        parser.add_argument("--replace", action="store_true", help="若同季同名存在則覆蓋 (預設 False；自動模式固定 True)")
+        parser.add_argument("--replace", action="store_true", help="若同季同名存在則覆蓋 (預設 False；自動模式固定 False)")
+        parser.add_argument("--no-embed", action="store_true", help="不更新向量索引")
+        parser.add_argument("--no-similar", action="store_true", help="不重建相似動漫表")
+        parser.add_argument("--workers", type=int, default=None, help="自動模式的 CSV 解析程序數 (預設 CPU 數；1 = 不開子程序)")
         args = parser.parse_args()
         if args.csv:
-            import_single(args.csv, args.db, replace=args.replace)
+            import_single(args.csv, args.db, replace=args.replace, embed=not args.no_embed,
+                          similar=not args.no_similar)
         else:
-            auto_import_all(db_path=args.db)
+            auto_import_all(db_path=args.db, embed=not args.no_embed, similar=not args.no_similar,
+                            workers=args.workers)
@@ -0,0 +1,211 @@
+"""
+相似動漫預先計算表
+為每部動漫預先算好前 K 名相似作品並存入 anime_similar 表，「與 X 相似」的請求只需一次索引查詢
+
+功能:
+1. 相似度 - 類型 Jaccard 係數為主，加上鄰居評分與（可選）標題 / 類型 / 簡介向量 cosine 相似度
+2. 分批計算 - 每批只計算「批次 × 全部」的分數（向量相似度直接由向量索引的映射矩陣計算），argpartition 取前 K 名
+3. 資料表 - anime_similar(anime_id, neighbor_id, score)，主鍵 (anime_id, neighbor_id)，另有 (anime_id, score) 索引
+4. 版本紀錄 - anime_similar_state 記錄建表時的內容版本（catalog_version），內容變更後 refresh() 才重建；
+   由匯入（import_single_csv）與服務啟動 / 背景重建索引時呼叫，推薦請求只讀取資料表
+
+使用方式:
+    index = SimilarAnimeIndex()
+    index.refresh(conn, vector_index)   # 匯入資料後、服務啟動時或背景重建索引時
+    conn.execute("SELECT neighbor_id, score FROM anime_similar WHERE anime_id = ? ORDER BY score DESC", (anime_id,))
+"""
+
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.database.genre_index import GenreIndex
+from utils.database.catalog_version import read_content_version
+
+# 每部動漫保存的相似作品數量（季度篩選後仍需足夠的候選）
+SIMILAR_TOP_K = 50
+# 相似度權重：類型 Jaccard、向量 cosine、鄰居評分（0~1 正規化）
+GENRE_WEIGHT = 0.6
+TEXT_WEIGHT = 0.25
+RATING_WEIGHT = 0.15
+# 類型沒有交集時，向量相似度至少需達此值才視為相關作品
+MIN_TEXT_SIMILARITY = 0.1
+# 每批計算的列數（分數矩陣為 批次 × 動漫數 的 float32，5 萬部時每個約 50 MB）
+SIMILAR_BATCH_SIZE = 256
+
+
+class SimilarAnimeIndex:
+    """anime_similar 表的建立與更新"""
+
+    def __init__(self, top_k: int = SIMILAR_TOP_K):
+        self.top_k = top_k
+        # 最近一次確認 anime_similar 為最新時的內容版本（避免每次查詢都讀取狀態表）
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def ensure_table(conn: sqlite3.Connection) -> None:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS anime_similar (
+                anime_id INTEGER NOT NULL,
+                neighbor_id INTEGER NOT NULL,
+                score REAL NOT NULL,
+                PRIMARY KEY (anime_id, neighbor_id)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_anime_similar_score ON anime_similar(anime_id, score DESC)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS anime_similar_state (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                anime_count INTEGER,
+                max_anime_id INTEGER,
+                built_at REAL NOT NULL,
+                content_version INTEGER
+            )
+        """)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(anime_similar_state)")}
+        if "content_version" not in columns:
+            conn.execute("ALTER TABLE anime_similar_state ADD COLUMN content_version INTEGER")
+
+    def is_current(self, conn: sqlite3.Connection) -> bool:
+        """anime_similar 是否依目前的 anime 表建立（只讀取狀態表，推薦請求可直接呼叫）"""
+        version = read_content_version(conn)
+        if version == self._version:
+            return True
+        try:
+            state = conn.execute("SELECT content_version FROM anime_similar_state WHERE id = 1").fetchone()
+        except sqlite3.OperationalError:
+            # 尚未建立狀態表（或為缺少 content_version 欄位的舊版表）
+            return False
+        if state is None or state[0] != version:
+            return False
+        self._version = version
+        return True
+
+    def refresh(self, conn: sqlite3.Connection, vector_index=None) -> bool:
+        """
+        資料表已變更時重建 anime_similar
+
+        Returns:
+            bool: 是否有重建
+        """
+        if self.is_current(conn):
+            return False
+        self.rebuild(conn, vector_index)
+        return True
+
+    def rebuild(self, conn: sqlite3.Connection, vector_index=None) -> int:
+        """
+        重新計算所有動漫的前 K 名相似作品並覆寫 anime_similar
+
+        Args:
+            vector_index: AnimeVectorIndex（可選）；提供時加入簡介向量相似度
+
+        Returns:
+            int: 寫入的相似配對數量
+        """
+        with self._lock:
+            start_time = time.time()
+            version = read_content_version(conn)
+            anime_count, max_anime_id = conn.execute("SELECT COUNT(*), MAX(id) FROM anime").fetchone()
+            pairs = self.compute(conn, vector_index)
+            with conn:
+                self.ensure_table(conn)
+                conn.execute("DELETE FROM anime_similar")
+                conn.executemany(
+                    "INSERT INTO anime_similar (anime_id, neighbor_id, score) VALUES (?, ?, ?)", pairs
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO anime_similar_state "
+                    "(id, anime_count, max_anime_id, built_at, content_version) VALUES (1, ?, ?, ?, ?)",
+                    (anime_count, max_anime_id, time.time(), version)
+                )
+            self._version = version
+            print(f"相似動漫表已重建：{len(pairs)} 筆配對，耗時 {time.time() - start_time:.2f} 秒")
+            return len(pairs)
+
+    def compute(self, conn: sqlite3.Connection, vector_index=None) -> List[Tuple[int, int, float]]:
+        """
+        計算每部動漫的前 K 名相似作品，返回 [(anime_id, neighbor_id, score)]
+
+        每批 SIMILAR_BATCH_SIZE 列計算「批次 × 全部」的分數矩陣並取前 K 名；向量相似度直接由向量索引的映射矩陣逐批計算，
+        記憶體用量與批次大小 × 動漫數成正比，不需複製整份向量矩陣。
+        """
+        genre_index = GenreIndex()
+        genre_index.refresh(conn)
+        ids = genre_index.ids
+        count = len(ids)
+        if count < 2 or self.top_k <= 0:
+            return []
+
+        genres = genre_index.matrix.astype(np.float32)
+        genre_sizes = genres.sum(axis=1)
+
+        # 鄰居評分正規化到 0~1（無評分者為 0）
+        ratings = np.nan_to_num(genre_index.ratings, nan=0.0)
+        spread = ratings.max() - ratings.min()
+        rating_term = (ratings - ratings.min()) / spread if spread > 0 else np.zeros(count)
+        rating_term = (RATING_WEIGHT * rating_term).astype(np.float32)
+
+        # GenreIndex 每一列在向量索引中的位置（沒有向量的動漫為 -1）
+        vector_positions = None
+        if vector_index is not None:
+            vector_index.refresh(conn)
+            vector_positions = vector_index.positions(ids)
+            if not (vector_positions >= 0).any():
+                vector_positions = None
+
+        duplicates = self._duplicate_title_rows(conn, ids)
+
+        k = min(self.top_k, count - 1)
+        pairs: List[Tuple[int, int, float]] = []
+        for start in range(0, count, SIMILAR_BATCH_SIZE):
+            stop = min(start + SIMILAR_BATCH_SIZE, count)
+            # Jaccard = |A ∩ B| / (|A| + |B| - |A ∩ B|)
+            intersection = genres[start:stop] @ genres.T
+            union = genre_sizes[start:stop, None] + genre_sizes[None, :] - intersection
+            with np.errstate(divide='ignore', invalid='ignore'):
+                jaccard = np.where(union > 0, intersection / union, np.float32(0))
+            scores = GENRE_WEIGHT * jaccard
+            related = jaccard > 0
+            if vector_positions is not None:
+                cosine = vector_index.cosine_block(vector_positions[start:stop], vector_positions)
+                scores += TEXT_WEIGHT * cosine
+                related |= cosine >= MIN_TEXT_SIMILARITY
+            # 只保留類型或內容相關的作品，評分只用於相關作品之間的排序
+            scores = np.where(related, scores + rating_term[None, :], np.float32(-np.inf))
+
+            offsets = np.arange(stop - start)
+            scores[offsets, offsets + start] = -np.inf
+            # 排除同名作品（資料中可能有重複匯入的標題）
+            for row in range(start, stop):
+                same_title = duplicates.get(row)
+                if same_title is not None:
+                    scores[row - start, same_title] = -np.inf
+
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            for offset in range(stop - start):
+                finite = np.isfinite(top_scores[offset])
+                anime_id = int(ids[start + offset])
+                pairs.extend((anime_id, int(ids[column]), float(score))
+                             for column, score in zip(top[offset][finite], top_scores[offset][finite]))
+        return pairs
+
+    @staticmethod
+    def _duplicate_title_rows(conn: sqlite3.Connection, ids: np.ndarray) -> Dict[int, np.ndarray]:
+        """標題重複的動漫：GenreIndex 列號 -> 同名作品的列號（只記錄有重複的標題）"""
+        titles = dict(conn.execute("SELECT id, LOWER(title) FROM anime").fetchall())
+        rows_by_title: Dict[str, List[int]] = {}
+        for row, anime_id in enumerate(ids):
+            rows_by_title.setdefault(titles.get(int(anime_id), ''), []).append(row)
+        duplicates: Dict[int, np.ndarray] = {}
+        for rows in rows_by_title.values():
+            if len(rows) > 1:
+                same_title = np.array(rows, dtype=np.int64)
+                for row in rows:
+                    duplicates[row] = same_title
+        return duplicates
@@ -0,0 +1,171 @@
+"""
+動漫標題索引
+在記憶體中預先計算每部動漫的標題變體，供標題模糊查詢使用
+
+功能:
+1. 載入時一次計算 - 標準化標題、基礎標題與各自的小寫形式
+2. 變更偵測 - 只有 anime 表內容改變時才重建索引
+3. 季度篩選 - 在記憶體中直接過濾，不需重新查詢資料表
+4. 字元 n-gram 倒排索引 - 依 n-gram 重疊度挑出候選，只對少量候選做精確相似度計算
+"""
+
+import heapq
+import math
+import re
+import sqlite3
+import threading
+from typing import Callable, Dict, List, Optional, Set
+
+from utils.database.catalog_version import read_content_version
+
+# n-gram 長度：中文標題兩字詞很常見，搭配三字元以區分英文標題
+NGRAM_SIZES = (2, 3)
+# 預設候選數量上限
+DEFAULT_CANDIDATE_LIMIT = 50
+
+
+def char_ngrams(text: str) -> Set[str]:
+    """
+    取得字串的字元 n-gram 集合（忽略空白）
+
+    同時適用中英混合標題，例如 "DAN DA DAN 第2季"。
+    長度不足最小 n 的字串以整個字串作為唯一 gram。
+    """
+    compact = re.sub(r'\s+', '', text or '')
+    if not compact:
+        return set()
+    grams = set()
+    for n in NGRAM_SIZES:
+        for i in range(len(compact) - n + 1):
+            grams.add(compact[i:i + n])
+    if not grams:
+        grams.add(compact)
+    return grams
+
+
+class TitleEntry:
+    """單一動漫的預先計算標題資訊"""
+
+    __slots__ = ('anime_id', 'season', 'title', 'title_lower',
+                 'normalized_lower', 'base_title', 'base_lower', 'ngrams')
+
+    def __init__(self, anime_id: int, season: Optional[str], title: str,
+                 normalized: str, base_title: str):
+        self.anime_id = anime_id
+        self.season = season
+        self.title = title
+        self.title_lower = title.lower()
+        self.normalized_lower = normalized.lower()
+        self.base_title = base_title
+        self.base_lower = base_title.lower()
+        self.ngrams = (char_ngrams(self.title_lower) | char_ngrams(self.normalized_lower)
+                       | char_ngrams(self.base_lower))
+
+
+class TitleIndex:
+    """
+    anime 表的標題索引
+
+    以 catalog_version 的內容版本（由 anime 表的觸發器遞增）判斷變更；版本改變時才重新讀取標題並計算
+    標準化結果，查詢時只需對查詢字串做一次標準化。
+    重建與查詢以同一把鎖保護，可由多個請求執行緒共用。
+    """
+
+    def __init__(self,
+                 normalize: Callable[[str], str],
+                 extract_base: Callable[[str], str]):
+        self._normalize = normalize
+        self._extract_base = extract_base
+        self._version: Optional[int] = None
+        self.entries: List[TitleEntry] = []
+        # gram -> 含有該 gram 的 entries 位置
+        self._postings: Dict[str, List[int]] = {}
+        # gram -> IDF 權重（越少見的 gram 權重越高）
+        self._idf: Dict[str, float] = {}
+        self._lock = threading.RLock()
+
+    def refresh(self, conn: sqlite3.Connection) -> bool:
+        """
+        若資料表已變更則重建索引
+
+        Returns:
+            bool: 是否有重建
+        """
+        version = read_content_version(conn)
+        with self._lock:
+            if version == self._version:
+                return False
+
+            rows = conn.execute("SELECT id, season, title FROM anime ORDER BY id").fetchall()
+            entries = []
+            for anime_id, season, title in rows:
+                title = title or ''
+                entries.append(TitleEntry(
+                    anime_id, season, title,
+                    self._normalize(title),
+                    self._extract_base(title),
+                ))
+            self._build_postings(entries)
+            self.entries = entries
+            self._version = version
+            return True
+
+    def _build_postings(self, entries: List[TitleEntry]) -> None:
+        """建立 n-gram 倒排索引與 IDF 權重"""
+        postings: Dict[str, List[int]] = {}
+        for pos, entry in enumerate(entries):
+            for gram in entry.ngrams:
+                postings.setdefault(gram, []).append(pos)
+        total = len(entries)
+        self._idf = {gram: math.log(1 + total / len(plist)) for gram, plist in postings.items()}
+        self._postings = postings
+
+    def iter_entries(self, season: Optional[str] = None) -> List[TitleEntry]:
+        """依季度（可選）列出索引項目"""
+        entries = self.entries
+        if season is None:
+            return list(entries)
+        return [entry for entry in entries if entry.season == season]
+
+    def shortlist(self, query: TitleEntry, season: Optional[str] = None,
+                  limit: int = DEFAULT_CANDIDATE_LIMIT) -> List[TitleEntry]:
+        """
+        依 n-gram 重疊度挑出候選項目
+
+        每個共同 gram 依 IDF 加權累計分數，取分數最高的 limit 筆（依原始順序返回）。
+        若符合季度的項目本身不超過 limit 筆，或查詢字串沒有任何 gram，
+        則直接返回全部項目（等同完整比對）。
+
+        Args:
+            query: make_query_entry 產生的查詢項目
+            season: 季度篩選（資料庫格式，如 2024-Fall）
+            limit: 候選數量上限
+        """
+        with self._lock:
+            candidates = self.iter_entries(season)
+            if len(candidates) <= limit or not query.ngrams:
+                return candidates
+
+            scores: Dict[int, float] = {}
+            for gram in query.ngrams:
+                plist = self._postings.get(gram)
+                if not plist:
+                    continue
+                weight = self._idf[gram]
+                for pos in plist:
+                    scores[pos] = scores.get(pos, 0.0) + weight
+
+            entries = self.entries
+            if season is not None:
+                scored = ((pos, score) for pos, score in scores.items() if entries[pos].season == season)
+            else:
+                scored = scores.items()
+            top = heapq.nlargest(limit, scored, key=lambda item: item[1])
+            return [entries[pos] for pos in sorted(pos for pos, _ in top)]
+
+    def make_query_entry(self, query_title: str) -> TitleEntry:
+        """為查詢字串計算與索引項目相同的標題變體"""
+        query_title = query_title or ''
+        return TitleEntry(None, None, query_title,
+                          self._normalize(query_title),
+                          self._extract_base(query_title))
@@ -0,0 +1,102 @@
+"""
+動漫標題標準化
+將季數變體統一為「第N季」並提取基礎標題
+
+功能:
+1. 單一編譯正則 - 所有季數變體合併成一個 alternation，一次掃描完成替換
+2. 預先編譯的後綴規則 - 提取基礎標題時不再逐次編譯 pattern
+3. LRU 快取 - 重複出現的標題不會重新標準化，快取大小有上限
+"""
+
+import re
+from functools import lru_cache
+
+# 快取上限（約為目前資料量的數十倍，足以涵蓋資料庫標題與常見查詢）
+NORMALIZE_CACHE_SIZE = 8192
+
+# 處理季數的各種表示方法 - 根據實際資料庫內容擴展
+# 注意：順序即優先順序（與過去逐一 str.replace 的行為一致）
+SEASON_MAPPINGS = {
+    # 中文數字季數
+    '第一季': '第1季',
+    '第二季': '第2季',
+    '第三季': '第3季',
+    '第四季': '第4季',
+    '第五季': '第5季',
+    '第六季': '第6季',
+    '第七季': '第7季',
+    '第八季': '第8季',
+    '第九季': '第9季',
+    '第十季': '第10季',
+
+    # 英文季數轉換
+    '1st Season': '第1季',
+    '2nd Season': '第2季',
+    '3rd Season': '第3季',
+    '4th Season': '第4季',
+    '5th Season': '第5季',
+
+    # 其他格式
+    '第二幕': '第2季',
+    '第三幕': '第3季',
+    '第二季度': '第2季',
+    '第三季度': '第3季',
+    '第二部份': '第2季',
+    '第三部份': '第3季',
+    '續篇': '第2季',
+
+    # 簡化格式
+    'Season 1': '第1季',
+    'Season 2': '第2季',
+    'Season 3': '第3季',
+    'S1': '第1季',
+    'S2': '第2季',
+    'S3': '第3季',
+}
+
+# 所有季數變體合併為單一 alternation（依 SEASON_MAPPINGS 順序嘗試）
+_SEASON_PATTERN = re.compile('|'.join(re.escape(key) for key in SEASON_MAPPINGS))
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+
+# 移除季數相關的後綴（依序套用）
+_BASE_TITLE_SUFFIX_PATTERNS = [
+    re.compile(pattern, re.IGNORECASE) for pattern in (
+        r'\s*第\d+季\s*$',
+        r'\s*\d+(st|nd|rd|th)\s+Season\s*$',
+        r'\s*Season\s+\d+\s*$',
+        r'\s*第[一二三四五六七八九十]+季\s*$',
+        r'\s*第\d+季度\s*$',
+        r'\s*第\d+部份?\s*$',
+        r'\s*續篇\s*$',
+        r'\s*S\d+\s*$',
+        r'\s*-.*-\s*$',  # 處理副標題
+    )
+]
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalize_title(title: str) -> str:
+    """
+    標準化標題，處理常見的變體
+
+    基於實際資料庫分析結果，處理各種季數表示方法：
+    - 中文季數：第一季、第二季等
+    - 英文季數：1st Season、2nd Season等
+    - 其他格式：第二幕、第二季度、續篇等
+    """
+    if not title:
+        return ""
+
+    # 移除多餘空格
+    title = _WHITESPACE_PATTERN.sub(' ', title.strip())
+
+    return _SEASON_PATTERN.sub(lambda m: SEASON_MAPPINGS[m.group(0)], title)
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def extract_base_title(title: str) -> str:
+    """提取動漫的基礎標題（去除季數等後綴）"""
+    base_title = normalize_title(title)
+    for pattern in _BASE_TITLE_SUFFIX_PATTERNS:
+        base_title = pattern.sub('', base_title)
+    return base_title.strip()
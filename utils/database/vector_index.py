@@ -0,0 +1,407 @@
+"""
+動漫向量索引
+以標題、類型與簡介建立每部動漫的文字向量，供自由描述的請求在本地檢索候選動漫
+
+功能:
+1. 雜湊字元 n-gram + TF-IDF - 不需外部模型；向量保存原始詞頻，IDF 於載入時依目前資料計算
+2. 記憶體映射矩陣 - 向量存放在 float32 檔案並以 np.memmap 讀取，查詢時一次矩陣乘法完成計分
+3. 內容雜湊 - anime_embedding 表記錄每部動漫的向量列與內容雜湊，資料未變更時直接重用檔案
+4. 增量更新 - 匯入新資料時只計算新增 / 內容變更的動漫，附加到向量檔案尾端
+5. 跨程序寫入鎖 - 匯入程序與服務程序可能同時更新向量檔案；附加與重建都在 <向量檔案>.lock 的檔案鎖內進行，
+   列號依鎖內讀到的檔案大小決定，寫入後檢查檔案大小與列號一致才寫入 anime_embedding
+
+使用方式:
+    index = AnimeVectorIndex(vector_store_path(db_path))
+    index.refresh(conn)
+    index.search("想看輕鬆治癒的日常番", limit=10)
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import numpy as np
+
+from utils.database.catalog_version import read_content_version
+from utils.text_vectorizer import HashingNgramVectorizer
+
+# 向量維度（雜湊桶數）
+VECTOR_DIMENSIONS = 4096
+# 字元 n-gram 長度：中文單字 + 雙字詞（三字元片段在簡介上多為雜訊）
+VECTOR_NGRAM_RANGE = (1, 2)
+# 標題與類型在文件中重複的次數（提高權重，避免被較長的簡介淹沒）
+TITLE_WEIGHT = 2
+GENRE_WEIGHT = 2
+# 每批向量化的動漫數量
+EMBED_BATCH_SIZE = 256
+# 相似度低於此值的結果不返回（以實際描述校準：相關描述的最高分約 0.11~0.30；低於 0.10 多為常用字重疊）
+DEFAULT_MIN_SCORE = 0.10
+# 只返回相似度達最高分此比例的結果（排除與最佳結果差距過大、只靠常用字命中的作品）
+DEFAULT_MIN_RELATIVE_SCORE = 0.5
+
+
+def vector_store_path(db_path: str) -> str:
+    """資料庫對應的向量檔案路徑（與資料庫放在同一目錄）"""
+    return os.path.splitext(os.path.abspath(db_path))[0] + '_embeddings.f32'
+
+
+def parse_genres(genres_json: Optional[str]) -> List[str]:
+    try:
+        genres = json.loads(genres_json) if genres_json else []
+    except (json.JSONDecodeError, TypeError):
+        return []
+    return [genre for genre in genres if isinstance(genre, str)]
+
+
+def build_document(title: Optional[str], genres_json: Optional[str], synopsis: Optional[str]) -> str:
+    """組合用於向量化的文字（標題、類型重複以提高權重）"""
+    title = title or ''
+    genres = ' '.join(parse_genres(genres_json))
+    return '\n'.join([title] * TITLE_WEIGHT + [genres] * GENRE_WEIGHT + [synopsis or ''])
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """跨程序的排他檔案鎖（阻塞到取得為止）"""
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    # LK_LOCK 重試約 10 秒後仍拿不到時拋出 OSError，繼續等待
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def content_hash(title: Optional[str], genres_json: Optional[str], synopsis: Optional[str]) -> str:
+    """向量內容雜湊（標題、類型或簡介變更時雜湊隨之改變）"""
+    raw = '\x1f'.join([title or '', genres_json or '', synopsis or ''])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+class AnimeVectorIndex:
+    """
+    anime 表的向量索引
+
+    向量檔案為 (列數, 維度) 的 float32 原始矩陣；anime_embedding 表記錄 anime_id -> 列號與內容雜湊。
+    內容版本改變（或第一次載入）時，refresh() 比對內容雜湊，只為新增或變更的動漫計算向量。
+    """
+
+    def __init__(self, store_path: str, vectorizer: Optional[HashingNgramVectorizer] = None):
+        self.store_path = store_path
+        self.vectorizer = vectorizer or HashingNgramVectorizer(VECTOR_DIMENSIONS, VECTOR_NGRAM_RANGE)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.seasons = np.empty(0, dtype=object)
+        self._rows = np.empty(0, dtype=np.int64)
+        self._matrix: Optional[np.ndarray] = None
+        self._idf = np.ones(self.vectorizer.dimensions, dtype=np.float32)
+        self._doc_norms = np.empty(0, dtype=np.float32)
+        self._hashes: Dict[int, str] = {}
+        self._version: Optional[int] = None
+        self._lock = threading.RLock()
+        # 持有跨程序寫入鎖的層數（sync() 內呼叫 rebuild() 時不重複上鎖；由 _lock 保護）
+        self._writer_depth = 0
+
+    @staticmethod
+    def ensure_table(conn: sqlite3.Connection) -> None:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS anime_embedding (
+                anime_id INTEGER PRIMARY KEY,
+                row INTEGER NOT NULL,
+                content_hash TEXT NOT NULL
+            )
+        """)
+
+    def _read_catalog(self, conn: sqlite3.Connection, anime_ids: Optional[Iterable[int]] = None) -> List[Tuple]:
+        if anime_ids is None:
+            return conn.execute(
+                "SELECT id, season, title, genres_json, synopsis FROM anime ORDER BY id"
+            ).fetchall()
+        ids = list(anime_ids)
+        rows = []
+        # 分批查詢，避免超過 SQLite 參數數量上限
+        for start in range(0, len(ids), EMBED_BATCH_SIZE):
+            chunk = ids[start:start + EMBED_BATCH_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            rows.extend(conn.execute(
+                f"SELECT id, season, title, genres_json, synopsis FROM anime WHERE id IN ({placeholders})", chunk
+            ).fetchall())
+        return sorted(rows, key=lambda row: row[0])
+
+    @property
+    def _row_bytes(self) -> int:
+        return 4 * self.vectorizer.dimensions
+
+    def _stored_rows(self) -> int:
+        if not os.path.exists(self.store_path):
+            return 0
+        return os.path.getsize(self.store_path) // self._row_bytes
+
+    @contextmanager
+    def _writer(self) -> Iterator[None]:
+        """向量檔案與 anime_embedding 的跨程序寫入鎖（可重入；呼叫端需持有 _lock）"""
+        if self._writer_depth:
+            self._writer_depth += 1
+            try:
+                yield
+            finally:
+                self._writer_depth -= 1
+            return
+        with file_lock(self.store_path + '.lock'):
+            self._writer_depth = 1
+            try:
+                yield
+            finally:
+                self._writer_depth = 0
+
+    def refresh(self, conn: sqlite3.Connection) -> bool:
+        """
+        確認向量檔案與 anime 表一致（不一致時增量更新）並載入
+
+        Returns:
+            bool: 是否有重建或重新載入
+        """
+        version = read_content_version(conn)
+        with self._lock:
+            if self._matrix is not None and version == self._version:
+                return False
+            catalog = self._read_catalog(conn)
+            current = {row[0]: content_hash(row[2], row[3], row[4]) for row in catalog}
+            if self._matrix is not None and current == self._hashes:
+                self._version = version
+                return False
+
+            # 只為新增或內容變更的動漫計算向量（向量檔案損毀時才整份重建）
+            self.sync(conn, catalog=catalog)
+            self._load(conn, catalog)
+            self._version = version
+            return True
+
+    def sync(self, conn: sqlite3.Connection, anime_ids: Optional[Iterable[int]] = None,
+             catalog: Optional[List[Tuple]] = None) -> int:
+        """
+        增量更新向量：只為缺少向量或內容雜湊不符的動漫計算，並附加到向量檔案尾端
+
+        內容變更的動漫改指向新的列，舊列成為失效列；失效列超過一半時整份重建以回收空間。
+
+        Args:
+            anime_ids: 只檢查這些動漫（例如剛匯入的資料）；None 代表檢查整個 anime 表
+                （並移除已刪除動漫的向量紀錄）
+            catalog: 已讀取的 anime 資料列（內部使用，避免重複查詢）
+
+        Returns:
+            int: 重新計算向量的動漫數量
+        """
+        with self._lock, self._writer():
+            with conn:
+                self.ensure_table(conn)
+            # 在寫入鎖內讀取檔案大小與紀錄：其他程序的附加已完成並寫入 anime_embedding
+            file_size = os.path.getsize(self.store_path) if os.path.exists(self.store_path) else 0
+            total_rows = file_size // self._row_bytes
+            max_row = conn.execute("SELECT MAX(row) FROM anime_embedding").fetchone()[0]
+            if (max_row is not None and max_row >= total_rows) or file_size % self._row_bytes:
+                # 紀錄指向檔案中不存在的列（檔案遺失或被截斷），或檔案尾端有寫到一半的列
+                self.rebuild(conn)
+                return conn.execute("SELECT COUNT(*) FROM anime_embedding").fetchone()[0]
+
+            if catalog is None:
+                catalog = self._read_catalog(conn, anime_ids)
+            elif anime_ids is not None:
+                wanted = set(anime_ids)
+                catalog = [row for row in catalog if row[0] in wanted]
+
+            stored = dict(conn.execute("SELECT anime_id, content_hash FROM anime_embedding").fetchall())
+            pending = []
+            for anime_id, _, title, genres_json, synopsis in catalog:
+                digest = content_hash(title, genres_json, synopsis)
+                if stored.get(anime_id) != digest:
+                    pending.append((anime_id, digest, build_document(title, genres_json, synopsis)))
+
+            removed = []
+            if anime_ids is None:
+                present = {row[0] for row in catalog}
+                removed = [anime_id for anime_id in stored if anime_id not in present]
+
+            if not pending and not removed:
+                return 0
+
+            rows = []
+            with open(self.store_path, 'ab') as f:
+                for start in range(0, len(pending), EMBED_BATCH_SIZE):
+                    batch = pending[start:start + EMBED_BATCH_SIZE]
+                    self.vectorizer.transform([doc for _, _, doc in batch], l2_normalize=False).tofile(f)
+                    rows.extend((anime_id, total_rows + start + offset, digest)
+                                for offset, (anime_id, digest, _) in enumerate(batch))
+
+            expected_size = (total_rows + len(rows)) * self._row_bytes
+            if os.path.getsize(self.store_path) != expected_size:
+                # 列號與檔案內容對不上（不應發生：寫入都在鎖內），整份重建而不寫入錯位的紀錄
+                print(f"向量檔案大小不符（{os.path.getsize(self.store_path)} != {expected_size}），整份重建")
+                self.rebuild(conn)
+                return conn.execute("SELECT COUNT(*) FROM anime_embedding").fetchone()[0]
+
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO anime_embedding (anime_id, row, content_hash) VALUES (?, ?, ?)",
+                    rows
+                )
+                conn.executemany("DELETE FROM anime_embedding WHERE anime_id = ?", [(i,) for i in removed])
+            # 下次 refresh() 重新映射檔案
+            self._version = None
+            print(f"向量索引增量更新：計算 {len(rows)} 部｜移除 {len(removed)} 部")
+
+            live = conn.execute("SELECT COUNT(*) FROM anime_embedding").fetchone()[0]
+            if total_rows + len(rows) > 2 * live:
+                self.rebuild(conn)
+            return len(rows)
+
+    def rebuild(self, conn: sqlite3.Connection, catalog: Optional[List[Tuple]] = None) -> None:
+        """重新計算所有向量並覆寫向量檔案"""
+        with self._lock, self._writer():
+            if catalog is None:
+                catalog = self._read_catalog(conn)
+            documents = [build_document(title, genres_json, synopsis)
+                         for _, _, title, genres_json, synopsis in catalog]
+            matrix = self.vectorizer.transform(documents, l2_normalize=False)
+
+            # 先寫入暫存檔再取代，避免其他程序讀到寫到一半的檔案
+            tmp_path = self.store_path + '.tmp'
+            matrix.tofile(tmp_path)
+            self._matrix = None
+            os.replace(tmp_path, self.store_path)
+
+            with conn:
+                self.ensure_table(conn)
+                conn.execute("DELETE FROM anime_embedding")
+                conn.executemany(
+                    "INSERT INTO anime_embedding (anime_id, row, content_hash) VALUES (?, ?, ?)",
+                    [(anime_id, row, content_hash(title, genres_json, synopsis))
+                     for row, (anime_id, _, title, genres_json, synopsis) in enumerate(catalog)]
+                )
+            print(f"向量索引已重建：{len(catalog)} 部動漫")
+
+    def _load(self, conn: sqlite3.Connection, catalog: List[Tuple]) -> None:
+        """映射向量檔案，並計算 IDF 與各文件的加權長度"""
+        seasons_by_id = {row[0]: row[1] for row in catalog}
+        links = conn.execute("SELECT anime_id, row, content_hash FROM anime_embedding ORDER BY anime_id").fetchall()
+        links = [link for link in links if link[0] in seasons_by_id]
+
+        total_rows = self._stored_rows()
+        if total_rows:
+            matrix = np.memmap(self.store_path, dtype=np.float32, mode='r',
+                               shape=(total_rows, self.vectorizer.dimensions))
+        else:
+            matrix = np.zeros((0, self.vectorizer.dimensions), dtype=np.float32)
+
+        rows = np.array([link[1] for link in links], dtype=np.int64)
+        live = np.asarray(matrix[rows]) if rows.size else np.zeros((0, matrix.shape[1]), dtype=np.float32)
+        # 平滑 IDF：log((1 + N) / (1 + df)) + 1
+        document_frequency = (live > 0).sum(axis=0)
+        idf = (np.log((1 + len(rows)) / (1 + document_frequency)) + 1).astype(np.float32)
+
+        self._matrix = matrix
+        self._rows = rows
+        self._idf = idf
+        self._doc_norms = np.sqrt((live * live) @ (idf * idf)).astype(np.float32)
+        self.ids = np.array([link[0] for link in links], dtype=np.int64)
+        self.seasons = np.array([seasons_by_id[link[0]] for link in links], dtype=object)
+        self._hashes = {link[0]: link[2] for link in links}
+
+    def positions(self, anime_ids: np.ndarray) -> np.ndarray:
+        """anime id 在索引中的位置（cosine_block 使用）；沒有向量的動漫為 -1"""
+        with self._lock:
+            anime_ids = np.asarray(anime_ids, dtype=np.int64)
+            if not self.ids.size:
+                return np.full(anime_ids.shape, -1, dtype=np.int64)
+            found = np.minimum(np.searchsorted(self.ids, anime_ids), self.ids.size - 1)
+            return np.where(self.ids[found] == anime_ids, found, -1)
+
+    def cosine_block(self, row_positions: np.ndarray, column_positions: np.ndarray) -> np.ndarray:
+        """
+        一批動漫與所有動漫的 TF-IDF cosine 相似度（直接對映射矩陣相乘，不建立完整的正規化向量矩陣）
+
+        Args:
+            row_positions: 這一批動漫的位置（positions() 的結果，-1 為沒有向量）
+            column_positions: 欄的動漫位置
+
+        Returns:
+            (len(row_positions), len(column_positions)) float32 矩陣；沒有向量的列 / 欄為 0
+        """
+        block = np.zeros((len(row_positions), len(column_positions)), dtype=np.float32)
+        with self._lock:
+            valid_rows = row_positions >= 0
+            valid_columns = column_positions >= 0
+            if self._matrix is None or not valid_rows.any() or not valid_columns.any():
+                return block
+            query_positions = row_positions[valid_rows]
+            weighted = np.asarray(self._matrix[self._rows[query_positions]]) * (self._idf * self._idf)
+            # (批次, 檔案列數) 再取出存活的列：cos = (d_i × idf) · (d_j × idf) / (|d_i × idf| |d_j × idf|)
+            raw = (weighted @ self._matrix.T)[:, self._rows]
+            denominator = self._doc_norms[query_positions][:, None] * self._doc_norms[None, :]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                cosine = np.where(denominator > 0, raw / denominator, 0.0).astype(np.float32)
+        rows = np.zeros((len(query_positions), len(column_positions)), dtype=np.float32)
+        rows[:, valid_columns] = cosine[:, column_positions[valid_columns]]
+        block[valid_rows] = rows
+        return block
+
+    def search(self, query: str, limit: int = 10, season: Optional[str] = None,
+               min_score: float = DEFAULT_MIN_SCORE,
+               min_relative_score: float = DEFAULT_MIN_RELATIVE_SCORE) -> List[Tuple[int, float]]:
+        """
+        以 TF-IDF cosine 相似度查詢
+
+        雜湊字元 n-gram 下，與動漫無關的描述也常因常用字得到 0.1~0.3 的分數，
+        分數門檻只能排除雜訊；是否採用本地結果另由呼叫端判斷描述是否與動漫相關。
+
+        Args:
+            min_score: 最低相似度
+            min_relative_score: 最低相似度佔最高分的比例
+
+        Returns:
+            List[(anime id, 相似度)]，依相似度由高到低
+        """
+        with self._lock:
+            if self._matrix is None or not self.ids.size or limit <= 0:
+                return []
+            weighted_query = self.vectorizer.transform_one(query, l2_normalize=False) * self._idf
+            query_norm = float(np.linalg.norm(weighted_query))
+            if query_norm == 0:
+                return []
+
+            # 直接對映射矩陣做乘法（不複製），再取出存活的列：
+            # scores = (D · (q × idf²)) / (|D × idf| |q × idf|)
+            scores = (self._matrix @ (weighted_query * self._idf))[self._rows]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                scores = np.where(self._doc_norms > 0, scores / (self._doc_norms * query_norm), 0.0)
+            if season is not None:
+                scores = np.where(self.seasons == season, scores, 0.0)
+
+            top_score = float(scores.max()) if scores.size else 0.0
+            candidates = np.flatnonzero(scores >= max(min_score, top_score * min_relative_score))
+            if candidates.size > limit:
+                candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+            order = candidates[np.lexsort((candidates, -scores[candidates]))]
+            return [(int(self.ids[i]), float(scores[i])) for i in order]
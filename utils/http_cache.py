@@ -0,0 +1,15 @@
+"""
+HTTP 快取驗證工具
+為封面圖片與列表 API 提供 ETag / Cache-Control，讓瀏覽器以 304 重用已下載的內容
+
+功能:
+1. 內容定址網址 - 封面網址帶 ?v=<SHA-256 前 16 碼>（雜湊由匯入時建立的 anime_image 清單提供），內容變更即換網址，可標記為 immutable 長期快取
+2. Cache-Control 常數 - 內容定址網址使用 IMMUTABLE，其餘（列表、未帶版本的圖片）使用 REVALIDATE
+"""
+
+# 內容定址網址：一年且不需重新驗證
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# 可快取但每次使用前需以 ETag 重新驗證
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+# 網址中的版本長度（SHA-256 十六進位前綴）
+IMAGE_VERSION_LENGTH = 16
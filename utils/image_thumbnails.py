@@ -0,0 +1,170 @@
+"""
+封面縮圖（WebP 衍生圖）
+推薦卡片只顯示小尺寸封面，原始 JPEG 平均約 370 KB；依固定寬度產生 WebP 縮圖並保存在磁碟快取
+
+功能:
+1. 固定寬度 - 只產生 THUMBNAIL_WIDTHS 中的寬度，任意請求寬度向上取最接近者，避免快取檔案無限增加
+2. 延遲產生 + 磁碟快取 - 第一次請求時產生，之後直接讀檔；原圖較新時自動重新產生
+   （鎖只針對同一張縮圖，不同封面 / 寬度可同時產生；寫入暫存檔後再取代）
+3. 匯入時預先產生 - generate_thumbnails() 供匯入流程或命令列批次產生
+4. srcset - build_srcset() 產生前端 <img srcset> 使用的網址列表
+
+Pillow 為可選套件：未安裝時 ensure_thumbnail() 返回 None，圖片路由改為提供原圖。
+
+使用方式:
+python utils/image_thumbnails.py           # 為所有封面產生縮圖
+"""
+
+import os
+import sys
+import threading
+import urllib.parse
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow 未安裝時只提供原圖
+    Image = None
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 原始封面目錄
+IMAGES_DIR = os.path.join(PROJECT_ROOT, 'anime_data', 'images')
+# 縮圖快取目錄（每個寬度一個子目錄）
+THUMBNAILS_DIR = os.path.join(PROJECT_ROOT, 'anime_data', 'thumbnails')
+# 提供的縮圖寬度（px）
+THUMBNAIL_WIDTHS = (160, 320, 480, 640)
+# WebP 品質（0-100）
+THUMBNAIL_QUALITY = 80
+
+# 產生中的縮圖：目標路徑 -> [鎖, 使用中的請求數]（同一張縮圖只產生一次，不同縮圖可同時產生）
+_generate_locks: Dict[str, List] = {}
+_generate_locks_guard = threading.Lock()
+
+
+@contextmanager
+def _target_lock(target: str) -> Iterator[None]:
+    """同一個縮圖路徑的鎖（沒有請求使用時移除）"""
+    with _generate_locks_guard:
+        entry = _generate_locks.setdefault(target, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _generate_locks_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _generate_locks[target]
+
+
+def thumbnails_available() -> bool:
+    """是否可產生縮圖（已安裝 Pillow）"""
+    return Image is not None
+
+
+def snap_width(width: int) -> int:
+    """將請求寬度對齊到 THUMBNAIL_WIDTHS（向上取最接近者，超過最大值時使用最大值）"""
+    for candidate in THUMBNAIL_WIDTHS:
+        if width <= candidate:
+            return candidate
+    return THUMBNAIL_WIDTHS[-1]
+
+
+def thumbnail_filename(filename: str) -> str:
+    """縮圖檔名（原檔名副檔名改為 .webp）"""
+    return os.path.splitext(filename)[0] + '.webp'
+
+
+def thumbnail_path(filename: str, width: int, thumbnails_dir: str = THUMBNAILS_DIR) -> str:
+    return os.path.join(thumbnails_dir, str(width), thumbnail_filename(filename))
+
+
+def ensure_thumbnail(filename: str, width: int, images_dir: str = IMAGES_DIR,
+                     thumbnails_dir: str = THUMBNAILS_DIR) -> Optional[str]:
+    """
+    取得縮圖路徑，縮圖不存在或比原圖舊時產生
+
+    Args:
+        filename: 原圖檔名（相對於 images_dir）
+        width: 縮圖寬度（須為 THUMBNAIL_WIDTHS 之一）
+
+    Returns:
+        縮圖的絕對路徑；Pillow 未安裝、原圖不存在或轉檔失敗時返回 None
+    """
+    if Image is None or width not in THUMBNAIL_WIDTHS:
+        return None
+    source = os.path.abspath(os.path.join(images_dir, filename))
+    # 拒絕跳出圖片目錄的路徑
+    if not source.startswith(os.path.abspath(images_dir) + os.sep) or not os.path.isfile(source):
+        return None
+
+    target = thumbnail_path(filename, width, thumbnails_dir)
+    source_mtime = os.path.getmtime(source)
+    if os.path.exists(target) and os.path.getmtime(target) >= source_mtime:
+        return target
+
+    with _target_lock(target):
+        # 等待鎖期間可能已由其他請求產生
+        if os.path.exists(target) and os.path.getmtime(target) >= source_mtime:
+            return target
+        # 先寫入暫存檔再取代，避免其他請求（或其他程序）讀到寫到一半的檔案
+        tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with Image.open(source) as image:
+                image = image.convert('RGB')
+                if image.width > width:
+                    height = round(image.height * width / image.width)
+                    image = image.resize((width, height), Image.LANCZOS)
+                image.save(tmp_path, 'WEBP', quality=THUMBNAIL_QUALITY, method=6)
+            os.replace(tmp_path, target)
+        except Exception as e:
+            print(f"產生縮圖失敗 {filename} ({width}px): {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return None
+    return target
+
+
+def generate_thumbnails(filenames: Optional[Iterable[str]] = None, images_dir: str = IMAGES_DIR,
+                        thumbnails_dir: str = THUMBNAILS_DIR) -> int:
+    """
+    為封面預先產生所有寬度的縮圖（已是最新的縮圖會略過）
+
+    Args:
+        filenames: 原圖檔名列表；None 代表 images_dir 下的所有 JPEG / PNG
+
+    Returns:
+        int: 可用的縮圖數量
+    """
+    if Image is None:
+        print("⚠️ 未安裝 Pillow，略過縮圖產生（pip install pillow）")
+        return 0
+    if filenames is None:
+        filenames = sorted(name for name in os.listdir(images_dir)
+                           if name.lower().endswith(('.jpg', '.jpeg', '.png')))
+    count = 0
+    for filename in filenames:
+        for width in THUMBNAIL_WIDTHS:
+            if ensure_thumbnail(filename, width, images_dir, thumbnails_dir):
+                count += 1
+    return count
+
+
+def build_srcset(base_url: str, filename: str, version: str = '') -> str:
+    """
+    產生 <img srcset> 字串（每個寬度一個 /images/<檔名>?w= 網址）
+
+    檔名會做 URL 編碼：srcset 以空白與逗號分隔項目，未編碼的檔名會被截斷。
+    version 為原圖內容雜湊前綴（見 database/image_manifest.py），提供時網址帶 &v= 以便長期快取。
+    """
+    image_url = f"{base_url}/images/{urllib.parse.quote(filename)}"
+    suffix = f"&v={version}" if version else ''
+    return ', '.join(f"{image_url}?w={width}{suffix} {width}w" for width in THUMBNAIL_WIDTHS)
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or None
+    total = generate_thumbnails(names)
+    print(f"✅ 縮圖完成：{total} 個檔案（寬度 {', '.join(map(str, THUMBNAIL_WIDTHS))}）")
@@ -7,6 +7,7 @@
 使用 OpenAI API 進行分類
 """
 
+import asyncio
 import os
 import sys
 import sqlite3
@@ -15,7 +16,7 @@ import time
 import requests
 import urllib.parse
 from datetime import datetime
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 # 導入本地 lemonade server
 #sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -23,7 +24,15 @@ from models.client import lemonade
 
 # 添加專案根目錄到 Python 路徑
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils.sample_queries_basic import recommend_similar_anime, basic_tag_search
+from utils.sample_queries_basic import recommend_similar_anime, basic_tag_search, semantic_search
+from utils.database.connection import get_connection
+from utils.llm_cache import llm_cache
+from utils.metrics import record_cache, record_usage, stage_span
+from utils.semantic_cache import semantic_cache
+from utils.single_flight import AsyncSingleFlight, SingleFlight
+from utils.speculative import SpeculativeExecutor, branch_abandoned
+from config import (CLASSIFICATION_WORKERS, LOCAL_RETRIEVAL_ENABLED, SERVER_CONCURRENCY,
+                    SPECULATIVE_CLASSIFICATION, STRUCTURED_CLASSIFICATION)
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # 載入 .env 文件
@@ -38,87 +47,81 @@ if not OPENAI_API_KEY:
     raise ValueError("請在 .env 文件中設定 OPENAI_API_KEY")
     
 openai_client = OpenAI(api_key=OPENAI_API_KEY)
+# 非同步客戶端（ASGI 服務使用）
+async_openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
 
 
 def get_all_genres(db_path):
     """從資料庫取得所有類別"""
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     cursor = conn.cursor()
-    cursor.execute("SELECT genres_json FROM anime")
-    genres = set()
-    for row in cursor.fetchall():
-        try:
-            genre_list = json.loads(row[0])
-            genres.update(genre_list)
-        except:
-            continue
-    conn.close()
-    return list(genres)
+    cursor.execute("""
+        SELECT g.name FROM genre g
+        WHERE EXISTS (SELECT 1 FROM anime_genre ag WHERE ag.genre_id = g.id)
+        ORDER BY g.name
+    """)
+    return [row[0] for row in cursor.fetchall()]
 
 def get_anime_genres(db_path, anime_name):
     """從資料庫中查找特定動漫的類別"""
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     cursor = conn.cursor()
     # 使用模糊匹配來查找動漫
-    cursor.execute("SELECT title, genres_json FROM anime WHERE title LIKE ?", (f"%{anime_name}%",))
+    cursor.execute("SELECT id, title FROM anime WHERE title LIKE ?", (f"%{anime_name}%",))
     results = cursor.fetchall()
-    conn.close()
 
     if results:
-        # 找到完全匹配的
-        exact_match = next((r for r in results if r[0].lower() == anime_name.lower()), None)
-        if exact_match:
-            return json.loads(exact_match[1]), exact_match[0]
-        # 否則返回第一個結果
-        return json.loads(results[0][1]), results[0][0]
+        # 找到完全匹配的，否則使用第一個結果
+        match = next((r for r in results if r[1].lower() == anime_name.lower()), results[0])
+        cursor.execute("""
+            SELECT g.name FROM anime_genre ag
+            JOIN genre g ON g.id = ag.genre_id
+            WHERE ag.anime_id = ?
+            ORDER BY ag.position
+        """, (match[0],))
+        genres = [row[0] for row in cursor.fetchall()]
+        return genres, match[1]
     return None, None
 
 def get_second_most_common_genre_from_likes(db_path):
     """從資料庫中提取所有 like=1 的動漫標籤，返回數量第二多的標籤"""
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     cursor = conn.cursor()
     
-    try:
-        # 查詢所有 like=1 的動漫的 genres_json
-        cursor.execute("SELECT genres_json FROM anime WHERE `like` = 1")
-        
-        # 統計每個標籤出現的次數
-        genre_count = {}
-        for row in cursor.fetchall():
-            try:
-                genres = json.loads(row[0])
-                for genre in genres:
-                    genre_count[genre] = genre_count.get(genre, 0) + 1
-            except:
-                continue
-        
-        # 如果沒有找到任何標籤，返回空列表
-        if not genre_count:
-            print("未找到任何喜愛的動漫標籤")
-            return []
-        
-        # 按出現次數排序
-        sorted_genres = sorted(genre_count.items(), key=lambda x: x[1], reverse=True)
-        
-        # 調試輸出
-        print(f"喜愛動漫的標籤統計:")
-        for genre, count in sorted_genres[:5]:  # 顯示前5個
-            print(f"  {genre}: {count}次")
-        
-        # 返回前兩個最多的標籤
-        if len(sorted_genres) >= 2:
-            top_two = [sorted_genres[0][0], sorted_genres[1][0]]
-            print(f"選擇數量前2多的標籤: {top_two}")
-            return top_two
-        # 如果只有一個標籤，返回它
-        elif len(sorted_genres) == 1:
-            print(f"只有一個標籤，返回: {sorted_genres[0][0]}")
-            return [sorted_genres[0][0]]
-        else:
-            return []
-            
-    finally:
-        conn.close()
+    # 以關聯表統計所有 like=1 的動漫中每個標籤出現的次數
+    # 同次數時依第一次出現的順序（動漫 id、標籤位置）排序
+    cursor.execute("""
+        SELECT g.name, COUNT(*) AS cnt
+        FROM anime a
+        JOIN anime_genre ag ON ag.anime_id = a.id
+        JOIN genre g ON g.id = ag.genre_id
+        WHERE a.`like` = 1
+        GROUP BY g.id
+        ORDER BY cnt DESC, MIN(a.id * 1000 + ag.position)
+    """)
+    sorted_genres = cursor.fetchall()
+    
+    # 如果沒有找到任何標籤，返回空列表
+    if not sorted_genres:
+        print("未找到任何喜愛的動漫標籤")
+        return []
+    
+    # 調試輸出
+    print(f"喜愛動漫的標籤統計:")
+    for genre, count in sorted_genres[:5]:  # 顯示前5個
+        print(f"  {genre}: {count}次")
+    
+    # 返回前兩個最多的標籤
+    if len(sorted_genres) >= 2:
+        top_two = [sorted_genres[0][0], sorted_genres[1][0]]
+        print(f"選擇數量前2多的標籤: {top_two}")
+        return top_two
+    # 如果只有一個標籤，返回它
+    elif len(sorted_genres) == 1:
+        print(f"只有一個標籤，返回: {sorted_genres[0][0]}")
+        return [sorted_genres[0][0]]
+    else:
+        return []
 
 def call_external_api_for_recommendation(user_input, count=3):
     """調用外部 API 獲取推薦"""
@@ -173,18 +176,27 @@ def use_openai_for_genre_classification(user_input, genres_list, max_retries=3):
 
         # 使用 OpenAI API 進行分類，添加重試機制
         for attempt in range(max_retries):
+            if branch_abandoned():
+                # 推測模式下類型不是2，不再送出請求
+                return []
             try:
                 print(f"嘗試進行類別分類... (第 {attempt + 1} 次)")
-                response = openai_client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.1,
-                    max_tokens=100,
-                    timeout=60
-                )
+                messages = [{"role": "user", "content": prompt}]
+                with stage_span("extract"):
+                    result_text = llm_cache.cached_completion(
+                        "gpt-4o", messages, 0.1,
+                        lambda: record_usage(openai_client.chat.completions.create(
+                            model="gpt-4o",
+                            messages=messages,
+                            temperature=0.1,
+                            max_tokens=100,
+                            timeout=60
+                        )).choices[0].message.content,
+                        extra={"max_tokens": 100}
+                    )
 
                 # 解析回應並提取類別
-                result_text = response.choices[0].message.content.strip()
+                result_text = result_text.strip()
                 print(f"OpenAI 原始回應：{result_text}")
 
                 valid_results = []
@@ -211,123 +223,546 @@ def use_openai_for_genre_classification(user_input, genres_list, max_retries=3):
         print(f"OpenAI 分類失敗：{str(e)}")
         return []
 
-def classify_input_request(user_input, season, count, max_retries=3, use_favorites=False):
-    """
-    分類用戶輸入請求
-    返回格式：
-    - 類型1：[1, 動漫名稱]
-    - 類型2：[2, 類別1, 類別2] (0至2個類別)
-    - 類型3：[3, 使用者輸入]
-    """
-    try:
-        prompt = (
-            f"請分析以下用戶輸入屬於哪種類型：\n"
-            f"輸入文本：{user_input}\n\n"
-            f"判斷規則：\n"
-            f"1: 提到特定動漫名稱的推薦請求（例如：有沒有和火影忍者相似的動漫）\n"
-            f"2: 提到動漫類別、特徵、題材的推薦請求 （例如：有沒有推薦的XX類型番劇 、請給我做個人化推薦）\n"
-            f"3: 其他或無法判斷的請求\n\n"
-            f"請只返回一個數字(1,2,3)，不要有任何其他文字"
-        )
-        
-        # 使用 lemonade server 進行分類，添加重試機制
-        request_type = 3  # 默認為類型3
-        for attempt in range(max_retries):
-            try:
-                print(f"嘗試進行請求類型判斷... (第 {attempt + 1} 次)")
-                start_time = time.time()
-                
-                # 使用 lemonade server 進行分類
-                response = lemonade.simple_chat(prompt)
-                end_time = time.time()
-                print(f"lemonade server 耗時: {end_time - start_time} 秒")
-
-                result = response.strip()
-                request_type = int(result)
-                if request_type not in [1, 2, 3]:
-                    print(f"lemonade server 返回了無效的類型：{result}")
-                    request_type = 3
-                print(f"分類結果：類型 {request_type}")
-                break  # 成功獲得回應，跳出重試循環
-            except Exception as e:
-                if attempt < max_retries - 1:
-                    print(f"lemonade server 請求失敗，等待1秒後重試... ({attempt + 1}/{max_retries}): {str(e)}")
-                    time.sleep(1)
-                    continue
-                print(f"lemonade server 請求失敗：{str(e)}")
+# 個人化推薦按鈕送出的固定文字（一律視為類型2）
+PERSONALIZED_REQUEST_TEXT = "請給我做個人化推薦"
+
+# 資料庫路徑
+DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'anime_database.db')
+
+# 推測模式每個請求最多同時送出的分支數（類型判斷、名稱提取、類別分類）
+SPECULATIVE_BRANCHES = 3
+# 推測模式共用的分支執行器（LLM 呼叫皆為網路 I/O，執行緒即可並行；未採用的分支立即釋出名額）
+_classification_executor = SpeculativeExecutor(
+    CLASSIFICATION_WORKERS or SERVER_CONCURRENCY * SPECULATIVE_BRANCHES, name="classify")
+
+
+def classify_request_type(user_input, max_retries=3):
+    """使用 lemonade server 判斷請求類型（1/2/3），失敗時返回 3"""
+    prompt = (
+        f"請分析以下用戶輸入屬於哪種類型：\n"
+        f"輸入文本：{user_input}\n\n"
+        f"判斷規則：\n"
+        f"1: 提到特定動漫名稱的推薦請求（例如：有沒有和火影忍者相似的動漫）\n"
+        f"2: 提到動漫類別、特徵、題材的推薦請求 （例如：有沒有推薦的XX類型番劇 、請給我做個人化推薦）\n"
+        f"3: 其他或無法判斷的請求\n\n"
+        f"請只返回一個數字(1,2,3)，不要有任何其他文字"
+    )
+    
+    # 使用 lemonade server 進行分類，添加重試機制
+    request_type = 3  # 默認為類型3
+    for attempt in range(max_retries):
+        try:
+            print(f"嘗試進行請求類型判斷... (第 {attempt + 1} 次)")
+            start_time = time.time()
+            
+            # 使用 lemonade server 進行分類（相同輸入的分類結果固定，可使用回應快取）
+            with stage_span("classify"):
+                response = lemonade.simple_chat(prompt, use_cache=True)
+            end_time = time.time()
+            print(f"lemonade server 耗時: {end_time - start_time} 秒")
+
+            result = response.strip()
+            request_type = int(result)
+            if request_type not in [1, 2, 3]:
+                print(f"lemonade server 返回了無效的類型：{result}")
                 request_type = 3
-                break
-
-        # 資料庫路徑
-        db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'anime_database.db')
-        if user_input == "請給我做個人化推薦":
-            request_type = 2
-        # 根據類型進行處理
-        if request_type == 1:
-            # 類型1：提取動漫名稱
-            name_prompt = (
-                f"請從以下文本中提取動漫名稱（只返回名稱本身，不要有其他文字）：\n"
-                f"{user_input}"
-            )
-
-            anime_name = None
-            for attempt in range(max_retries):
-                try:
-                    print(f"嘗試提取動漫名稱... (第 {attempt + 1} 次)")
-                    response = openai_client.chat.completions.create(
+            print(f"分類結果：類型 {request_type}")
+            break  # 成功獲得回應，跳出重試循環
+        except Exception as e:
+            if attempt < max_retries - 1:
+                print(f"lemonade server 請求失敗，等待1秒後重試... ({attempt + 1}/{max_retries}): {str(e)}")
+                time.sleep(1)
+                continue
+            print(f"lemonade server 請求失敗：{str(e)}")
+            request_type = 3
+            break
+    return request_type
+
+def extract_anime_name(user_input, max_retries=3):
+    """使用 OpenAI 從輸入中提取動漫名稱，失敗時返回 None"""
+    name_prompt = (
+        f"請從以下文本中提取動漫名稱（只返回名稱本身，不要有其他文字）：\n"
+        f"{user_input}"
+    )
+
+    for attempt in range(max_retries):
+        if branch_abandoned():
+            # 推測模式下類型不是1，不再送出請求
+            return None
+        try:
+            print(f"嘗試提取動漫名稱... (第 {attempt + 1} 次)")
+            messages = [{"role": "user", "content": name_prompt}]
+            with stage_span("extract"):
+                anime_name = llm_cache.cached_completion(
+                    "gpt-4o", messages, 0.1,
+                    lambda: record_usage(openai_client.chat.completions.create(
                         model="gpt-4o",
-                        messages=[{"role": "user", "content": name_prompt}],
+                        messages=messages,
                         temperature=0.1,
                         max_tokens=50,
                         timeout=60
-                    )
-                    anime_name = response.choices[0].message.content.strip()
-                    print(f"提取到的動漫名稱：{anime_name}")
-                    break
-                except Exception as e:
-                    if attempt < max_retries - 1:
-                        print(f"提取名稱失敗，等待1秒後重試... ({attempt + 1}/{max_retries}): {str(e)}")
-                        time.sleep(1)
-                        continue
-                    print(f"提取動漫名稱失敗：{str(e)}")
-                    return [3, user_input]
-
-            if anime_name:
-                # 驗證動漫是否在資料庫中
-                reference_genres, found_title = get_anime_genres(db_path, anime_name)
-
-                if found_title:
-                    # 使用找到的標題進行推薦
-                    result = recommend_similar_anime(found_title, limit=10, season=season)
-                    #print(f"推薦結果：{result}")
-                    return [1, result]
-                else:
-                    # 如果資料庫中找不到該動漫，使用原始名稱
-                    result = recommend_similar_anime(anime_name, limit=10, season=season)
-                    #print(f"推薦結果：{result}")
-                    return [1, result]
-
-        elif request_type == 2:
-            # 類型2：類別推薦
-            print("獲取資料庫中的所有類別...")
-            genres_list = get_all_genres(db_path)
-            print(f"找到 {len(genres_list)} 個可用類別")
-
-            # 使用 OpenAI 進行類別分類
+                    )).choices[0].message.content,
+                    extra={"max_tokens": 50}
+                ).strip()
+            print(f"提取到的動漫名稱：{anime_name}")
+            return anime_name
+        except Exception as e:
+            if attempt < max_retries - 1:
+                print(f"提取名稱失敗，等待1秒後重試... ({attempt + 1}/{max_retries}): {str(e)}")
+                time.sleep(1)
+                continue
+            print(f"提取動漫名稱失敗：{str(e)}")
+    return None
+
+def classify_genres(user_input, db_path=DB_PATH, use_favorites=False):
+    """取得類型2的推薦類別（喜愛清單統計或 OpenAI 分類）"""
+    if use_favorites:
+        # 從資料庫中提取所有 like=1 的動漫標籤
+        return get_second_most_common_genre_from_likes(db_path)
+
+    print("獲取資料庫中的所有類別...")
+    genres_list = get_all_genres(db_path)
+    print(f"找到 {len(genres_list)} 個可用類別")
+    return use_openai_for_genre_classification(user_input, genres_list)
+
+def recommend_by_anime_name(anime_name, season, db_path=DB_PATH):
+    """類型1：依動漫名稱推薦相似作品"""
+    # 驗證動漫是否在資料庫中
+    reference_genres, found_title = get_anime_genres(db_path, anime_name)
+
+    # 找到時使用資料庫中的標題，否則使用原始名稱
+    result = recommend_similar_anime(found_title or anime_name, limit=10, season=season)
+    return [1, result]
+
+def recommend_by_genres(recommended_genres, season):
+    """類型2：依類別推薦"""
+    print(f"推薦的類別：{recommended_genres}")
+    result = basic_tag_search(recommended_genres, season=season)
+    return [2, result]
+
+def build_structured_classification_schema(genres_list):
+    """建立結構化分類的 JSON schema（類別以資料庫類別列表作為 enum）"""
+    genre_items = {"type": "string", "enum": list(genres_list)} if genres_list else {"type": "string"}
+    return {
+        "name": "anime_request_classification",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "type": {"type": "integer", "enum": [1, 2, 3]},
+                "anime_name": {"type": ["string", "null"]},
+                "genres": {"type": "array", "items": genre_items},
+            },
+            "required": ["type", "anime_name", "genres"],
+            "additionalProperties": False,
+        },
+    }
+
+def parse_structured_classification(result_text, genres_list):
+    """
+    解析並驗證結構化分類回應
+
+    Returns:
+        dict: {"type": int, "anime_name": str|None, "genres": list}；格式不符時返回 None
+    """
+    try:
+        data = json.loads(result_text)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(data, dict):
+        return None
+
+    request_type = data.get("type")
+    if isinstance(request_type, str) and request_type.strip().isdigit():
+        request_type = int(request_type)
+    if request_type not in (1, 2, 3):
+        return None
+
+    anime_name = data.get("anime_name")
+    anime_name = anime_name.strip() if isinstance(anime_name, str) else None
+    if request_type == 1 and not anime_name:
+        # 類型1卻沒有名稱，無法推薦
+        return None
+
+    genres = data.get("genres") or []
+    if not isinstance(genres, list):
+        return None
+    # 只保留資料庫中存在的類別，最多2個
+    valid_genres = []
+    for genre in genres:
+        if isinstance(genre, str) and genre.strip() in genres_list and genre.strip() not in valid_genres:
+            valid_genres.append(genre.strip())
+
+    return {"type": request_type, "anime_name": anime_name or None, "genres": valid_genres[:2]}
+
+def build_structured_classification_request(user_input, genres_list):
+    """建立結構化分類的請求參數（同步與非同步版本共用）"""
+    prompt = (
+        f"請分析以下用戶輸入，並以 JSON 回覆：\n"
+        f"輸入文本：{user_input}\n\n"
+        f"type 判斷規則：\n"
+        f"1: 提到特定動漫名稱的推薦請求（例如：有沒有和火影忍者相似的動漫）\n"
+        f"2: 提到動漫類別、特徵、題材的推薦請求 （例如：有沒有推薦的XX類型番劇 、請給我做個人化推薦）\n"
+        f"3: 其他或無法判斷的請求\n\n"
+        f"anime_name：type 為 1 時填入提到的動漫名稱（只填名稱本身），否則為 null\n"
+        f"genres：從以下動漫類別中，選出最符合輸入的0至2個類別，若沒有符合的不強制選擇，"
+        f"若為個人化推薦則為空列表：\n"
+        + "\n".join(f"{i+1}. {genre}" for i, genre in enumerate(genres_list))
+    )
+    return {
+        "model": "gpt-4o",
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.1,
+        "max_tokens": 150,
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": build_structured_classification_schema(genres_list),
+        },
+    }
+
+def _parse_structured_result(result_text, genres_list):
+    print(f"結構化分類原始回應：{result_text}")
+    parsed = parse_structured_classification(result_text, genres_list)
+    if parsed is None:
+        # 解析失敗直接交由多步驟流程處理，不重送相同請求
+        print("結構化分類回應格式不符")
+    return parsed
+
+def classify_input_structured(user_input, genres_list, max_retries=3):
+    """
+    單次結構化輸出分類：一次請求同時取得類型、動漫名稱與類別
+
+    Returns:
+        dict: parse_structured_classification 的結果；請求或解析失敗時返回 None
+    """
+    params = build_structured_classification_request(user_input, genres_list)
+    extra = {"max_tokens": params["max_tokens"], "response_format": params["response_format"]}
+
+    for attempt in range(max_retries):
+        try:
+            print(f"嘗試進行結構化分類... (第 {attempt + 1} 次)")
+            start_time = time.time()
+            # 單次請求同時完成類型判斷與名稱 / 類別提取，整段記為 classify
+            with stage_span("classify"):
+                result_text = llm_cache.cached_completion(
+                    params["model"], params["messages"], params["temperature"],
+                    lambda: record_usage(openai_client.chat.completions.create(
+                        **params, timeout=60
+                    )).choices[0].message.content,
+                    extra=extra
+                )
+            print(f"結構化分類耗時: {time.time() - start_time} 秒")
+        except Exception as e:
+            if attempt < max_retries - 1:
+                print(f"結構化分類請求失敗，等待1秒後重試... ({attempt + 1}/{max_retries}): {str(e)}")
+                time.sleep(1)
+                continue
+            print(f"結構化分類請求失敗：{str(e)}")
+            return None
+        return _parse_structured_result(result_text, genres_list)
+    return None
+
+async def aclassify_input_structured(user_input, genres_list, max_retries=3):
+    """非同步版的 classify_input_structured（AsyncOpenAI，等待回應時不佔用執行緒）"""
+    params = build_structured_classification_request(user_input, genres_list)
+    extra = {"max_tokens": params["max_tokens"], "response_format": params["response_format"]}
+
+    async def create():
+        response = await async_openai_client.chat.completions.create(**params, timeout=60)
+        return record_usage(response).choices[0].message.content
+
+    for attempt in range(max_retries):
+        try:
+            print(f"嘗試進行結構化分類... (第 {attempt + 1} 次)")
+            start_time = time.time()
+            with stage_span("classify"):
+                result_text = await llm_cache.acached_completion(
+                    params["model"], params["messages"], params["temperature"], create, extra=extra)
+            print(f"結構化分類耗時: {time.time() - start_time} 秒")
+        except Exception as e:
+            if attempt < max_retries - 1:
+                print(f"結構化分類請求失敗，等待1秒後重試... ({attempt + 1}/{max_retries}): {str(e)}")
+                await asyncio.sleep(1)
+                continue
+            print(f"結構化分類請求失敗：{str(e)}")
+            return None
+        return _parse_structured_result(result_text, genres_list)
+    return None
+
+def _classify_structured(user_input, max_retries):
+    """結構化模式：單次 LLM 請求完成分類，解析失敗時返回 None"""
+    genres_list = get_all_genres(DB_PATH)
+    parsed = classify_input_structured(user_input, genres_list, max_retries)
+    if parsed is not None:
+        print(f"結構化分類結果：類型 {parsed['type']}，名稱 {parsed['anime_name']}，類別 {parsed['genres']}")
+    return parsed
+
+def _classify_sequential(user_input, max_retries, use_favorites):
+    """多步驟模式：依序進行類型判斷，再依類型提取名稱或分類類別"""
+    request_type = classify_request_type(user_input, max_retries)
+    if user_input == PERSONALIZED_REQUEST_TEXT:
+        request_type = 2
+    classification = {"type": request_type, "anime_name": None, "genres": []}
+    # 根據類型進行處理
+    if request_type == 1:
+        # 類型1：提取動漫名稱
+        classification["anime_name"] = extract_anime_name(user_input, max_retries)
+    elif request_type == 2 and not use_favorites:
+        # 類型2：類別分類（個人化推薦於執行時改用喜愛清單）
+        classification["genres"] = classify_genres(user_input)
+    return classification
+
+def _submit_classification(fn, *args):
+    """提交推測分支（執行器會複製目前的 context，階段紀錄才會歸入同一請求）"""
+    return _classification_executor.submit(fn, *args)
+
+def _classify_speculative(user_input, max_retries, use_favorites):
+    """推測模式：類型判斷、名稱提取、類別分類同時進行，只採用符合類型的分支（其餘分支立即放棄）"""
+    start_time = time.time()
+    if user_input == PERSONALIZED_REQUEST_TEXT:
+        # 固定文字一律為類型2，不需等待類型判斷
+        type_branch = None
+        name_branch = None
+    else:
+        type_branch = _submit_classification(classify_request_type, user_input, max_retries)
+        name_branch = _submit_classification(extract_anime_name, user_input, max_retries)
+    genre_branch = None if use_favorites else _submit_classification(classify_genres, user_input)
+
+    wanted = None
+    try:
+        request_type = type_branch.result() if type_branch else 2
+        print(f"推測模式：類型判斷完成（類型 {request_type}），耗時 {time.time() - start_time:.2f} 秒")
+        wanted = {1: name_branch, 2: genre_branch}.get(request_type)
+        # 先放棄未採用的分支，再等待需要的分支
+        for branch in (name_branch, genre_branch):
+            if branch is not None and branch is not wanted:
+                branch.abandon()
+
+        classification = {"type": request_type, "anime_name": None, "genres": []}
+        if request_type == 1:
+            classification["anime_name"] = wanted.result()
+        elif request_type == 2 and wanted is not None:
+            classification["genres"] = wanted.result()
+        return classification
+    finally:
+        # 發生例外時也不讓分支繼續佔用名額
+        for branch in (type_branch, name_branch, genre_branch):
+            if branch is not None and not branch.future.done():
+                branch.abandon()
+
+def classify_input(user_input, max_retries=3, use_favorites=False, speculative=None, structured=None):
+    """
+    只進行分類（不查詢推薦結果）
+
+    Returns:
+        dict: {"type": 1/2/3, "anime_name": str|None, "genres": list}
+    """
+    if speculative is None:
+        speculative = SPECULATIVE_CLASSIFICATION
+    if structured is None:
+        structured = STRUCTURED_CLASSIFICATION
+
+    if structured:
+        classification = _classify_structured(user_input, max_retries)
+        if classification is not None:
+            if user_input == PERSONALIZED_REQUEST_TEXT:
+                classification["type"] = 2
+            return classification
+        print("結構化分類失敗，改用多步驟分類")
+
+    if speculative:
+        return _classify_speculative(user_input, max_retries, use_favorites)
+    return _classify_sequential(user_input, max_retries, use_favorites)
+
+def execute_classification(classification, user_input, season, count, use_favorites=False):
+    """依分類結果查詢推薦（類型1名稱提取失敗時返回 [3, user_input]）"""
+    request_type = classification["type"]
+    if request_type == 1:
+        if not classification["anime_name"]:
+            return [3, user_input]
+        with stage_span("db_query"):
+            return recommend_by_anime_name(classification["anime_name"], season)
+    elif request_type == 2:
+        with stage_span("db_query"):
             if use_favorites:
                 # 從資料庫中提取所有 like=1 的動漫標籤
-                recommended_genres = get_second_most_common_genre_from_likes(db_path)
-            else:
-                recommended_genres = use_openai_for_genre_classification(user_input, genres_list)
-            
-            print(f"推薦的類別：{recommended_genres}")
-            result = basic_tag_search(recommended_genres, season=season)
-
-            return [2, result]
-        else:
-            # 類型3：其他
+                return recommend_by_genres(get_second_most_common_genre_from_likes(DB_PATH), season)
+            return recommend_by_genres(classification["genres"], season)
+    else:
+        # 類型3：其他（與動漫相關的描述先以本地向量索引檢索，沒有結果時才呼叫外部 API）
+        if LOCAL_RETRIEVAL_ENABLED and has_anime_intent(user_input):
+            with stage_span("db_query"):
+                candidates = semantic_search(user_input, limit=max(count, 10), season=season)
+            if candidates:
+                return [3, candidates]
+            print("本地檢索沒有結果，改用外部 API")
+        with stage_span("external_api"):
             result = call_external_api_for_recommendation(user_input, count=count)
-            return [3, result]
+        return [3, result]
+
+# 類別的其他說法（語意快取檢查類別是否出現在輸入中時使用）
+GENRE_SYNONYMS = {
+    "冒險": ("adventure",),
+    "動作": ("action", "熱血"),
+    "喜劇": ("comedy", "搞笑"),
+    "奇幻": ("fantasy", "魔幻"),
+    "後宮": ("harem",),
+    "恐怖": ("horror", "驚悚"),
+    "戲劇": ("drama", "劇情"),
+    "日常": ("slice of life",),
+    "校園": ("school", "學園"),
+    "機甲": ("mecha", "機器人"),
+    "武士": ("samurai",),
+    "歷史": ("historical", "history"),
+    "浪漫": ("romance", "romantic", "戀愛", "愛情"),
+    "神秘": ("mystery", "懸疑", "推理"),
+    "科幻": ("sci-fi", "scifi", "science fiction"),
+    "超能力": ("superpower", "super power", "異能"),
+    "超自然": ("supernatural",),
+    "運動": ("sports", "sport"),
+    "青年": ("seinen",),
+    "音樂": ("music",),
+    "魔法": ("magic",),
+}
+
+def mentioned_genres(user_input, genres=GENRE_SYNONYMS):
+    """輸入中提到的類別（類別名稱或 GENRE_SYNONYMS 中的說法，比對時忽略大小寫、空白與標點）"""
+    normalize = semantic_cache.vectorizer.normalize
+    compact_input = normalize(user_input)
+    return {genre for genre in genres
+            if any(normalize(form) in compact_input for form in (genre,) + GENRE_SYNONYMS.get(genre, ()))}
+
+# 表示描述與動漫相關的詞（類別與其他說法另由 mentioned_genres 判斷）
+ANIME_INTENT_TERMS = ("動畫", "動漫", "番", "anime", "作品", "角色", "主角", "劇情", "漫畫", "manga", "聲優")
+
+def has_anime_intent(user_input):
+    """
+    描述是否與動漫相關（提到動漫相關詞或任一類別）
+
+    字元 n-gram 向量對任何文字都會找到分數相近的作品（天氣、拉麵店也有 0.1~0.2），
+    類型3只有與動漫相關的描述才採用本地檢索，其餘交給外部 API。
+    """
+    normalize = semantic_cache.vectorizer.normalize
+    compact_input = normalize(user_input)
+    return any(normalize(term) in compact_input for term in ANIME_INTENT_TERMS) or bool(mentioned_genres(user_input))
+
+def _validate_cached_classification(classification, user_input):
+    """
+    語意快取命中時的檢查
+    - 類型1：動漫名稱必須出現在新的輸入中
+    - 類型2：快取的每個類別都必須出現在新的輸入中，且新的輸入沒有提到其他類別
+      （字元 n-gram 相似度無法區分只換了類別詞的句子，例：奇幻 / 戀愛）
+    """
+    if classification["type"] == 1:
+        compact_input = semantic_cache.vectorizer.normalize(user_input)
+        return semantic_cache.vectorizer.normalize(classification["anime_name"]) in compact_input
+    if classification["type"] == 2:
+        genres = set(classification["genres"])
+        return bool(genres) and mentioned_genres(user_input, GENRE_SYNONYMS.keys() | genres) == genres
+    return True
+
+# 進行中的相同請求共用同一次計算（執行緒版供 Flask、非同步版供 ASGI 服務）
+_request_flight = SingleFlight("classify_input_request")
+_async_request_flight = AsyncSingleFlight("aclassify_input_request")
+
+def request_key(user_input, season, count, use_favorites=False):
+    """請求合併的鍵：正規化描述（去除多餘空白）、季度、數量、是否使用收藏"""
+    return (" ".join((user_input or "").split()), season or None, count, bool(use_favorites))
+
+def request_flight_stats():
+    """分類請求合併統計"""
+    return {"classify_input_request": _request_flight.stats(),
+            "aclassify_input_request": _async_request_flight.stats()}
+
+def classify_input_request(user_input, season, count, max_retries=3, use_favorites=False,
+                           speculative=None, structured=None):
+    """
+    分類用戶輸入請求
+    返回格式：
+    - 類型1：[1, 推薦動漫列表]
+    - 類型2：[2, 推薦動漫列表]
+    - 類型3：[3, 本地檢索的動漫列表]（描述與動漫無關或本地沒有結果時為 [3, 外部 API 回應]）
+
+    Args:
+        speculative: 是否使用推測模式（None 時依 config.SPECULATIVE_CLASSIFICATION）。
+            推測模式會同時送出類型判斷、名稱提取與類別分類，只保留符合類型的結果，
+            延遲約為最慢的一次 LLM 呼叫，代價是多出未被採用的 LLM 呼叫。
+        structured: 是否使用單次結構化輸出分類（None 時依 config.STRUCTURED_CLASSIFICATION）。
+            一次請求同時返回 {type, anime_name, genres}，解析失敗時才改用多步驟流程。
+
+    相似的輸入（語意快取 cosine 相似度達門檻）直接重用先前的分類結果，不呼叫 LLM；
+    推薦結果仍依目前的資料庫內容查詢。
+    相同的請求（描述、季度、數量、是否使用收藏）同時進行時只執行一次，其餘請求共用結果。
+    """
+    key = request_key(user_input, season, count, use_favorites) + (speculative, structured)
+    return _request_flight.do(key, lambda: _classify_input_request(
+        user_input, season, count, max_retries, use_favorites, speculative, structured))
+
+def _classify_input_request(user_input, season, count, max_retries, use_favorites, speculative, structured):
+    try:
+        classification = _lookup_cached_classification(user_input)
+        if classification is None:
+            classification = classify_input(user_input, max_retries, use_favorites, speculative, structured)
+            _remember_classification(user_input, classification, use_favorites)
+        return execute_classification(classification, user_input, season, count, use_favorites)
+
+    except Exception as e:
+        print(f"分類過程發生錯誤：{str(e)}")
+        return [3, user_input]
+
+def _lookup_cached_classification(user_input):
+    """查詢語意快取（命中時返回分類結果的副本；記為 classify 階段的快取查詢）"""
+    with stage_span("classify"):
+        classification = semantic_cache.lookup(
+            user_input, validate=lambda cached: _validate_cached_classification(cached, user_input))
+        record_cache("semantic", classification is not None)
+    if classification is not None:
+        print(f"語意快取命中：類型 {classification['type']}")
+    return classification
+
+def _remember_classification(user_input, classification, use_favorites):
+    """名稱提取失敗、或個人化推薦（未分類類別）的結果不寫入快取"""
+    failed = classification["type"] == 1 and not classification["anime_name"]
+    if not failed and not (classification["type"] == 2 and use_favorites):
+        semantic_cache.add(user_input, classification)
+
+async def aclassify_input(user_input, max_retries=3, use_favorites=False):
+    """
+    非同步版的 classify_input
+
+    結構化分類（預設）以 AsyncOpenAI 完成；結構化分類關閉或失敗時，
+    多步驟流程沿用同步實作並在執行緒中執行。
+    """
+    if STRUCTURED_CLASSIFICATION:
+        genres_list = await asyncio.to_thread(get_all_genres, DB_PATH)
+        classification = await aclassify_input_structured(user_input, genres_list, max_retries)
+        if classification is not None:
+            print(f"結構化分類結果：類型 {classification['type']}，名稱 {classification['anime_name']}，類別 {classification['genres']}")
+            if user_input == PERSONALIZED_REQUEST_TEXT:
+                classification["type"] = 2
+            return classification
+        print("結構化分類失敗，改用多步驟分類")
+    return await asyncio.to_thread(classify_input, user_input, max_retries, use_favorites, None, False)
+
+async def aclassify_input_request(user_input, season, count, max_retries=3, use_favorites=False):
+    """
+    非同步版的 classify_input_request（ASGI 服務使用）
+
+    LLM 呼叫以 AsyncOpenAI 進行；資料庫查詢與外部 API 呼叫在執行緒中執行，不阻塞事件迴圈。
+    返回格式與 classify_input_request 相同。
+    """
+    return await _async_request_flight.do(
+        request_key(user_input, season, count, use_favorites),
+        lambda: _aclassify_input_request(user_input, season, count, max_retries, use_favorites))
+
+async def _aclassify_input_request(user_input, season, count, max_retries, use_favorites):
+    try:
+        # 語意快取需向量化輸入並掃描快取矩陣，在執行緒中執行以免阻塞事件迴圈
+        classification = await asyncio.to_thread(_lookup_cached_classification, user_input)
+        if classification is None:
+            classification = await aclassify_input(user_input, max_retries, use_favorites)
+            await asyncio.to_thread(_remember_classification, user_input, classification, use_favorites)
+        return await asyncio.to_thread(execute_classification, classification, user_input, season, count, use_favorites)
 
     except Exception as e:
         print(f"分類過程發生錯誤：{str(e)}")
@@ -369,7 +804,7 @@ def main():
     print("-" * 50)
 
     # 進行分類
-    result = classify_input_request(user_input)
+    result = classify_input_request(user_input, season=None, count=10)
 
     # 輸出結果到終端機
     print(f"\n分類結果：{result}")
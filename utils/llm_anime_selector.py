@@ -7,9 +7,13 @@ LLM 動漫選擇器
 
 import os
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Iterator, Optional, Tuple
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
+
+from utils.llm_cache import llm_cache
+from utils.metrics import record_usage
+from utils.single_flight import AsyncSingleFlight, SingleFlight
 
 # 載入環境變數
 load_dotenv()
@@ -23,7 +27,12 @@ class LLMAnimeSelector:
             
         # 初始化 OpenAI 客戶端
         self.openai_client = OpenAI(api_key=self.openai_api_key)
+        # 非同步客戶端（ASGI 服務使用）
+        self.async_openai_client = AsyncOpenAI(api_key=self.openai_api_key)
         self.model = "gpt-4o"  # 使用 GPT-4
+        # 相同的選擇請求同時進行時只呼叫一次 LLM
+        self._select_flight = SingleFlight("select_anime")
+        self._async_select_flight = AsyncSingleFlight("aselect_anime")
         
     def format_anime_for_llm(self, anime_list: List[Dict]) -> str:
         """將動漫資料格式化為 LLM 可讀的文字"""
@@ -53,14 +62,12 @@ class LLMAnimeSelector:
             
         return formatted_text
     
-    def call_llm(self, user_description: str, anime_list: List[Dict], count: int) -> tuple[List[int], List[str]]:
-        """呼叫 OpenAI API 選擇最符合的動漫並生成推薦理由"""
-        
+    def build_prompt(self, user_description: str, anime_list: List[Dict], count: int) -> str:
+        """構建選擇動漫的提示詞"""
         # 格式化動漫資料
         anime_text = self.format_anime_for_llm(anime_list)
         
-        # 構建提示詞
-        prompt = f"""用戶描述：{user_description}
+        return f"""用戶描述：{user_description}
 
 {anime_text}
 
@@ -83,37 +90,72 @@ class LLMAnimeSelector:
 如果候選動漫數量少於 {count} 部，請返回所有候選動漫的編號和理由。
 """
 
+    def call_llm(self, user_description: str, anime_list: List[Dict], count: int) -> tuple[List[int], List[str]]:
+        """呼叫 OpenAI API 選擇最符合的動漫並生成推薦理由"""
+        
+        # 構建提示詞
+        prompt = self.build_prompt(user_description, anime_list, count)
+
         try:
             print(f"呼叫 OpenAI API")
             print(f"使用模型: {self.model}")
             print(f"提示詞預覽: {prompt[:200]}...")
             
             # 發送請求到 OpenAI
-            response = self.openai_client.chat.completions.create(
+            messages = [
+                {
+                    "role": "user", 
+                    "content": prompt
+                }
+            ]
+            llm_response = llm_cache.cached_completion(
+                self.model, messages, 0.3,
+                lambda: record_usage(self.openai_client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=0.3,
+                    max_tokens=300,
+                    timeout=60
+                )).choices[0].message.content,
+                extra={"max_tokens": 300}
+            ).strip()
+            print(f"OpenAI 完整回應：{llm_response}")
+            
+            # 解析 OpenAI 回應
+            selected_indices, reasons = self.parse_llm_response_with_reasons(llm_response, len(anime_list))
+            print(f"解析結果 - 索引: {selected_indices}, 理由: {reasons}")
+            return selected_indices, reasons
+                
+        except Exception as e:
+            print(f"呼叫 OpenAI API 時發生錯誤: {str(e)}")
+            return self.fallback_selection(anime_list, count), []
+    
+    async def acall_llm(self, user_description: str, anime_list: List[Dict], count: int) -> tuple[List[int], List[str]]:
+        """非同步版的 call_llm（AsyncOpenAI，等待回應時不佔用執行緒）"""
+        messages = [{"role": "user", "content": self.build_prompt(user_description, anime_list, count)}]
+
+        async def create():
+            response = await self.async_openai_client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {
-                        "role": "user", 
-                        "content": prompt
-                    }
-                ],
+                messages=messages,
                 temperature=0.3,
                 max_tokens=300,
                 timeout=60
             )
-            
-            llm_response = response.choices[0].message.content.strip()
+            return record_usage(response).choices[0].message.content
+
+        try:
+            print(f"非同步呼叫 OpenAI API（模型: {self.model}）")
+            llm_response = (await llm_cache.acached_completion(
+                self.model, messages, 0.3, create, extra={"max_tokens": 300})).strip()
             print(f"OpenAI 完整回應：{llm_response}")
-            
-            # 解析 OpenAI 回應
             selected_indices, reasons = self.parse_llm_response_with_reasons(llm_response, len(anime_list))
             print(f"解析結果 - 索引: {selected_indices}, 理由: {reasons}")
             return selected_indices, reasons
-                
         except Exception as e:
             print(f"呼叫 OpenAI API 時發生錯誤: {str(e)}")
             return self.fallback_selection(anime_list, count), []
-    
+
     def parse_llm_response_with_reasons(self, response: str, max_index: int) -> tuple[List[int], List[str]]:
         """解析 LLM 回應，提取動漫編號和推薦理由"""
         try:
@@ -161,6 +203,20 @@ class LLMAnimeSelector:
             print(f"解析 LLM 回應時發生錯誤: {str(e)}")
             return [0], ["為您精心挑選的優質作品"]
     
+    def parse_reason_line(self, line: str, max_index: int) -> Optional[Tuple[int, str]]:
+        """解析單行「編號:理由」，返回 (0-based 索引, 理由)；格式不符或超出範圍時返回 None"""
+        line = line.strip().replace('：', ':')
+        if ':' not in line:
+            return None
+        num_str, reason = line.split(':', 1)
+        try:
+            num = int(num_str.strip())
+        except ValueError:
+            return None
+        if not 1 <= num <= max_index:
+            return None
+        return num - 1, reason.strip()
+
     def parse_llm_response(self, response: str, max_index: int) -> List[int]:
         """解析 LLM 回應，提取動漫編號"""
         try:
@@ -214,10 +270,48 @@ class LLMAnimeSelector:
             default_reasons = ["為您精心挑選的優質作品"] * len(anime_list)
             return anime_list, default_reasons
         
+        return self._select_flight.do(
+            self.selection_key(user_description, anime_list, count),
+            lambda: self._select_anime(user_description, anime_list, count))
+
+    def _select_anime(self, user_description: str, anime_list: List[Dict], count: int) -> tuple[List[Dict], List[str]]:
         print(f"從 {len(anime_list)} 部候選動漫中選擇 {count} 部")
         
         # 使用 LLM 選擇
         selected_indices, reasons = self.call_llm(user_description, anime_list, count)
+        return self.assemble_selection(anime_list, count, selected_indices, reasons)
+
+    async def aselect_anime(self, user_description: str, anime_list: List[Dict], count: int) -> tuple[List[Dict], List[str]]:
+        """非同步版的 select_anime（ASGI 服務使用）"""
+        if not anime_list:
+            return [], []
+        
+        # 如果候選動漫數量不超過需求數量，直接返回全部
+        if len(anime_list) <= count:
+            default_reasons = ["為您精心挑選的優質作品"] * len(anime_list)
+            return anime_list, default_reasons
+        
+        async def select():
+            print(f"從 {len(anime_list)} 部候選動漫中選擇 {count} 部")
+            selected_indices, reasons = await self.acall_llm(user_description, anime_list, count)
+            return self.assemble_selection(anime_list, count, selected_indices, reasons)
+
+        return await self._async_select_flight.do(self.selection_key(user_description, anime_list, count), select)
+
+    def flight_stats(self) -> Dict[str, Any]:
+        """選擇請求合併統計"""
+        return {"select_anime": self._select_flight.stats(),
+                "aselect_anime": self._async_select_flight.stats()}
+
+    @staticmethod
+    def selection_key(user_description: str, anime_list: List[Dict], count: int) -> tuple:
+        """請求合併的鍵：正規化描述、候選動漫（依 id 與順序）、數量"""
+        candidates = tuple(anime.get('id', anime.get('title')) for anime in anime_list)
+        return " ".join((user_description or "").split()), candidates, count
+
+    def assemble_selection(self, anime_list: List[Dict], count: int, selected_indices: List[int],
+                           reasons: List[str]) -> tuple[List[Dict], List[str]]:
+        """依 LLM 選出的索引整理結果，不足 count 部時以評分高的補足"""
         
         # 根據索引提取選中的動漫
         selected_anime = []
@@ -254,6 +348,150 @@ class LLMAnimeSelector:
         print(f"最終選擇了 {len(selected_anime)} 部動漫")
         return selected_anime, final_reasons
 
+    def stream_select_anime(self, user_description: str, anime_list: List[Dict],
+                            count: int) -> Iterator[Tuple[Dict, str]]:
+        """
+        串流版的 select_anime：LLM 每完成一行「編號:理由」就立即產出一部動漫
+
+        Yields:
+            (動漫資料, 推薦理由)，依 LLM 回覆順序；不足 count 部時以評分高的補足
+        """
+        if not anime_list:
+            return
+
+        # 如果候選動漫數量不超過需求數量，直接返回全部
+        if len(anime_list) <= count:
+            for anime in anime_list:
+                yield anime, "為您精心挑選的優質作品"
+            return
+
+        print(f"從 {len(anime_list)} 部候選動漫中串流選擇 {count} 部")
+        messages = [{"role": "user", "content": self.build_prompt(user_description, anime_list, count)}]
+
+        def create_stream():
+            stream = self.openai_client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=0.3,
+                max_tokens=300,
+                timeout=60,
+                stream=True,
+                # 最後一段附帶 token 用量
+                stream_options={"include_usage": True}
+            )
+            for chunk in stream:
+                record_usage(chunk)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+        selection = StreamingSelection(self, anime_list, count)
+        try:
+            for text in llm_cache.cached_stream(self.model, messages, 0.3, create_stream, extra={"max_tokens": 300}):
+                yield from selection.feed(text)
+            yield from selection.finish()
+        except Exception as e:
+            print(f"串流呼叫 OpenAI API 時發生錯誤: {str(e)}")
+            yield from selection.fallback()
+        yield from selection.top_up()
+
+    async def astream_select_anime(self, user_description: str, anime_list: List[Dict],
+                                   count: int) -> AsyncIterator[Tuple[Dict, str]]:
+        """非同步版的 stream_select_anime（ASGI 服務使用）"""
+        if not anime_list:
+            return
+
+        if len(anime_list) <= count:
+            for anime in anime_list:
+                yield anime, "為您精心挑選的優質作品"
+            return
+
+        print(f"從 {len(anime_list)} 部候選動漫中串流選擇 {count} 部")
+        messages = [{"role": "user", "content": self.build_prompt(user_description, anime_list, count)}]
+
+        async def create_stream():
+            stream = await self.async_openai_client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=0.3,
+                max_tokens=300,
+                timeout=60,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            async for chunk in stream:
+                record_usage(chunk)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+        selection = StreamingSelection(self, anime_list, count)
+        try:
+            async for text in llm_cache.acached_stream(self.model, messages, 0.3, create_stream,
+                                                       extra={"max_tokens": 300}):
+                for item in selection.feed(text):
+                    yield item
+            for item in selection.finish():
+                yield item
+        except Exception as e:
+            print(f"串流呼叫 OpenAI API 時發生錯誤: {str(e)}")
+            for item in selection.fallback():
+                yield item
+        for item in selection.top_up():
+            yield item
+
+
+class StreamingSelection:
+    """串流選擇的解析狀態：累積 LLM 輸出，每完成一行「編號:理由」就產出一部動漫"""
+
+    def __init__(self, selector: 'LLMAnimeSelector', anime_list: List[Dict], count: int):
+        self.selector = selector
+        self.anime_list = anime_list
+        self.count = count
+        self.selected: List[Dict] = []
+        self.selected_indices = set()
+        self.buffer = ""
+
+    def _accept(self, line: str) -> Optional[Tuple[Dict, str]]:
+        parsed = self.selector.parse_reason_line(line, len(self.anime_list))
+        if parsed is None or parsed[0] in self.selected_indices or len(self.selected) >= self.count:
+            return None
+        index, reason = parsed
+        self.selected_indices.add(index)
+        self.selected.append(self.anime_list[index])
+        return self.anime_list[index], reason or "為您精心挑選的優質作品"
+
+    def feed(self, text: str) -> List[Tuple[Dict, str]]:
+        """加入新的輸出片段，返回已完整收到的行所對應的動漫"""
+        self.buffer += text
+        # 只處理已完整收到的行，最後一段留待下個片段
+        *lines, self.buffer = self.buffer.split('\n')
+        return [item for item in map(self._accept, lines) if item is not None]
+
+    def finish(self) -> List[Tuple[Dict, str]]:
+        """串流結束，處理最後一行"""
+        item = self._accept(self.buffer)
+        self.buffer = ""
+        return [item] if item is not None else []
+
+    def fallback(self) -> List[Tuple[Dict, str]]:
+        """LLM 呼叫失敗且尚未產出任何動漫時，改用評分排序"""
+        if self.selected:
+            return []
+        items = []
+        for index in self.selector.fallback_selection(self.anime_list, self.count):
+            self.selected_indices.add(index)
+            self.selected.append(self.anime_list[index])
+            items.append((self.anime_list[index], "為您精心挑選的優質作品"))
+        return items
+
+    def top_up(self) -> List[Tuple[Dict, str]]:
+        """如果選中的數量不足，用評分高的補足"""
+        if len(self.selected) >= self.count:
+            return []
+        selected_ids = {anime.get('id') for anime in self.selected}
+        remaining_anime = [anime for anime in self.anime_list if anime.get('id') not in selected_ids]
+        remaining_anime.sort(key=lambda x: x.get('total_score', x.get('rating', 0)), reverse=True)
+        return [(anime, "高評分優質作品推薦") for anime in remaining_anime[:self.count - len(self.selected)]]
+
 def create_llm_selector() -> LLMAnimeSelector:
     """創建 LLM 動漫選擇器實例"""
     return LLMAnimeSelector()
@@ -0,0 +1,249 @@
+"""
+LLM 回應快取
+以「模型 + 訊息 + 溫度」的雜湊作為鍵，將 LLM 回應保存在 SQLite 中，跨請求、跨程序重複使用
+
+功能:
+1. 內容定址 - 相同的提示詞（例如個人化推薦按鈕、內含相同類別列表的分類提示詞）只需付費呼叫一次
+2. TTL - 超過存活時間的回應視為過期並重新呼叫
+3. LRU 容量上限 - 超過筆數上限時淘汰最久未使用的回應
+4. 命中統計 - hits / misses 計數，可透過 /api/llm-cache/stats 查看省下的呼叫次數
+
+使用方式:
+    from utils.llm_cache import llm_cache
+    text = llm_cache.cached_completion(
+        model, messages, temperature,
+        lambda: client.chat.completions.create(...).choices[0].message.content
+    )
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional
+
+from config import LLM_CACHE_ENABLED, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_PATH, LLM_CACHE_TTL
+from utils.database.connection import get_connection
+from utils.metrics import record_cache
+
+
+class LLMResponseCache:
+    """SQLite 儲存的 LLM 回應快取（TTL + LRU 上限）"""
+
+    def __init__(self, db_path: str = LLM_CACHE_PATH, ttl_seconds: float = LLM_CACHE_TTL,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES, enabled: bool = LLM_CACHE_ENABLED):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _conn(self):
+        """取得目前執行緒的快取連線（第一次使用時才建立資料表）"""
+        conn = get_connection(self.db_path)
+        if not self._initialized:
+            with self._lock:
+                if not self._initialized:
+                    with conn:
+                        conn.execute("""
+                            CREATE TABLE IF NOT EXISTS llm_cache (
+                                key TEXT PRIMARY KEY,
+                                model TEXT,
+                                response TEXT NOT NULL,
+                                created_at REAL NOT NULL,
+                                last_access REAL NOT NULL
+                            ) WITHOUT ROWID
+                        """)
+                        conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access)")
+                    self._initialized = True
+        return conn
+
+    @staticmethod
+    def make_key(model: Optional[str], messages: List[Dict[str, Any]], temperature: Optional[float],
+                 extra: Optional[Dict[str, Any]] = None) -> str:
+        """
+        計算快取鍵
+
+        Args:
+            model: 模型名稱
+            messages: 訊息列表
+            temperature: 溫度（未指定時為 None）
+            extra: 其他會影響輸出的參數（例如 max_tokens、response_format）
+        """
+        payload = {"model": model, "messages": messages, "temperature": temperature}
+        if extra:
+            payload["extra"] = extra
+        raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """讀取未過期的回應（命中時更新最後使用時間）"""
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute("SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if self.ttl_seconds and now - row[1] > self.ttl_seconds:
+            with conn:
+                conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            return None
+        with conn:
+            conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def set(self, key: str, model: Optional[str], response: str) -> None:
+        """寫入回應，超過筆數上限時淘汰最久未使用者"""
+        conn = self._conn()
+        now = time.time()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, response, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now)
+            )
+            if self.max_entries:
+                conn.execute("""
+                    DELETE FROM llm_cache WHERE key IN (
+                        SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                    )
+                """, (self.max_entries,))
+
+    def _lookup(self, key: str, model: Optional[str]) -> Optional[str]:
+        """讀取快取並更新命中統計（快取讀取失敗視為未命中）"""
+        try:
+            cached = self.get(key)
+        except Exception as e:
+            print(f"讀取 LLM 快取失敗: {str(e)}")
+            cached = None
+        with self._lock:
+            if cached is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        record_cache("llm", cached is not None)
+        if cached is not None:
+            print(f"LLM 快取命中（{model}）")
+        return cached
+
+    def _store(self, key: str, model: Optional[str], response: Optional[str]) -> None:
+        """寫入快取（空回應不寫入，寫入失敗只印出訊息）"""
+        if not response:
+            return
+        try:
+            self.set(key, model, response)
+        except Exception as e:
+            print(f"寫入 LLM 快取失敗: {str(e)}")
+
+    def cached_completion(self, model: Optional[str], messages: List[Dict[str, Any]],
+                          temperature: Optional[float], create: Callable[[], str],
+                          extra: Optional[Dict[str, Any]] = None) -> str:
+        """
+        先查快取，未命中時呼叫 create() 取得回應並寫入快取
+
+        create() 拋出的例外會直接往外傳遞（不會快取失敗結果）；空回應不寫入快取。
+        快取本身讀寫失敗時只印出訊息，不影響 LLM 呼叫。
+        """
+        if not self.enabled:
+            return create()
+
+        key = self.make_key(model, messages, temperature, extra)
+        cached = self._lookup(key, model)
+        if cached is not None:
+            return cached
+        response = create()
+        self._store(key, model, response)
+        return response
+
+    def cached_stream(self, model: Optional[str], messages: List[Dict[str, Any]],
+                      temperature: Optional[float], create_stream: Callable[[], Iterator[str]],
+                      extra: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+        """
+        串流版的 cached_completion：命中時一次產出完整回應，未命中時逐段產出並在結束後寫入快取
+
+        create_stream() 需返回逐段文字的迭代器；串流中途失敗時不寫入快取。
+        """
+        if not self.enabled:
+            yield from create_stream()
+            return
+
+        key = self.make_key(model, messages, temperature, extra)
+        cached = self._lookup(key, model)
+        if cached is not None:
+            yield cached
+            return
+        parts = []
+        for chunk in create_stream():
+            parts.append(chunk)
+            yield chunk
+        self._store(key, model, ''.join(parts))
+
+    async def acached_completion(self, model: Optional[str], messages: List[Dict[str, Any]],
+                                 temperature: Optional[float], create: Callable[[], Awaitable[str]],
+                                 extra: Optional[Dict[str, Any]] = None) -> str:
+        """非同步版的 cached_completion（create 為 coroutine function，快取讀寫在執行緒中進行）"""
+        if not self.enabled:
+            return await create()
+
+        key = self.make_key(model, messages, temperature, extra)
+        cached = await asyncio.to_thread(self._lookup, key, model)
+        if cached is not None:
+            return cached
+        response = await create()
+        await asyncio.to_thread(self._store, key, model, response)
+        return response
+
+    async def acached_stream(self, model: Optional[str], messages: List[Dict[str, Any]],
+                             temperature: Optional[float], create_stream: Callable[[], AsyncIterator[str]],
+                             extra: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """非同步版的 cached_stream（create_stream 返回 async iterator）"""
+        if not self.enabled:
+            async for chunk in create_stream():
+                yield chunk
+            return
+
+        key = self.make_key(model, messages, temperature, extra)
+        cached = await asyncio.to_thread(self._lookup, key, model)
+        if cached is not None:
+            yield cached
+            return
+        parts = []
+        async for chunk in create_stream():
+            parts.append(chunk)
+            yield chunk
+        await asyncio.to_thread(self._store, key, model, ''.join(parts))
+
+    def clear(self) -> None:
+        """清空快取與統計"""
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM llm_cache")
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """命中統計（hits 即為省下的付費呼叫次數）"""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        try:
+            entries = self._conn().execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        except Exception:
+            entries = None
+        total = hits + misses
+        return {
+            "enabled": self.enabled,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+
+# 預設快取實例（專案根目錄下的 llm_cache.db）
+llm_cache = LLMResponseCache()
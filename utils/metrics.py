@@ -0,0 +1,342 @@
+"""
+推薦請求各階段統計
+依階段（classify、extract、db_query、llm_select、format）記錄耗時、LLM token 數與快取命中，
+保存在程序內的直方圖 / 計數器，並以 Prometheus 文字格式輸出（/metrics）
+
+功能:
+1. 階段 span - with stage_span("extract"): ... 記錄耗時（串流時以 segmented_span 只累計產生結果的時間）；span 內的 LLM 呼叫以 record_usage() / record_cache()
+   將 token 數與快取命中記在目前的 span 上（以 contextvars 傳遞，不需層層傳參數）
+2. 請求追蹤 - request_trace() 收集同一請求的所有 span，結束時印出一行摘要，並可產生 Server-Timing 標頭
+   （asyncio.to_thread 會複製 context；自行使用執行緒池時以 contextvars.copy_context().run 提交）
+3. 直方圖登錄 - MetricsRegistry 保存直方圖與計數器（執行緒安全），render() 輸出 Prometheus text format 0.0.4
+
+使用方式:
+    with request_trace("recommend") as trace:
+        with stage_span("db_query"):
+            rows = query(...)
+    response.headers["Server-Timing"] = trace.server_timing()
+    registry.render()   # /metrics 回應內容
+"""
+
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from config import METRICS_ENABLED
+
+# 延遲直方圖的 bucket 上限（秒）：資料庫查詢在毫秒級，LLM 呼叫常見 1~10 秒
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Prometheus text format 的 Content-Type
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(pairs: Sequence[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_label(str(value))}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    """具名、帶標籤的指標（子類別實作 render）"""
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} 需要標籤 {self.labelnames}，收到 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """單調遞增的計數器"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(list(zip(self.labelnames, key)))} {_format_value(value)}"
+            for key, value in values
+        ]
+
+
+class Histogram(_Metric):
+    """固定 bucket 的直方圖（累積計數、總和、次數）"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # 標籤 -> [各 bucket 計數（非累積）, 總和, 次數]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            snapshot = sorted((key, (list(series[0]), series[1], series[2])) for key, series in self._series.items())
+        lines = self.header()
+        for key, (counts, total, count) in snapshot:
+            pairs = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(pairs + [('le', _format_value(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(pairs)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(pairs)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """程序內的指標登錄（同名指標只建立一次）"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"指標 {metric.name} 已以不同的型別或標籤登錄")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Prometheus text format 0.0.4"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# 程序內共用的指標登錄
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    'anime_recommend_stage_seconds', '推薦請求各階段耗時（秒）', ('stage',))
+REQUEST_SECONDS = registry.histogram(
+    'anime_recommend_request_seconds', '推薦請求總耗時（秒）', ('endpoint',))
+LLM_TOKENS = registry.counter(
+    'anime_llm_tokens_total', '各階段 LLM 呼叫使用的 token 數（快取命中不計）', ('stage', 'kind'))
+CACHE_LOOKUPS = registry.counter(
+    'anime_cache_lookups_total', '各階段的快取查詢次數', ('stage', 'cache', 'result'))
+
+
+class Span:
+    """單一階段的紀錄"""
+
+    __slots__ = ('stage', 'duration', 'prompt_tokens', 'completion_tokens', 'cache_hits', 'cache_misses', '_lock')
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.duration = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._lock = threading.Lock()
+
+    def add_tokens(self, prompt_tokens: int, completion_tokens: int) -> None:
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+        if METRICS_ENABLED:
+            LLM_TOKENS.inc(prompt_tokens, stage=self.stage, kind='prompt')
+            LLM_TOKENS.inc(completion_tokens, stage=self.stage, kind='completion')
+
+    def record_cache(self, cache: str, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+        if METRICS_ENABLED:
+            CACHE_LOOKUPS.inc(stage=self.stage, cache=cache, result='hit' if hit else 'miss')
+
+    def describe(self) -> str:
+        parts = [f"{self.stage}={self.duration:.3f}s"]
+        if self.prompt_tokens or self.completion_tokens:
+            parts.append(f"tokens {self.prompt_tokens}/{self.completion_tokens}")
+        if self.cache_hits or self.cache_misses:
+            parts.append(f"cache {self.cache_hits}/{self.cache_hits + self.cache_misses}")
+        return ' '.join(parts)
+
+
+class RequestTrace:
+    """同一請求的所有 span"""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def summary(self) -> str:
+        with self._lock:
+            spans = list(self.spans)
+        return '｜'.join(span.describe() for span in spans) or '（無階段紀錄）'
+
+    def server_timing(self) -> str:
+        """Server-Timing 標頭（瀏覽器開發者工具可直接顯示各階段耗時）"""
+        with self._lock:
+            spans = list(self.spans)
+        return ', '.join(f"{span.stage};dur={span.duration * 1000:.1f}" for span in spans)
+
+
+_current_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar('request_trace', default=None)
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar('stage_span', default=None)
+
+
+@contextmanager
+def request_trace(endpoint: str) -> Iterator[RequestTrace]:
+    """追蹤一個請求：記錄總耗時，結束時印出各階段摘要"""
+    trace = RequestTrace(endpoint)
+    token = _current_trace.set(trace)
+    start_time = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        duration = time.perf_counter() - start_time
+        _current_trace.reset(token)
+        if METRICS_ENABLED:
+            REQUEST_SECONDS.observe(duration, endpoint=endpoint)
+            print(f"[{endpoint}] 總耗時 {duration:.3f} 秒｜{trace.summary()}")
+
+
+def _finish_span(span: Span) -> None:
+    """將結束的階段記入直方圖與目前的請求追蹤"""
+    if METRICS_ENABLED:
+        STAGE_SECONDS.observe(span.duration, stage=span.stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(span)
+
+
+@contextmanager
+def stage_span(stage: str) -> Iterator[Span]:
+    """記錄一個階段的耗時（例外時仍會記錄）"""
+    span = Span(stage)
+    token = _current_span.set(span)
+    start_time = time.perf_counter()
+    try:
+        yield span
+    finally:
+        span.duration = time.perf_counter() - start_time
+        _current_span.reset(token)
+        _finish_span(span)
+
+
+class SegmentedSpan:
+    """分段計時的階段：只累計 segment() 內的耗時（串流時不計入等待客戶端讀取的時間）"""
+
+    def __init__(self, stage: str):
+        self.span = Span(stage)
+
+    @contextmanager
+    def segment(self) -> Iterator[Span]:
+        """計時一段；段內的 LLM 呼叫 token 與快取命中記在此階段"""
+        token = _current_span.set(self.span)
+        start_time = time.perf_counter()
+        try:
+            yield self.span
+        finally:
+            self.span.duration += time.perf_counter() - start_time
+            _current_span.reset(token)
+
+
+@contextmanager
+def segmented_span(stage: str) -> Iterator[SegmentedSpan]:
+    """
+    分段計時的階段，結束時以各段總和記錄一次（例外時仍會記錄）
+
+    使用方式:
+        with segmented_span("llm_select") as select:
+            for ...:
+                with select.segment():
+                    item = next(iterator)
+                yield item   # 不計時
+    """
+    segmented = SegmentedSpan(stage)
+    try:
+        yield segmented
+    finally:
+        _finish_span(segmented.span)
+
+
+def record_usage(response):
+    """將 OpenAI 回應（或串流最後一段）的 token 用量記在目前的 span 上；返回原物件以便串接"""
+    usage = getattr(response, 'usage', None)
+    span = _current_span.get()
+    if usage is not None and span is not None:
+        span.add_tokens(getattr(usage, 'prompt_tokens', 0) or 0, getattr(usage, 'completion_tokens', 0) or 0)
+    return response
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """將快取命中 / 未命中記在目前的 span 上（不在任何 span 內時不記錄）"""
+    span = _current_span.get()
+    if span is not None:
+        span.record_cache(cache, hit)
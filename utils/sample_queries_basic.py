@@ -7,8 +7,8 @@ import sys
 import os
 from typing import List
 
-# 引入資料庫模組
-from utils.database.anime_queries import create_anime_db
+# 引入共用服務（AnimeDatabase 只建立一次，索引跨呼叫保留）
+from utils.services import services
 
 def basic_title_search(query_title: str = "", season: str | None = None):
     """基本標題查詢範例
@@ -19,7 +19,7 @@ def basic_title_search(query_title: str = "", season: str | None = None):
     """
     print("=== 基本標題查詢 ===")
 
-    db = create_anime_db("anime_database.db")
+    db = services.get_anime_db()
 
     # 查詢 (若 season 為 None 則不限制季度)
     results = db.query_anime_by_title(query_title, season=season)
@@ -45,7 +45,7 @@ def basic_tag_search(tags: List[str] | None = None, season: str | None = None):
     """
     print("=== 基本標籤查詢 ===")
 
-    db = create_anime_db("anime_database.db")
+    db = services.get_anime_db()
 
     # 基本查詢 (需用關鍵字參數 season=season，避免被當成 limit )
     results = db.query_anime_by_tags(tags or [], season=season)
@@ -67,7 +67,7 @@ def recommend_similar_anime(anime_name: str, limit: int = 10, season: str | None
     """相似動漫推薦範例"""
     print(f"=== 推薦與「{anime_name}」相似的動漫 ===")
     
-    db = create_anime_db("anime_database.db")
+    db = services.get_anime_db()
 
     results = db.recommend_similar_anime(anime_name, limit=limit, season=season)
     
@@ -76,6 +76,19 @@ def recommend_similar_anime(anime_name: str, limit: int = 10, season: str | None
     
     return results
 
+def semantic_search(query: str, limit: int = 10, season: str | None = None):
+    """自由描述查詢範例（本地向量索引，不需外部服務）"""
+    print(f"=== 描述查詢「{query}」 ===")
+
+    db = services.get_anime_db()
+
+    results = db.query_anime_by_text(query, limit=limit, season=season)
+
+    for anime in results:
+        print(anime['title'], f"{anime['similarity_score']:.3f}")
+
+    return results
+
 ## 原本的 season_search 功能已整合進 basic_title_search / basic_tag_search，故移除。
 
 # def custom_parameters():
@@ -0,0 +1,152 @@
+"""
+輸入分類語意快取
+將用戶描述向量化後保存分類結果，相似的描述（cosine 相似度達門檻）直接重用，不再呼叫 LLM
+
+功能:
+1. 雜湊 n-gram 向量 - 使用 HashingNgramVectorizer，不需額外模型
+2. 向量化比對 - 所有快取向量存放在預先配置的 float32 矩陣，一次矩陣乘法找出最相似者
+3. 淘汰機制 - TTL 過期與 LRU（達筆數上限時覆蓋最久未使用的位置）
+4. 命中統計 - hits / misses 計數
+
+正規化後完全相同的輸入直接命中（不經相似度與 validate 檢查）。
+
+注意：快取的是分類結果（類型、動漫名稱、類別），推薦結果仍在每次請求時依資料庫查詢。
+"""
+
+import copy
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from config import SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_MAX_ENTRIES, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_TTL
+from utils.text_vectorizer import HashingNgramVectorizer
+
+
+class SemanticCache:
+    """以 cosine 相似度查詢的記憶體快取"""
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD, max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = SEMANTIC_CACHE_TTL, enabled: bool = SEMANTIC_CACHE_ENABLED,
+                 vectorizer: Optional[HashingNgramVectorizer] = None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self.vectorizer = vectorizer or HashingNgramVectorizer()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((max_entries, self.vectorizer.dimensions), dtype=np.float32)
+        self._texts: List[Optional[str]] = [None] * max_entries
+        self._values: List[Any] = [None] * max_entries
+        self._created_at = np.zeros(max_entries, dtype=np.float64)
+        self._last_access = np.zeros(max_entries, dtype=np.float64)
+        self._used = np.zeros(max_entries, dtype=bool)
+        # 正規化後的文字 -> 位置（完全相同的輸入不重複佔用位置）
+        self._slots: Dict[str, int] = {}
+
+    def lookup(self, text: str, validate: Optional[Callable[[Any], bool]] = None) -> Optional[Any]:
+        """
+        查詢最相似的快取項目
+
+        Args:
+            text: 用戶描述
+            validate: 額外檢查（返回 False 時視為未命中）
+
+        Returns:
+            快取值的副本；未命中時返回 None
+        """
+        if not self.enabled:
+            return None
+        query = self.vectorizer.transform_one(text)
+        now = time.time()
+        with self._lock:
+            if self.ttl_seconds:
+                self._expire(now)
+            if not self._used.any() or not query.any():
+                self.misses += 1
+                return None
+            slot = self._slots.get(self.vectorizer.normalize(text))
+            if slot is not None:
+                self._last_access[slot] = now
+                self.hits += 1
+                return copy.deepcopy(self._values[slot])
+            scores = self._vectors @ query
+            scores[~self._used] = -1.0
+            slot = int(np.argmax(scores))
+            value = self._values[slot]
+            if scores[slot] < self.threshold or (validate is not None and not validate(value)):
+                self.misses += 1
+                return None
+            self._last_access[slot] = now
+            self.hits += 1
+            print(f"語意快取相似度 {scores[slot]:.3f}：「{self._texts[slot]}」")
+            return copy.deepcopy(value)
+
+    def add(self, text: str, value: Any) -> None:
+        """加入快取項目（已滿時覆蓋最久未使用的位置）"""
+        if not self.enabled:
+            return
+        vector = self.vectorizer.transform_one(text)
+        if not vector.any():
+            return
+        key = self.vectorizer.normalize(text)
+        now = time.time()
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                free = np.flatnonzero(~self._used)
+                slot = int(free[0]) if free.size else int(np.argmin(self._last_access))
+                old_text = self._texts[slot]
+                if old_text is not None:
+                    self._slots.pop(self.vectorizer.normalize(old_text), None)
+                self._slots[key] = slot
+            self._vectors[slot] = vector
+            self._texts[slot] = text
+            self._values[slot] = copy.deepcopy(value)
+            self._created_at[slot] = now
+            self._last_access[slot] = now
+            self._used[slot] = True
+
+    def _expire(self, now: float) -> None:
+        """移除超過 TTL 的項目（需持有鎖）"""
+        expired = np.flatnonzero(self._used & (now - self._created_at > self.ttl_seconds))
+        for slot in expired:
+            self._discard(int(slot))
+
+    def _discard(self, slot: int) -> None:
+        text = self._texts[slot]
+        if text is not None:
+            self._slots.pop(self.vectorizer.normalize(text), None)
+        self._texts[slot] = None
+        self._values[slot] = None
+        self._used[slot] = False
+        self._last_access[slot] = 0.0
+
+    def clear(self) -> None:
+        """清空快取與統計"""
+        with self._lock:
+            for slot in range(self.max_entries):
+                self._discard(slot)
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """命中統計"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": int(self._used.sum()),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+            }
+
+
+# 輸入分類共用的語意快取
+semantic_cache = SemanticCache()
@@ -0,0 +1,96 @@
+"""
+應用程式共用服務
+在程序內只建立一次 AnimeDatabase 與 LLMAnimeSelector，供每個請求重複使用
+
+功能:
+1. 長壽命實例 - 記憶體中的標題 / 標籤索引與 OpenAI 客戶端的 HTTP keep-alive 連線可跨請求保留
+2. 延遲建立 - 第一次取用時才建立，建立過程以鎖保護，多執行緒下也只會建立一次
+3. 啟動暖機 - 服務啟動時呼叫 warm_up()（api.py 的 __main__、asgi_app 的 lifespan），第一個請求不必等待索引建立
+4. 變更後重建 - 訂閱目錄版本，anime 表內容改變（例如匯入新的 CSV）時在背景執行緒重建索引
+
+使用方式:
+    from utils.services import services
+    db = services.get_anime_db()
+    selector = services.get_llm_selector()
+"""
+
+import os
+import threading
+from typing import Optional
+
+from utils.database.anime_queries import AnimeDatabase, create_anime_db
+from utils.database.catalog_version import CatalogVersions, catalog_watcher, read_content_version
+
+# 專案根目錄下的資料庫（使用絕對路徑，不受工作目錄影響）
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'anime_database.db')
+
+
+class ServiceContainer:
+    """程序層級的共用服務容器"""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._anime_db: Optional[AnimeDatabase] = None
+        self._llm_selector = None
+        self._unsubscribe = None
+        # 背景重建索引時持有，避免同時執行多次
+        self._refresh_lock = threading.Lock()
+        # 重建期間又有內容變更時設定，重建結束後再執行一次
+        self._refresh_pending = threading.Event()
+
+    def get_anime_db(self) -> AnimeDatabase:
+        """取得共用的 AnimeDatabase（含記憶體索引）"""
+        if self._anime_db is None:
+            with self._lock:
+                if self._anime_db is None:
+                    self._anime_db = create_anime_db(self.db_path)
+        return self._anime_db
+
+    def get_llm_selector(self):
+        """取得共用的 LLMAnimeSelector（重用同一個 OpenAI 客戶端與連線池）"""
+        if self._llm_selector is None:
+            with self._lock:
+                if self._llm_selector is None:
+                    # 延遲匯入：只用到資料庫的程式不需要 OPENAI_API_KEY
+                    from utils.llm_anime_selector import create_llm_selector
+                    self._llm_selector = create_llm_selector()
+        return self._llm_selector
+
+    def warm_up(self) -> None:
+        """建立所有服務並預先載入資料庫索引（服務啟動時呼叫）"""
+        self.get_anime_db().refresh_indexes()
+        self.get_llm_selector()
+        if self._unsubscribe is None:
+            self._unsubscribe = catalog_watcher.subscribe(self._on_catalog_change, content_only=True)
+
+    def _on_catalog_change(self, versions: CatalogVersions) -> None:
+        """anime 表內容改變後在背景重建索引，下一個查詢不必等待重建（相似動漫表只在這裡與匯入時重建）"""
+        self._refresh_pending.set()
+        if not self._refresh_lock.acquire(blocking=False):
+            # 已有重建在執行；結束後會依 _refresh_pending 再重建一次
+            return
+
+        def refresh() -> None:
+            while True:
+                try:
+                    while self._refresh_pending.is_set():
+                        self._refresh_pending.clear()
+                        try:
+                            anime_db = self.get_anime_db()
+                            version = read_content_version(anime_db.get_connection())
+                            print(f"目錄內容版本 {version}：背景重建索引")
+                            anime_db.refresh_indexes()
+                        except Exception as e:
+                            print(f"背景重建索引失敗: {str(e)}")
+                finally:
+                    self._refresh_lock.release()
+                # 離開迴圈到釋放鎖之間到達的變更：其通知取鎖失敗已返回，由這裡接手
+                if not (self._refresh_pending.is_set() and self._refresh_lock.acquire(blocking=False)):
+                    return
+
+        threading.Thread(target=refresh, name="catalog-refresh", daemon=True).start()
+
+
+# 預設服務容器
+services = ServiceContainer()
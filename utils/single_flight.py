@@ -0,0 +1,163 @@
+"""
+請求合併（single-flight）
+相同鍵的請求同時進行時，只有第一個真正執行計算，其餘請求等待並共用同一份結果
+
+功能:
+1. 執行緒版 SingleFlight - Flask（多執行緒）使用，等待者以 threading.Event 阻塞
+2. 非同步版 AsyncSingleFlight - ASGI 服務使用，計算在獨立的 Task 中執行，一個客戶端斷線不會取消其他等待者
+3. 結果隔離 - 每個呼叫者取得結果的深拷貝，修改結果不會影響其他請求
+4. 例外傳遞 - 計算失敗時所有等待者收到同一個例外；計算結束後立即移除，不會快取失敗或結果
+5. 合併統計 - executed / shared 計數
+
+使用方式:
+    from utils.single_flight import SingleFlight
+    flight = SingleFlight("classify")
+    result = flight.do(key, lambda: expensive_call(...))
+"""
+
+import asyncio
+import copy
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from config import SINGLE_FLIGHT_ENABLED
+
+
+class _Call:
+    """進行中的計算"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+
+
+class SingleFlight:
+    """執行緒版請求合併"""
+
+    def __init__(self, name: str, enabled: bool = SINGLE_FLIGHT_ENABLED):
+        self.name = name
+        self.enabled = enabled
+        self.executed = 0
+        self.shared = 0
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        執行 fn()；相同 key 已有計算進行中時改為等待其結果
+
+        Returns:
+            fn() 結果的深拷貝
+        """
+        if not self.enabled:
+            return fn()
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+            else:
+                self.shared += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.done.set()
+        else:
+            print(f"請求合併（{self.name}）：等待進行中的相同請求")
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        return copy.deepcopy(call.result)
+
+    def stats(self) -> Dict[str, Any]:
+        """合併統計（shared 即為省下的重複計算次數）"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "executed": self.executed,
+                "shared": self.shared,
+                "in_flight": len(self._calls),
+            }
+
+
+class _AsyncCall:
+    """進行中的非同步計算（在獨立的 Task 中執行，等待者以 shield 等待）"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class AsyncSingleFlight:
+    """非同步版請求合併（同一個事件迴圈內使用）"""
+
+    def __init__(self, name: str, enabled: bool = SINGLE_FLIGHT_ENABLED):
+        self.name = name
+        self.enabled = enabled
+        self.executed = 0
+        self.shared = 0
+        self._calls: Dict[Hashable, _AsyncCall] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        await fn()；相同 key 已有計算進行中時改為等待其結果
+
+        fn() 在獨立的 Task 中執行：發起請求的客戶端斷線（被取消）時，其他等待者仍會取得結果；
+        所有等待者都被取消時才取消計算。
+
+        Returns:
+            fn() 結果的深拷貝
+        """
+        if not self.enabled:
+            return await fn()
+
+        call = self._calls.get(key)
+        if call is not None:
+            self.shared += 1
+            print(f"請求合併（{self.name}）：等待進行中的相同請求")
+        else:
+            call = self._calls[key] = _AsyncCall(asyncio.ensure_future(fn()))
+            self.executed += 1
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+
+        call.waiters += 1
+        try:
+            # shield：等待者被取消時不影響其他等待者
+            result = await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if not call.task.done() and call.waiters == 1:
+                # 最後一個等待者也離開了，不再需要結果；先移除，之後的相同請求重新計算
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+        return copy.deepcopy(result)
+
+    def _forget(self, key: Hashable, call: _AsyncCall) -> None:
+        """計算結束後立即移除（不快取結果或失敗）"""
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not call.task.cancelled():
+            # 沒有等待者時避免 "exception was never retrieved" 警告
+            call.task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        """合併統計"""
+        return {
+            "enabled": self.enabled,
+            "executed": self.executed,
+            "shared": self.shared,
+            "in_flight": len(self._calls),
+        }
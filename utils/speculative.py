@@ -0,0 +1,132 @@
+"""
+推測分支執行器
+推測模式同時送出多個 LLM 呼叫、只採用其中一個；未採用的分支放棄後立即釋出名額，不會讓其他請求排隊等待
+
+功能:
+1. 名額限制 - 同時執行中（仍需要）的分支數以 max_workers 限制（分類器依 config.SERVER_CONCURRENCY 計算）
+2. 放棄分支 - abandon() 取消尚未開始的分支；已開始的分支立即釋出名額，結果不再使用
+3. 提早結束 - 分支內以 branch_abandoned() 檢查是否已被放棄（例如重試前），不再送出多餘的 LLM 呼叫
+4. context 傳遞 - 提交時複製目前的 context，分支中的階段紀錄會歸入同一請求
+
+已開始的 LLM 呼叫無法中斷，放棄後在背景執行緒中跑完並丟棄結果；名額只計算仍需要的分支。
+
+使用方式:
+    from utils.speculative import SpeculativeExecutor, branch_abandoned
+    executor = SpeculativeExecutor(max_workers=48, name="classify")
+    branch = executor.submit(extract_anime_name, user_input)
+    branch.abandon()        # 不需要此分支
+    branch.result()         # 需要時等待結果
+"""
+
+import contextvars
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+# 目前執行緒所屬的分支（branch_abandoned() 使用）
+_current_branch: contextvars.ContextVar[Optional["SpeculativeBranch"]] = contextvars.ContextVar(
+    "speculative_branch", default=None)
+
+
+def branch_abandoned() -> bool:
+    """目前的推測分支是否已被放棄（不在推測分支中執行時為 False）"""
+    branch = _current_branch.get()
+    return branch is not None and branch.abandoned.is_set()
+
+
+class SpeculativeBranch:
+    """已提交的推測分支"""
+
+    def __init__(self, executor: "SpeculativeExecutor"):
+        self.future: Future = Future()
+        self.abandoned = threading.Event()
+        self._executor = executor
+        # 是否佔用名額（由 executor 的鎖保護）
+        self._holding = False
+
+    def result(self, timeout: Optional[float] = None) -> Any:
+        """等待分支結果（分支拋出的例外會在此拋出）"""
+        return self.future.result(timeout)
+
+    def abandon(self) -> None:
+        """放棄分支：尚未開始時不再執行；已開始時立即釋出名額"""
+        if self.abandoned.is_set():
+            return
+        self.abandoned.set()
+        self.future.cancel()
+        self._executor._release(self)
+
+
+class SpeculativeExecutor:
+    """以名額限制同時執行的推測分支（每個分支一個背景執行緒）"""
+
+    def __init__(self, max_workers: int, name: str = "speculative"):
+        self.max_workers = max(1, max_workers)
+        self.name = name
+        self.executed = 0
+        self.abandoned = 0
+        self._active = 0
+        self._condition = threading.Condition()
+
+    def submit(self, fn: Callable[..., Any], *args) -> SpeculativeBranch:
+        """提交分支（複製目前的 context）；名額用完時分支在背景等待，不阻塞呼叫端"""
+        branch = SpeculativeBranch(self)
+        context = contextvars.copy_context()
+        threading.Thread(target=self._run, args=(branch, context, fn, args),
+                         name=f"{self.name}-branch", daemon=True).start()
+        return branch
+
+    def _acquire(self, branch: SpeculativeBranch) -> bool:
+        """取得名額；等待期間被放棄時返回 False"""
+        with self._condition:
+            while self._active >= self.max_workers and not branch.abandoned.is_set():
+                self._condition.wait()
+            if branch.abandoned.is_set():
+                return False
+            self._active += 1
+            branch._holding = True
+            return True
+
+    def _release(self, branch: SpeculativeBranch) -> None:
+        with self._condition:
+            if branch.abandoned.is_set():
+                self.abandoned += 1
+            if branch._holding:
+                branch._holding = False
+                self._active -= 1
+            # 喚醒等待名額的分支（也包括剛被放棄、需要結束等待的分支）
+            self._condition.notify_all()
+
+    def _run(self, branch: SpeculativeBranch, context: contextvars.Context,
+             fn: Callable[..., Any], args: tuple) -> None:
+        if not self._acquire(branch):
+            return
+        try:
+            if not branch.future.set_running_or_notify_cancel():
+                return
+            with self._condition:
+                self.executed += 1
+            try:
+                result = context.run(self._call, branch, fn, args)
+            except BaseException as e:
+                branch.future.set_exception(e)
+            else:
+                branch.future.set_result(result)
+        finally:
+            if not branch.abandoned.is_set():
+                self._release(branch)
+
+    @staticmethod
+    def _call(branch: SpeculativeBranch, fn: Callable[..., Any], args: tuple) -> Any:
+        _current_branch.set(branch)
+        return fn(*args)
+
+    def stats(self) -> Dict[str, Any]:
+        """分支統計（abandoned 為未採用的分支數）"""
+        with self._condition:
+            return {
+                "max_workers": self.max_workers,
+                "active": self._active,
+                "executed": self.executed,
+                "abandoned": self.abandoned,
+            }
@@ -0,0 +1,67 @@
+"""
+雜湊字元 n-gram 向量化
+不需訓練、不需外部模型，將任意中英文字串轉為固定維度的 L2 正規化 float32 向量
+
+功能:
+1. 字元 n-gram - 中文以單字 / 雙字詞為主要特徵，英文以 2~3 字元片段涵蓋詞形變化
+2. 雜湊技巧 - 以 crc32 將 n-gram 映射到固定維度，不需保存詞彙表；跨程序結果一致，可存檔重用
+3. 批次轉換 - 一次返回 (N, dim) 矩陣，向量內積即為 cosine 相似度
+"""
+
+import re
+import zlib
+from typing import Iterable, Tuple
+
+import numpy as np
+
+# 預設向量維度
+DEFAULT_DIMENSIONS = 4096
+# 預設 n-gram 長度範圍（含）
+DEFAULT_NGRAM_RANGE = (1, 3)
+
+# 空白與常見標點（不列入特徵）
+_SEPARATOR_PATTERN = re.compile(r'[\s\.,!?;:，。！？、；：「」『』（）()【】\[\]"\'~～…·\-_/]+')
+
+
+class HashingNgramVectorizer:
+    """以雜湊字元 n-gram 計算文字向量（詞頻取 log，再做 L2 正規化）"""
+
+    def __init__(self, dimensions: int = DEFAULT_DIMENSIONS,
+                 ngram_range: Tuple[int, int] = DEFAULT_NGRAM_RANGE):
+        self.dimensions = dimensions
+        self.ngram_range = ngram_range
+
+    def normalize(self, text: str) -> str:
+        """轉小寫並移除空白與標點"""
+        return _SEPARATOR_PATTERN.sub('', (text or '').lower())
+
+    def _bucket(self, gram: str) -> int:
+        return zlib.crc32(gram.encode('utf-8')) % self.dimensions
+
+    def transform_one(self, text: str, l2_normalize: bool = True) -> np.ndarray:
+        """
+        將單一字串轉為向量（空字串返回零向量）
+
+        Args:
+            l2_normalize: 是否做 L2 正規化；需要另外套用 IDF 權重時設為 False
+        """
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        compact = self.normalize(text)
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            for i in range(len(compact) - n + 1):
+                vector[self._bucket(compact[i:i + n])] += 1.0
+        np.log1p(vector, out=vector)
+        if l2_normalize:
+            norm = float(np.linalg.norm(vector))
+            if norm > 0:
+                vector /= norm
+        return vector
+
+    def transform(self, texts: Iterable[str], l2_normalize: bool = True) -> np.ndarray:
+        """批次轉換，返回 (N, dimensions) 的 float32 矩陣"""
+        texts = list(texts)
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            matrix[row] = self.transform_one(text, l2_normalize)
+        return matrix